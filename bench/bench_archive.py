@@ -0,0 +1,97 @@
+"""
+Tiempo de codificación vs tamaño de los formatos de archivado (`ARCHIVE_FORMAT`).
+
+Uso:
+    python bench/bench_archive.py                    # grabaciones sintéticas (tonos + ruido, 32 kHz)
+    BENCH_DIR=/ruta/wavs python bench/bench_archive.py   # WAV reales (se llevan a 32 kHz mono)
+
+Cada clip pasa por el mismo band-pass que `/finalize_wav` antes de codificarse. Se reporta,
+por formato:
+- ms por clip (codificación en memoria, lo que corre en la tarea de archivado)
+- KB por clip y % del tamaño del WAV de 32 kHz (lo que se subía antes)
+- fidelidad: FLAC se decodifica y se compara bit a bit; los formatos a 16 kHz se vuelven a
+  32 kHz y se mide la SNR contra el audio filtrado original
+"""
+import glob
+import io
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.archive import ARCHIVE_FORMATS, encode_archive, resample_pcm16  # noqa: E402
+from server.filters import bandpass_pcm16  # noqa: E402
+
+SR = 32000
+
+
+def synthetic_clips(n_clips: int = 40, seed: int = 0) -> List[np.ndarray]:
+    """Notas armónicas de 2–5 s con ruido de fondo, como las graba el ESP32."""
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(n_clips):
+        f0 = 440.0 * 2 ** ((rng.integers(40, 80) - 69) / 12)
+        t = np.arange(int(rng.uniform(2.0, 5.0) * SR)) / SR
+        tone = sum((0.5 / k) * np.sin(2 * np.pi * k * f0 * t) for k in range(1, 8) if k * f0 < SR / 2)
+        tone *= np.exp(-t * rng.uniform(0.3, 1.5))
+        y = 8000 * tone + 150 * rng.standard_normal(t.size)
+        clips.append(np.clip(y, -32768, 32767).astype(np.int16))
+    return clips
+
+
+def wav_clips(directory: str, limit: int) -> List[np.ndarray]:
+    import soundfile as sf
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, "**", "*.wav"), recursive=True))[:limit]:
+        y, sr = sf.read(path, dtype="int16", always_2d=True)
+        clips.append(resample_pcm16(y[:, 0], sr, SR))
+    return clips
+
+
+def fidelity(fmt: str, original: np.ndarray, data: bytes) -> str:
+    import soundfile as sf
+    decoded, sr = sf.read(io.BytesIO(data), dtype="int16")
+    if sr == SR:
+        return "idéntico" if np.array_equal(decoded, original) else "DIFIERE"
+    back = resample_pcm16(decoded, sr, SR).astype(np.float64)[: original.size]
+    ref = original.astype(np.float64)[: back.size]
+    snr = 10 * np.log10(np.sum(ref ** 2) / max(np.sum((ref - back) ** 2), 1e-12))
+    return f"SNR {snr:.1f} dB"
+
+
+def main() -> None:
+    bench_dir = os.getenv("BENCH_DIR")
+    if bench_dir:
+        clips = wav_clips(bench_dir, int(os.getenv("BENCH_LIMIT", "100")))
+        source = bench_dir
+    else:
+        clips = synthetic_clips()
+        source = "sintético"
+    clips = [bandpass_pcm16(y, SR) for y in clips]
+    seconds = sum(y.size for y in clips) / SR
+    print(f"Clips: {len(clips)} ({seconds:.0f} s de audio) [{source}]")
+
+    results: Dict[str, dict] = {}
+    for fmt in ARCHIVE_FORMATS:
+        encode_archive(clips[0], SR, fmt)  # calentar (soxr/libsndfile)
+        elapsed, sizes = 0.0, []
+        for y in clips:
+            t0 = time.perf_counter()
+            encoded = encode_archive(y, SR, fmt)
+            elapsed += time.perf_counter() - t0
+            sizes.append(len(encoded.data))
+        results[fmt] = {"ms": 1000 * elapsed / len(clips), "kb": np.mean(sizes) / 1024, "bytes": sum(sizes),
+                        "fidelity": fidelity(fmt, clips[-1], encoded.data)}
+
+    baseline = results["wav"]["bytes"]
+    print(f"{'formato':<9} {'ms/clip':>8} {'KB/clip':>8} {'% de wav':>9}  fidelidad")
+    for fmt, res in results.items():
+        print(f"{fmt:<9} {res['ms']:8.2f} {res['kb']:8.1f} {100 * res['bytes'] / baseline:8.1f}%  {res['fidelity']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Micro-benchmarks del pipeline de `/finalize_wav`, etapa por etapa.
+
+Uso:
+    python bench/bench_pipeline.py                     # clips sintéticos de 3 s a 32 kHz
+    BENCH_SECONDS=5 BENCH_REPEAT=50 python bench/bench_pipeline.py
+
+Etapas (mismo orden que en la API):
+- `bandpass`: `bandpass_pcm16` sobre el PCM de 32 kHz
+- `vad`: `active_region` sobre el audio filtrado (detección de silencio de `VAD_ENABLED`)
+- `prepare`: int16 → float32 y remuestreo a 16 kHz (`prepare_audio`)
+- `decimate`: la alternativa de `FILTER_DECIMATE=1` (una de cada 2 muestras del audio filtrado)
+- `stft`, `mel+mfcc`, `chroma`, `spectral` (centroid/rolloff/bandwidth), `rms+zcr`, `f0`:
+  las partes de `extract_features_vector_from_array`, medidas por separado
+- `extract`: `extract_features_vector_from_array` completo
+- `extract_wav`: `extract_features_vector` desde un WAV en disco (el camino del entrenamiento)
+- `classify`: `predict_features` (solo los modelos, con el vector ya calculado)
+- `predict`: `AudioPredictor.predict(array, sr=32000)` de punta a punta, sin caché de características
+
+Las etapas de modelo se saltan si no hay modelos en `MODEL_DIR`. Se reporta media, p50 y
+p95 en ms por clip; `BENCH_OUT=archivo.json` guarda los resultados para comparar versiones.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import librosa
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.feature_extraction import (_rms_and_zcr, active_region, estimate_f0,  # noqa: E402
+                                      extract_features_vector, extract_features_vector_from_array,
+                                      prepare_audio)
+from server.audio import write_wav  # noqa: E402
+from server.filters import bandpass_pcm16  # noqa: E402
+
+SR = 32000
+MODEL_SR = 16000
+N_FFT = 2048
+HOP = 512
+
+
+def synthetic_clip(seconds: float, seed: int = 0) -> np.ndarray:
+    """Nota armónica con decaimiento y ruido, PCM int16 a 32 kHz (como la graba el ESP32)."""
+    rng = np.random.default_rng(seed)
+    f0 = 440.0 * 2 ** ((rng.integers(48, 76) - 69) / 12)
+    t = np.arange(int(seconds * SR)) / SR
+    y = sum((0.5 / k) * np.sin(2 * np.pi * k * f0 * t) for k in range(1, 6))
+    y = 9000 * y * np.exp(-t * 0.5) + 120 * rng.standard_normal(t.size)
+    return np.clip(y, -32768, 32767).astype(np.int16)
+
+
+def timeit(fn: Callable[[], object], repeat: int) -> List[float]:
+    fn()  # calentar (caches de librosa/numba, imports perezosos)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(1000 * (time.perf_counter() - t0))
+    return times
+
+
+def load_predictor():
+    try:
+        from model.predict_runtime import AudioPredictor
+        predictor = AudioPredictor()
+        return predictor if predictor.inst_model is not None else None
+    except Exception as e:
+        print(f"⚠ Sin modelos, se saltan classify/predict: {e}")
+        return None
+
+
+def main() -> None:
+    seconds = float(os.getenv("BENCH_SECONDS", "3"))
+    repeat = int(os.getenv("BENCH_REPEAT", "20"))
+    pcm = synthetic_clip(seconds)
+    clean = bandpass_pcm16(pcm, SR)
+    y = prepare_audio(clean, SR, sample_rate=MODEL_SR)
+    S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP))
+    power = S ** 2
+
+    stages: Dict[str, Callable[[], object]] = {
+        "bandpass": lambda: bandpass_pcm16(pcm, SR),
+        "vad": lambda: active_region(clean, SR),
+        "prepare": lambda: prepare_audio(clean, SR, sample_rate=MODEL_SR),
+        "decimate": lambda: prepare_audio(clean[::SR // MODEL_SR], MODEL_SR, sample_rate=MODEL_SR),
+        "stft": lambda: np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP)),
+        "mel+mfcc": lambda: librosa.feature.mfcc(
+            S=librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=MODEL_SR, n_fft=N_FFT)), n_mfcc=13),
+        "chroma": lambda: librosa.feature.chroma_stft(S=power, sr=MODEL_SR, n_fft=N_FFT),
+        "spectral": lambda: (librosa.feature.spectral_centroid(S=S, sr=MODEL_SR, n_fft=N_FFT),
+                             librosa.feature.spectral_rolloff(S=S, sr=MODEL_SR, n_fft=N_FFT),
+                             librosa.feature.spectral_bandwidth(S=S, sr=MODEL_SR, n_fft=N_FFT)),
+        "rms+zcr": lambda: _rms_and_zcr(y, frame_length=N_FFT, hop_length=HOP),
+        "f0": lambda: estimate_f0(y, MODEL_SR, frame_length=N_FFT, hop_length=HOP),
+        "extract": lambda: extract_features_vector_from_array(y, MODEL_SR),
+    }
+
+    tmp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
+    tmp.close()
+    write_wav(tmp.name, clean, SR)
+    stages["extract_wav"] = lambda: extract_features_vector(tmp.name, sample_rate=MODEL_SR)
+
+    predictor = load_predictor()
+    if predictor is not None:
+        predictor.feature_cache = None  # medir la extracción, no los aciertos de caché
+        x = extract_features_vector_from_array(y, MODEL_SR)
+        stages["classify"] = lambda: predictor.predict_features(x)
+        stages["predict"] = lambda: predictor.predict(pcm, sr=SR)
+
+    print(f"Clip: {seconds:.1f} s a {SR} Hz, {repeat} repeticiones por etapa")
+    print(f"{'etapa':<12} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        for name, fn in stages.items():
+            times = timeit(fn, repeat)
+            results[name] = {"mean": float(np.mean(times)), "p50": float(np.percentile(times, 50)),
+                             "p95": float(np.percentile(times, 95))}
+            r = results[name]
+            print(f"{name:<12} {r['mean']:9.2f} {r['p50']:8.2f} {r['p95']:8.2f}")
+    finally:
+        os.remove(tmp.name)
+
+    out = os.getenv("BENCH_OUT")
+    if out:
+        with open(out, "w") as f:
+            json.dump({"seconds": seconds, "repeat": repeat, "stages": results}, f, indent=2)
+        print(f"✔ Resultados guardados en {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Precisión vs latencia de los backends de f0 (`PITCH_BACKEND`).
+
+Uso:
+    python bench/bench_pitch.py                 # tonos armónicos sintéticos (f0 conocida)
+    DATASET_DIR=/ruta/dataset python bench/bench_pitch.py   # audios del dataset de entrenamiento
+
+Con tonos sintéticos la referencia es la f0 real; con el dataset la referencia es el
+backend `yin` (el usado para entrenar). Se reporta, por backend:
+- ms por clip (solo estimación de f0)
+- % de clips con f0 media a menos de 50 cents de la referencia
+- % de clips con la misma nota (hz_to_note_name) que la referencia
+- % de clips con el mismo instrumento predicho que con `yin` (si hay modelos en MODEL_DIR)
+"""
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.feature_extraction import (PITCH_BACKENDS, estimate_f0,  # noqa: E402
+                                      extract_features_vector_from_array, hz_to_note_name)
+
+SR = 16000
+
+
+def synthetic_clips(n_clips: int = 60, seed: int = 0) -> List[Tuple[np.ndarray, float]]:
+    """Tonos armónicos C2–C6 con ruido y silencio alrededor, como graba el ESP32."""
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(n_clips):
+        f0 = 440.0 * 2 ** ((rng.integers(36, 85) - 69) / 12)
+        dur = rng.uniform(1.0, 3.0)
+        t = np.arange(int(dur * SR)) / SR
+        tone = sum((0.6 / k) * np.sin(2 * np.pi * k * f0 * t + rng.uniform(0, 2 * np.pi))
+                   for k in range(1, 6) if k * f0 < SR / 2)
+        tone *= np.exp(-t * rng.uniform(0.2, 2.0))
+        lead, tail = np.zeros(int(rng.uniform(0.2, 1.5) * SR)), np.zeros(int(rng.uniform(0.2, 1.0) * SR))
+        y = np.concatenate([lead, tone, tail])
+        y += 0.003 * rng.standard_normal(y.size)
+        clips.append((y.astype(np.float32), f0))
+    return clips
+
+
+def dataset_clips(dataset_dir: str, limit: int) -> List[Tuple[np.ndarray, Optional[float]]]:
+    import librosa
+    from model.train_colab import collect_files, map_instrument
+
+    files = sorted(p for p in collect_files(dataset_dir) if map_instrument(p) is not None)
+    rng = np.random.default_rng(0)
+    files = [files[i] for i in rng.permutation(len(files))[:limit]]
+    clips = []
+    for path in files:
+        try:
+            y, _ = librosa.load(path, sr=SR, mono=True)
+        except Exception:
+            continue
+        if y.size >= SR // 2:
+            clips.append((y, None))
+    return clips
+
+
+def mean_f0(f0: np.ndarray) -> float:
+    valid = f0[f0 > 0]
+    return float(np.mean(valid)) if valid.size else 0.0
+
+
+def cents(a: float, b: float) -> float:
+    if a <= 0 or b <= 0:
+        return float("inf")
+    return abs(1200 * np.log2(a / b))
+
+
+def load_instrument_model():
+    try:
+        from model.predict_runtime import AudioPredictor
+        predictor = AudioPredictor()
+        return predictor if predictor.inst_model is not None else None
+    except Exception:
+        return None
+
+
+def main() -> None:
+    dataset_dir = os.getenv("DATASET_DIR")
+    if dataset_dir:
+        clips = dataset_clips(dataset_dir, int(os.getenv("BENCH_LIMIT", "400")))
+        source = f"dataset ({dataset_dir})"
+    else:
+        clips = synthetic_clips()
+        source = "sintético"
+    print(f"Clips: {len(clips)} [{source}]")
+
+    predictor = load_instrument_model()
+    results: Dict[str, dict] = {}
+    for backend in PITCH_BACKENDS:
+        estimate_f0(clips[0][0], SR, backend=backend)  # calentar (numba/fft)
+        elapsed = 0.0
+        means = []
+        for y, _ in clips:
+            t0 = time.perf_counter()
+            f0 = estimate_f0(y, SR, backend=backend)
+            elapsed += time.perf_counter() - t0
+            means.append(mean_f0(f0))
+        instruments = []
+        if predictor is not None:
+            os.environ["PITCH_BACKEND"] = backend
+            for y, _ in clips:
+                x = extract_features_vector_from_array(y, SR).reshape(1, -1)
+                instruments.append(predictor.inst_model.predict(x)[0])
+        results[backend] = {"ms": 1000 * elapsed / len(clips), "means": means, "instruments": instruments}
+    os.environ.pop("PITCH_BACKEND", None)
+
+    reference = [f0 for _, f0 in clips] if not dataset_dir else results["yin"]["means"]
+    print(f"{'backend':<10} {'ms/clip':>8} {'<50 cents':>10} {'misma nota':>11} {'mismo instr.':>13}")
+    for backend, res in results.items():
+        within = np.mean([cents(m, r) < 50 for m, r in zip(res["means"], reference)])
+        same_note = np.mean([hz_to_note_name(m) == hz_to_note_name(r) for m, r in zip(res["means"], reference)])
+        if res["instruments"]:
+            same_inst = f"{100 * np.mean(np.equal(res['instruments'], results['yin']['instruments'])):12.1f}%"
+        else:
+            same_inst = f"{'n/d':>13}"
+        print(f"{backend:<10} {res['ms']:8.2f} {100 * within:9.1f}% {100 * same_note:10.1f}% {same_inst}")
+
+
+if __name__ == "__main__":
+    main()
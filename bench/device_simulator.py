@@ -0,0 +1,205 @@
+"""
+Simulador de dispositivos ESP32: N dispositivos graban un tono de 32 kHz y lo suben a la API.
+
+Modos (`SIM_MODE`):
+- `chunks`: como el firmware actual, un POST `/upload_chunk` por cada 512 muestras (1 KB)
+  con humedad y timestamp en headers.
+- `frames`: POST `/upload_frames` con `SIM_FRAMES_PER_REQUEST` tramas binarias por request.
+- `stream`: un único POST `/upload_frames` por grabación con el cuerpo en
+  `Transfer-Encoding: chunked`, una ráfaga de tramas a medida que "se graban".
+
+Después cada dispositivo llama a `/finalize_wav/{id}`. Con `SIM_REORDER`/`SIM_DUPLICATE`
+(probabilidad por trama) se desordenan o repiten tramas para ejercitar el reensamblado.
+
+Uso:
+    python bench/device_simulator.py                              # contra http://localhost:8000
+    SIM_URL=https://mi-api.azurewebsites.net python bench/device_simulator.py
+    SIM_INPROC=1 SIM_MODE=chunks python bench/device_simulator.py # la app en el mismo proceso
+
+Variables: SIM_DEVICES (4), SIM_SECONDS (5), SIM_FRAME_SAMPLES (512),
+SIM_FRAMES_PER_REQUEST (32), SIM_REALTIME (1: ritmo de grabación real; 0: lo más rápido posible),
+SIM_REORDER (0), SIM_DUPLICATE (0), SIM_SEED (0).
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.framing import encode_frame  # noqa: E402
+
+SR = 32000
+NOTES = {"A4": 440.0, "C4": 261.63, "E4": 329.63, "G4": 392.0, "A3": 220.0, "C5": 523.25}
+
+
+def tone_pcm(freq: float, seconds: float, seed: int) -> bytes:
+    """Tono armónico con decaimiento y ruido, PCM int16 little-endian."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    y = sum((0.5 / k) * np.sin(2 * np.pi * k * freq * t) for k in range(1, 6))
+    y = 9000 * y * np.exp(-t * 0.4) + 120 * rng.standard_normal(t.size)
+    return np.clip(y, -32768, 32767).astype("<i2").tobytes()
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+class Device:
+    def __init__(self, index: int, cfg: Dict[str, float]) -> None:
+        self.device_id = f"sim{index:03d}"
+        self.note, freq = list(NOTES.items())[index % len(NOTES)]
+        self.cfg = cfg
+        self.rng = random.Random(cfg["seed"] * 1000 + index)
+        self.pcm = tone_pcm(freq, cfg["seconds"], index)
+        self.chunk_bytes = int(cfg["frame_samples"]) * 2
+        self.humidity = 35.0 + index % 30
+        self.request_latencies: List[float] = []
+        self.requests = 0
+        self.bytes_sent = 0
+        self.finalize_latency = 0.0
+        self.result: Dict = {}
+
+    def chunks(self) -> List[bytes]:
+        return [self.pcm[i:i + self.chunk_bytes] for i in range(0, len(self.pcm), self.chunk_bytes)]
+
+    def frames(self) -> List[bytes]:
+        frames = [encode_frame(seq, int(seq * self.cfg["frame_samples"] * 1000 / SR), self.humidity, chunk)
+                  for seq, chunk in enumerate(self.chunks())]
+        out: List[bytes] = []
+        for frame in frames:
+            out.append(frame)
+            if self.rng.random() < self.cfg["duplicate"]:
+                out.append(frame)
+            if len(out) > 1 and self.rng.random() < self.cfg["reorder"]:
+                out[-1], out[-2] = out[-2], out[-1]
+        return out
+
+    async def pace(self, start: float, audio_bytes: int) -> None:
+        """Espera hasta que el audio enviado "exista" (ritmo de grabación real)."""
+        if self.cfg["realtime"]:
+            delay = start + audio_bytes / (2 * SR) - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def post(self, client, url: str, **kwargs) -> None:
+        t0 = time.perf_counter()
+        r = await client.post(url, **kwargs)
+        self.request_latencies.append(time.perf_counter() - t0)
+        self.requests += 1
+        if r.status_code != 200:
+            raise RuntimeError(f"{url}: {r.status_code} {r.text[:200]}")
+
+    async def run(self, client, mode: str) -> None:
+        start = time.perf_counter()
+        if mode == "chunks":
+            sent = 0
+            for chunk in self.chunks():
+                sent += len(chunk)
+                await self.pace(start, sent)
+                headers = {"X-Device-Id": self.device_id, "X-Humidity": f"{self.humidity:.1f}",
+                           "X-Timestamp": str(int(sent * 1000 / (2 * SR)))}
+                await self.post(client, "/upload_chunk", content=chunk, headers=headers)
+                self.bytes_sent += len(chunk)
+        elif mode == "frames":
+            frames = self.frames()
+            per_request = int(self.cfg["frames_per_request"])
+            for i in range(0, len(frames), per_request):
+                body = b"".join(frames[i:i + per_request])
+                await self.pace(start, min(len(self.pcm), (i + per_request) * self.chunk_bytes))
+                await self.post(client, f"/upload_frames/{self.device_id}", content=body,
+                                headers={"Content-Type": "application/octet-stream"})
+                self.bytes_sent += len(body)
+        elif mode == "stream":
+            frames = self.frames()
+            per_burst = int(self.cfg["frames_per_request"])
+
+            async def body():
+                for i in range(0, len(frames), per_burst):
+                    await self.pace(start, min(len(self.pcm), (i + per_burst) * self.chunk_bytes))
+                    burst = b"".join(frames[i:i + per_burst])
+                    self.bytes_sent += len(burst)
+                    yield burst
+
+            await self.post(client, f"/upload_frames/{self.device_id}", content=body(),
+                            headers={"Content-Type": "application/octet-stream"})
+        else:
+            raise ValueError(f"SIM_MODE desconocido: {mode}")
+
+        t0 = time.perf_counter()
+        while True:
+            r = await client.get(f"/finalize_wav/{self.device_id}")
+            if r.status_code != 503:
+                break
+            await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+        self.finalize_latency = time.perf_counter() - t0
+        self.result = r.json()
+
+
+def config() -> Dict[str, float]:
+    return {
+        "devices": int(os.getenv("SIM_DEVICES", "4")),
+        "seconds": float(os.getenv("SIM_SECONDS", "5")),
+        "frame_samples": int(os.getenv("SIM_FRAME_SAMPLES", "512")),
+        "frames_per_request": int(os.getenv("SIM_FRAMES_PER_REQUEST", "32")),
+        "realtime": os.getenv("SIM_REALTIME", "1") == "1",
+        "reorder": float(os.getenv("SIM_REORDER", "0")),
+        "duplicate": float(os.getenv("SIM_DUPLICATE", "0")),
+        "seed": int(os.getenv("SIM_SEED", "0")),
+    }
+
+
+def make_client():
+    import httpx
+    timeout = httpx.Timeout(120.0)
+    if os.getenv("SIM_INPROC", "0") == "1":
+        import main
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://sim", timeout=timeout)
+    return httpx.AsyncClient(base_url=os.getenv("SIM_URL", "http://localhost:8000"), timeout=timeout)
+
+
+async def simulate(mode: str, cfg: Dict[str, float], client=None) -> List[Device]:
+    """Corre `cfg["devices"]` dispositivos en paralelo y devuelve sus mediciones."""
+    devices = [Device(i, cfg) for i in range(int(cfg["devices"]))]
+    own_client = client is None
+    client = client or make_client()
+    try:
+        await asyncio.gather(*(d.run(client, mode) for d in devices))
+    finally:
+        if own_client:
+            await client.aclose()
+    return devices
+
+
+def report(mode: str, devices: List[Device], wall: float) -> None:
+    latencies = [x for d in devices for x in d.request_latencies]
+    finalize = [d.finalize_latency for d in devices]
+    requests = sum(d.requests for d in devices)
+    sent = sum(d.bytes_sent for d in devices)
+    correct = sum(d.result.get("prediction", {}).get("note") == d.note for d in devices)
+    frames = [d.result.get("frames") for d in devices if d.result.get("frames")]
+    print(f"[{mode}] {len(devices)} dispositivos, {wall:.2f} s")
+    print(f"  requests: {requests} ({requests / len(devices):.0f} por grabación), {sent / 1024:.0f} KB enviados")
+    print(f"  upload p50/p95: {1000 * percentile(latencies, 50):.1f} / {1000 * percentile(latencies, 95):.1f} ms")
+    print(f"  finalize p50/p95: {1000 * percentile(finalize, 50):.1f} / {1000 * percentile(finalize, 95):.1f} ms")
+    print(f"  notas correctas: {correct}/{len(devices)}")
+    if frames:
+        totals = {k: sum(f[k] for f in frames) for k in ("accepted", "duplicates", "out_of_order", "gaps")}
+        print(f"  tramas: {totals}")
+
+
+def main() -> None:
+    cfg = config()
+    mode = os.getenv("SIM_MODE", "frames")
+    t0 = time.perf_counter()
+    devices = asyncio.run(simulate(mode, cfg))
+    report(mode, devices, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Prueba de carga de punta a punta: N dispositivos virtuales contra la app FastAPI en el mismo proceso.
+
+Cada dispositivo graba un tono sintético de 32 kHz, lo sube con `/upload_chunk` (o con
+`/upload_frames`, `SIM_MODE`) y llama a `/finalize_wav`; se repite `LOAD_ROUNDS` veces.
+PostgreSQL y Blob Storage se reemplazan por sustitutos locales (`MemoryDatabase` y
+`BLOB_LOCAL_DIR` en un directorio temporal), así que el resultado mide la API, la
+extracción y la inferencia, no la red hacia Azure.
+
+Uso (desde el directorio con `model_artifacts/`, o con MODEL_DIR):
+    python bench/load_test.py
+    SIM_DEVICES=16 LOAD_ROUNDS=3 python bench/load_test.py
+    LOAD_OUT=antes.json python bench/load_test.py   # guardar para comparar después de un cambio
+
+Variables: las de `bench/device_simulator.py` (SIM_MODE default `chunks`, SIM_DEVICES,
+SIM_SECONDS, SIM_REALTIME default `0`: subir lo más rápido posible, ...) y LOAD_ROUNDS (2).
+Se reporta p50/p95/p99 de cada request de subida y de `/finalize_wav`, detecciones por
+segundo, y cuántas detecciones llegaron a la "base" y cuántos blobs se subieron.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.device_simulator import Device, config, percentile, simulate  # noqa: E402
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {f"p{q}": round(1000 * percentile(values, q), 2) for q in (50, 95, 99)}
+
+
+async def run_rounds(app, mode: str, cfg: Dict[str, float], rounds: int) -> List[Device]:
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    devices: List[Device] = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=httpx.Timeout(300.0)) as client:
+        for _ in range(rounds):
+            devices += await simulate(mode, cfg, client=client)
+    return devices
+
+
+def main() -> None:
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    # Sustitutos locales: se configuran antes de importar la app (lee el entorno al importar)
+    os.environ.pop("DATABASE_URL", None)
+    os.environ.pop("AZURE_STORAGE_CONNECTION_STRING", None)
+    os.environ["BLOB_LOCAL_DIR"] = os.path.join(workdir, "blobs")
+    os.environ["BLOB_SPILL_DIR"] = os.path.join(workdir, "blob_spill")
+    os.environ["RECORDINGS_DIR"] = workdir
+
+    import main as api
+    from server.db import MemoryDatabase
+
+    memory_db = MemoryDatabase()
+    api.detections.db = memory_db
+
+    mode = os.getenv("SIM_MODE", "chunks")
+    rounds = int(os.getenv("LOAD_ROUNDS", "2"))
+    cfg = config()
+    cfg["realtime"] = os.getenv("SIM_REALTIME", "0") == "1"
+
+    # Warm-up fuera de la medición (el lifespan no corre con ASGITransport)
+    t0 = time.perf_counter()
+    api.start_warm_up()
+    api.inference_ready.get()
+    print(f"Warm-up: {time.perf_counter() - t0:.1f} s; {int(cfg['devices'])} dispositivos × {rounds} rondas, "
+          f"{cfg['seconds']:.1f} s de audio, modo {mode}")
+
+    t0 = time.perf_counter()
+    devices = asyncio.run(run_rounds(api.app, mode, cfg, rounds))
+    wall = time.perf_counter() - t0
+    # Igual que al apagar la API: la detección se encola cuando su blob quedó subido
+    if api.blob_uploader is not None:
+        api.blob_uploader.close()
+    api.detections.flush()
+    api.stop_inference_pool()
+
+    uploads = [x for d in devices for x in d.request_latencies]
+    finalize = [d.finalize_latency for d in devices]
+    detected = sum(bool(d.result.get("prediction")) for d in devices)
+    correct = sum(d.result.get("prediction", {}).get("note") == d.note for d in devices)
+    blob_stats = api.blob_uploader.stats() if api.blob_uploader is not None else {}
+    results = {
+        "mode": mode, "devices": int(cfg["devices"]), "rounds": rounds, "seconds": cfg["seconds"],
+        "wall_s": round(wall, 2), "requests": len(uploads) + len(finalize),
+        "upload_ms": latency_summary(uploads), "finalize_ms": latency_summary(finalize),
+        "detections": detected, "detections_per_s": round(detected / wall, 2),
+        "stored": len(memory_db.rows), "notes_correct": correct, "blobs": blob_stats.get("uploaded", 0),
+    }
+
+    print(f"{results['requests']} requests en {wall:.2f} s")
+    print(f"  subida   p50/p95/p99: {results['upload_ms']['p50']} / {results['upload_ms']['p95']} / "
+          f"{results['upload_ms']['p99']} ms")
+    print(f"  finalize p50/p95/p99: {results['finalize_ms']['p50']} / {results['finalize_ms']['p95']} / "
+          f"{results['finalize_ms']['p99']} ms")
+    print(f"  detecciones: {detected} ({results['detections_per_s']}/s), guardadas {results['stored']}, "
+          f"notas correctas {correct}/{len(devices)}, blobs {results['blobs']}")
+
+    out = os.getenv("LOAD_OUT")
+    if out:
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✔ Resultados guardados en {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,13 @@
-from fastapi import FastAPI, File, UploadFile, Request
+from fastapi import FastAPI, File, UploadFile, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
-import wave
 import os
-import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 import sys
 import numpy as np
-import scipy.signal as sps
-from collections import defaultdict
 import time
+from functools import partial
 
 # Cargar variables .env en desarrollo local si existe (no afecta Azure App Service que ya inyecta vars)
 try:
@@ -18,333 +16,481 @@ try:
 except Exception:
     pass
 
-# ML predictor (cargado si los archivos de modelo existen)
-PREDICTOR_AVAILABLE = False
-try:
-    from model.predict_runtime import AudioPredictor
-    PREDICTOR_AVAILABLE = True
-except Exception as _e:
-    PREDICTOR_AVAILABLE = False
-
-# Azure Blob (opcional)
-AZURE_AVAILABLE = False
-try:
-    from azure.storage.blob import BlobServiceClient, ContentSettings
-    AZURE_AVAILABLE = True
-except Exception:
-    AZURE_AVAILABLE = False
+from server.archive import ARCHIVE_FORMAT, archive_metadata, encode_archive
+from server.audio import pcm16_from_bytes, write_wav
+from server.blob_queue import BLOB_LOCAL_DIR, BlobUploader, LocalBlobContainer
+from server.db import HUMIDITY_BUCKET, Database, Detection, DetectionBuffer
+from server.framing import FrameAssembler, FrameDecoder
+from server.inference import InferencePool
+from server.lazy import Lazy, module_available, readiness
+from server import metrics
+from server.sessions import DEFAULT_DEVICE_ID, RecordingSession, SessionRegistry, normalize_device_id
+from server.streaming import STREAMING_FEATURES, pending_jobs as streaming_pending, warm_up as warm_up_streaming
 
 app = FastAPI()
-audio_file = "grabacion.raw"
-wav_file = "grabacion.wav"
-sensor_data_file = "mediciones.json"
+# Latencia y status por ruta para /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 sampleRate = 32000
 numChannels = 1
 sampleWidth = 2
-wf = None
-recording_started = False
 
-# Almacenar datos de sensores
-sensor_readings = []
+# Una grabación independiente por dispositivo (X-Device-Id / device_id); con STREAMING_FEATURES
+# las características se van extrayendo mientras llegan los chunks
+sessions = SessionRegistry(stream_sr=sampleRate if STREAMING_FEATURES else None)
+
+# Archivado del audio: se sube a Azure Blob (si está configurado) y, opcionalmente,
+# se guardan grabacion*.wav en disco. Sin archivado no se escribe ningún WAV.
+ARCHIVE_AUDIO = os.getenv("ARCHIVE_AUDIO", "1") == "1"
+ARCHIVE_LOCAL_WAV = os.getenv("ARCHIVE_LOCAL_WAV", "0") == "1"
+
+# Pool de inferencia (procesos con AudioPredictor precargado): el event loop solo recibe
+# chunks y responde.
+inference_pool = InferencePool()
 
-# Si ya existía, borramos archivos anteriores
-for file in [wav_file, audio_file, sensor_data_file]:
-    if os.path.exists(file):
-        os.remove(file)
 
-# Config Azure (si hay variables de entorno)
-blob_service: Optional[BlobServiceClient] = None
-container_client = None
+def _start_inference() -> InferencePool:
+    inference_pool.start()
+    if STREAMING_FEATURES:
+        warm_up_streaming(sampleRate)
+    return inference_pool
+
+
+# Se arranca en segundo plano: el servidor acepta conexiones mientras cargan los modelos
+inference_ready = Lazy("inference", _start_inference)
+
+# Azure Blob (opcional): el SDK se importa y el cliente se crea en el warm-up o al primer uso
+AZURE_AVAILABLE = module_available("azure.storage.blob")
 container_name = os.getenv("AZURE_STORAGE_CONTAINER", "audio")
-if AZURE_AVAILABLE:
-    conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if conn_str:
-        try:
-            blob_service = BlobServiceClient.from_connection_string(conn_str)
-            container_client = blob_service.get_container_client(container_name)
-            try:
-                container_client.create_container()
-            except Exception:
-                pass  # ya existe
-            print(f"Azure Blob habilitado. Contenedor: {container_name}")
-        except Exception as e:
-            print(f"No se pudo inicializar Azure Blob: {e}")
-            blob_service = None
-            container_client = None
 
-# Predictor global (opcional)
-predictor: Optional["AudioPredictor"] = None
-if PREDICTOR_AVAILABLE:
-    try:
-        predictor = AudioPredictor()
-        print("Predictor de audio cargado")
-    except Exception as e:
-        predictor = None
-        print(f"No se pudo cargar el predictor: {e}")
-
-# PostgreSQL (opcional) - proteger credenciales vía variables de entorno
-DB_AVAILABLE = False
-DB_DSN: Optional[str] = None
-
-# Opción 1: cadena de conexión completa (recomendada)
-DB_DSN = os.getenv("DATABASE_URL") or os.getenv("AZURE_POSTGRESQL_CONNECTION_STRING")
-if DB_DSN and DB_DSN.startswith("postgres://"):
-    # Normalizar prefijo para psycopg2
-    DB_DSN = DB_DSN.replace("postgres://", "postgresql://", 1)
-
-# Opción 2: componentes sueltos
-if not DB_DSN:
-    host = os.getenv("PGHOST")
-    db = os.getenv("PGDATABASE")
-    user = os.getenv("PGUSER")
-    pwd = os.getenv("PGPASSWORD")
-    port = os.getenv("PGPORT", "5432")
-    if host and db and user and pwd:
-        DB_DSN = f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
-
-if DB_DSN:
-    DB_AVAILABLE = True
-
-pg_conn = None
-if DB_AVAILABLE:
+
+def _create_container_client():
+    from azure.storage.blob import BlobServiceClient
+    blob_service = BlobServiceClient.from_connection_string(os.getenv("AZURE_STORAGE_CONNECTION_STRING"))
+    container_client = blob_service.get_container_client(container_name)
     try:
-        import psycopg2  # type: ignore
-        from psycopg2.extras import execute_values  # type: ignore
-        print("psycopg2 disponible; inserciones a PostgreSQL habilitadas si la conexión funciona")
-    except Exception as e:
-        DB_AVAILABLE = False
-        print(f"psycopg2 no disponible: {e}")
+        container_client.create_container()
+    except Exception:
+        pass  # ya existe
+    print(f"Azure Blob habilitado. Contenedor: {container_name}")
+    return container_client
 
-TABLE_SQL = (
-    """
-    CREATE TABLE IF NOT EXISTS public.detections (
-        id SERIAL PRIMARY KEY,
-        instrument TEXT,
-        note TEXT,
-        humidity_avg DOUBLE PRECISION
-    );
-    """
-)
 
-def db_connect():
-    global pg_conn
-    if not DB_AVAILABLE or not DB_DSN:
-        return None
-    try:
-        import psycopg2  # type: ignore
-        if pg_conn is None or pg_conn.closed != 0:
-            # SSL requerido generalmente en Azure
-            pg_conn = psycopg2.connect(DB_DSN, sslmode=os.getenv("PGSSLMODE", "require"))
-            with pg_conn.cursor() as cur:
-                cur.execute(TABLE_SQL)
-                pg_conn.commit()
-        return pg_conn
-    except Exception as e:
-        print(f"No se pudo conectar a PostgreSQL: {e}")
-        return None
+azure_container: Optional[Lazy] = None
+if AZURE_AVAILABLE and os.getenv("AZURE_STORAGE_CONNECTION_STRING"):
+    azure_container = Lazy("azure_blob", _create_container_client, required=False)
 
-@app.post("/upload_chunk")
-async def upload_chunk(request: Request):
-    global sensor_readings, recording_started, wf
+# Subidas en segundo plano (cola acotada + reintentos + spill a disco). Con BLOB_LOCAL_DIR
+# los blobs se escriben en un directorio local en lugar de Azure (pruebas)
+blob_uploader: Optional[BlobUploader] = None
+if BLOB_LOCAL_DIR:
+    container_name = os.path.basename(os.path.normpath(BLOB_LOCAL_DIR))
+    _local_container = LocalBlobContainer(BLOB_LOCAL_DIR)
+    blob_uploader = BlobUploader(lambda: _local_container)
+elif azure_container is not None:
+    blob_uploader = BlobUploader(azure_container.get)
 
-    if not recording_started:
-        recording_started = True
-        sensor_readings = []
 
+@app.on_event("startup")
+def start_warm_up():
+    inference_ready.start_background()
+    if azure_container is not None:
+        azure_container.start_background()
+    if ARCHIVE_AUDIO and blob_uploader is not None:
+        # Reanuda también las subidas que quedaron en el spill de una ejecución anterior
+        blob_uploader.start()
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    inference_pool.shutdown()
+    if blob_uploader is not None:
+        blob_uploader.close()
+    detections.close()
+    db.close()
+
+# PostgreSQL (opcional) - proteger credenciales vía variables de entorno.
+# Pool de conexiones compartido y buffer: las detecciones se insertan en lote
+db = Database()
+detections = DetectionBuffer(db)
+
+
+def resolve_device_id(request: Request, device_id: Optional[str] = None) -> str:
+    """Id del dispositivo: parámetro de ruta/query o header X-Device-Id."""
+    return normalize_device_id(device_id or request.headers.get("X-Device-Id"))
+
+
+@app.post("/upload_chunk")
+@app.post("/upload_chunk/{device_id}")
+async def upload_chunk(request: Request, device_id: Optional[str] = None):
+    device_id = resolve_device_id(request, device_id)
     data = await request.body()
-    data = await request.body()
+    # La sesión se busca después del await: un /finalize_wav o una expulsión mientras llega
+    # el cuerpo la saca del registro y el chunk quedaría en una sesión huérfana
+    session = sessions.get_or_create(device_id)
 
     # Obtener datos de sensores
     humidity = request.headers.get("X-Humidity", "0")
     timestamp = request.headers.get("X-Timestamp", str(int(datetime.now().timestamp() * 1000)))
 
-    # Guardar lectura del sensor
-    sensor_reading = {
-        "timestamp": int(timestamp),
-        "humidity": float(humidity),
-        "chunk_size": len(data),
-        "datetime": datetime.now().isoformat()
-    }
-    sensor_readings.append(sensor_reading)
+    # Guardar lectura del sensor (registro columnar, anexado al .jsonl)
+    with session.lock:
+        session.append(data, int(timestamp), float(humidity))
+        total_readings = len(session.sensor_log)
+        extractor = session.extractor
 
-    # Guardar datos de sensores en JSON
-    with open(sensor_data_file, "w") as f:
-        json.dump(sensor_readings, f, indent=2)
+    metrics.CHUNKS.inc(endpoint="upload_chunk")
+    metrics.BYTES.inc(len(data), endpoint="upload_chunk")
 
-    if len(data) > 0:
-        with open(audio_file, "ab") as f:
-            f.write(data)
+    # Filtro + características del chunk en segundo plano
+    if extractor is not None and len(data) > 0:
+        extractor.schedule()
 
     return {
         "status": "ok",
+        "device_id": session.device_id,
         "chunk_size": len(data),
         "humidity": humidity,
-        "total_readings": len(sensor_readings)
+        "total_readings": total_readings
     }
 
 
-@app.get("/finalize_wav")
-def finalize_wav():
-    global sensor_readings, recording_started
+@app.post("/upload_frames")
+@app.post("/upload_frames/{device_id}")
+async def upload_frames(request: Request, device_id: Optional[str] = None):
+    """Ingesta binaria: varias tramas (seq, timestamp, humedad, PCM) por request.
+
+    El cuerpo se procesa a medida que llega (admite `Transfer-Encoding: chunked`); las tramas
+    se reordenan por `seq` y los duplicados se descartan (ver server/framing.py).
+    """
+    device_id = resolve_device_id(request, device_id)
+    decoder = FrameDecoder()
+    n_frames = 0
+    async for data in request.stream():
+        frames = decoder.feed(data)
+        if frames:
+            # Sin await entre la búsqueda y el append (igual que /upload_chunk): si la sesión se
+            # finalizó o expulsó mientras llegaba el cuerpo, las tramas van a la sesión nueva
+            session = sessions.get_or_create(device_id)
+            n_frames += len(frames)
+            metrics.CHUNKS.inc(len(frames), endpoint="upload_frames")
+            metrics.BYTES.inc(sum(len(f.payload) for f in frames), endpoint="upload_frames")
+            with session.lock:
+                if session.assembler is None:
+                    session.assembler = FrameAssembler()
+                for frame in frames:
+                    for ready in session.assembler.add(frame):
+                        session.append(ready.payload, ready.timestamp_ms, ready.humidity)
+                extractor = session.extractor
+            # Filtro + características en segundo plano, igual que /upload_chunk
+            if extractor is not None:
+                extractor.schedule()
+        if decoder.error:
+            break
+
+    frame_stats, total_readings = None, 0
+    session = sessions.get(device_id)
+    if session is not None:
+        with session.lock:
+            frame_stats = session.assembler.stats() if session.assembler is not None else None
+            total_readings = len(session.sensor_log)
+    content = {
+        "status": "ok",
+        "device_id": device_id,
+        "frames": n_frames,
+        "received_bytes": decoder.offset,
+        "assembler": frame_stats,
+        "total_readings": total_readings,
+    }
+    error = decoder.error or ("trama incompleta al final del cuerpo" if decoder.incomplete else None)
+    if error:
+        metrics.ERRORS.inc(stage="frames")
+        # Las tramas válidas anteriores ya quedaron en la sesión; `assembler.next_seq` indica desde dónde reenviar
+        return JSONResponse(status_code=400, content={**content, "status": "error", "message": error})
+    return content
 
-    recording_started = False
 
-    # Validar archivo recibido
-    if not os.path.exists(audio_file):
+@app.get("/finalize_wav")
+@app.get("/finalize_wav/{device_id}")
+async def finalize_wav(request: Request, background_tasks: BackgroundTasks, device_id: Optional[str] = None,
+                       timings: bool = False):
+    """Clasifica la grabación. Con `?timings=1` (o el header `X-Timings: 1`) la respuesta
+    incluye `timings_ms`, el desglose por etapa de este request (ver server/metrics.py)."""
+    # Backpressure: con el pool saturado la grabación queda intacta para reintentar
+    if not inference_pool.reserve():
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "1"},
+            content={"status": "error", "message": "Servidor ocupado, reintenta en unos segundos."},
+        )
+
+    # Sacar la sesión del registro: los chunks siguientes abren una grabación nueva
+    session = sessions.pop(resolve_device_id(request, device_id))
+    if session is None:
+        inference_pool.release()
         return {"status": "error", "message": "No hay datos para procesar."}
 
-    filesize = os.path.getsize(audio_file)
+    with session.lock:
+        frame_stats = None
+        if session.assembler is not None:
+            # Tramas que esperaban un hueco que nunca llegó: se anexan en orden
+            for frame in session.assembler.flush():
+                session.append(frame.payload, frame.timestamp_ms, frame.humidity)
+            frame_stats = session.assembler.stats()
+        raw_data = session.take_audio()
+        extractor, session.extractor = session.extractor, None
+        session.sensor_log.flush()
+        # -----------------------------
+        #   ESTADÍSTICAS DE SENSORES
+        # -----------------------------
+        sensor_stats = session.sensor_log.stats()
+
+    # Validar audio recibido
+    filesize = len(raw_data)
     if filesize == 0:
+        inference_pool.release()
         return {"status": "error", "message": "Archivo vacío."}
 
-    # Crear WAV base a partir del RAW recibido
-    with open(audio_file, "rb") as rf:
-        raw_data = rf.read()
-
-    with wave.open(wav_file, "wb") as wf_tmp:
-        wf_tmp.setnchannels(numChannels)
-        wf_tmp.setsampwidth(sampleWidth)
-        wf_tmp.setframerate(sampleRate)
-        wf_tmp.writeframes(raw_data)
-
-    wav_to_use = wav_file
-    
-    # --- Aplicar filtro band-pass como el código que pediste ---
-    try:
-        cleaned_wav = "grabacion_limpia.wav"
-
-        # Leer señal
-        with wave.open(wav_file, "rb") as rf:
-            frames = rf.readframes(rf.getnframes())
-            sr = rf.getframerate()
-
-        audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32)
+    # Caché / extracción incremental / pool de inferencia, fuera del event loop
+    stage_ms: dict = {}
+    with metrics.span("finalize", stage_ms):
+        clean_audio, prediction = await inference_pool.analyze(raw_data, sampleRate, extractor, stage_ms)
+    if prediction.get("silent"):
+        metrics.SILENT_CLIPS.inc()
+    elif "error" not in prediction:
+        metrics.DETECTIONS.inc()
+    audio = pcm16_from_bytes(raw_data)
+    filtered_ok = clean_audio is not None
+    if clean_audio is None:
+        clean_audio = audio
+
+    # Archivo local, Azure Blob y PostgreSQL se ejecutan después de responder
+    wav_file = wav_to_use = None
+    if ARCHIVE_AUDIO and ARCHIVE_LOCAL_WAV:
+        wav_file = session.wav_file
+        wav_to_use = session.clean_wav_file if filtered_ok else session.wav_file
+    background_tasks.add_task(
+        _archive_and_store, session, audio, clean_audio, filtered_ok, prediction, sensor_stats,
+        datetime.now(timezone.utc),
+    )
 
-        # Calcular frecuencias normalizadas
-        low = 300 / (sr / 2)
-        high = 3400 / (sr / 2)
-
-        # Protección por si audio es muy corto
-        if len(audio) < 50:
-            raise Exception("Audio demasiado corto para filtrar")
-
-        b, a = sps.butter(4, [low, high], btype="band")
-        filtered = sps.lfilter(b, a, audio)
-
-        # Guardar WAV filtrado
-        with wave.open(cleaned_wav, "wb") as wf_out:
-            wf_out.setnchannels(1)
-            wf_out.setsampwidth(2)
-            wf_out.setframerate(sampleRate)
-            wf_out.writeframes(filtered.astype(np.int16).tobytes())
-
-        wav_to_use = cleaned_wav
-        print("✔ Audio filtrado correctamente (300–3400 Hz).")
-
-    except Exception as e:
-        print(f"⚠ No se pudo filtrar audio: {e}")
-        wav_to_use = wav_file
+    return {
+        "status": "ok",
+        "device_id": session.device_id,
+        "audio_file": wav_file,
+        "clean_audio": wav_to_use,
+        "audio_size": filesize,
+        "sensor_stats": sensor_stats,
+        "prediction": prediction,
+        **({"frames": frame_stats} if frame_stats is not None else {}),
+        **({"timings_ms": {k: round(v, 2) for k, v in stage_ms.items()}}
+           if timings or request.headers.get("X-Timings") == "1" else {}),
+    }
 
-    # -----------------------------
-    #   ESTADÍSTICAS DE SENSORES
-    # -----------------------------
-    sensor_stats = {}
-    if sensor_readings:
-        humidities = [reading["humidity"] for reading in sensor_readings]
-        sensor_stats = {
-            "total_readings": len(sensor_readings),
-            "humidity_avg": sum(humidities) / len(humidities),
-            "humidity_min": min(humidities),
-            "humidity_max": max(humidities),
-            "recording_duration_ms":
-                sensor_readings[-1]["timestamp"] - sensor_readings[0]["timestamp"]
-                if len(sensor_readings) > 1 else 0
-        }
 
+def _archive_and_store(session: RecordingSession, audio: np.ndarray, clean_audio: np.ndarray,
+                       filtered_ok: bool, prediction: dict, sensor_stats: dict, recorded_at: datetime) -> None:
+    """Efectos secundarios de una detección (tarea en segundo plano tras la respuesta)."""
     # -----------------------------
-    #   PREDICCIÓN MODELO
+    #   ARCHIVO LOCAL (OPCIONAL)
     # -----------------------------
-    prediction = {"instrument": "Unknown", "note": "Unknown"}
-    if predictor is not None:
+    if ARCHIVE_AUDIO and ARCHIVE_LOCAL_WAV:
         try:
-            prediction = predictor.predict(wav_to_use)
+            with metrics.span("wav_write"):
+                write_wav(session.wav_file, audio, sampleRate)
+                if filtered_ok:
+                    write_wav(session.clean_wav_file, clean_audio, sampleRate)
         except Exception as e:
-            prediction = {"instrument": "Unknown", "note": "Unknown", "error": str(e)}
+            metrics.ERRORS.inc(stage="wav_write")
+            print(f"⚠ No se pudo guardar WAV local: {e}")
     # -----------------------------
     #   SUBIR A AZURE BLOB STORAGE
     # -----------------------------
-    if container_client:
+    audio_ref = session.clean_wav_file if ARCHIVE_AUDIO and ARCHIVE_LOCAL_WAV and filtered_ok else None
+    # Un clip en silencio no es una detección (el audio sí se archiva)
+    store = None if prediction.get("silent") else partial(
+        _store_detection, session.device_id, prediction, sensor_stats, recorded_at)
+    # El audio se codifica en memoria (ARCHIVE_FORMAT) y se encola junto con sus metadatos:
+    # la subida (con reintentos) la hacen los workers
+    if ARCHIVE_AUDIO and blob_uploader is not None:
+        blob_stem = f"audio_{int(time.time())}"
+        if session.device_id != DEFAULT_DEVICE_ID:
+            blob_stem = f"{session.device_id}/{blob_stem}"
         try:
-            blob_name = f"audio_{int(time.time())}.wav"
-            with open(wav_to_use, "rb") as data:
-                container_client.upload_blob(name=blob_name, data=data, overwrite=True)
-            print(f"✔ WAV subido a Azure Blob: {blob_name}")
+            with metrics.span("archive_encode"):
+                encoded = encode_archive(clean_audio, sampleRate)
         except Exception as e:
-            print(f"⚠ Error al subir WAV a Azure Blob: {e}")
-    # -----------------------------
-    #   INSERTAR EN POSTGRESQL
-    # -----------------------------
-    conn = db_connect()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO public.detections (instrument, note, humidity) VALUES (%s, %s, %s)",
-                    (
-                        prediction.get("instrument", "Unknown"),
-                        prediction.get("note", "Unknown"),
-                        sensor_stats.get("humidity_avg", None),
-                    )
-                )
-                conn.commit()
-            print("✔ Registro insertado en PostgreSQL.")
-        except Exception as e:
-            print(f"⚠ Error al insertar en PostgreSQL: {e}")
-
-    # Reset
-    sensor_readings = []
-
-    return {
-        "status": "ok",
-        "audio_file": wav_file,
-        "clean_audio": wav_to_use,
-        "audio_size": filesize,
-        "sensor_stats": sensor_stats,
-        "prediction": prediction,
-    }
+            metrics.ERRORS.inc(stage="archive_encode")
+            print(f"⚠ No se pudo codificar en {ARCHIVE_FORMAT}, se archiva WAV: {e}")
+            encoded = encode_archive(clean_audio, sampleRate, "wav")
+        blob_name = f"{blob_stem}.{encoded.extension}"
+        blob_ref = f"{container_name}/{blob_name}"
+        local_ref = audio_ref
+
+        def on_stored(durable: bool) -> None:
+            # La fila se inserta cuando el blob ya está subido o en el spill; si se descartó,
+            # `audio_ref` no apunta a él
+            store(blob_ref if durable else local_ref)
+
+        if blob_uploader.submit(blob_name, encoded.data, encoded.content_type,
+                                on_stored=on_stored if store is not None else None):
+            metadata = archive_metadata(
+                encoded, len(clean_audio), sampleRate, audio=blob_name, device_id=session.device_id,
+                recorded_at=recorded_at.isoformat(), filtered=filtered_ok,
+                sensor_stats=sensor_stats, prediction=prediction,
+            )
+            blob_uploader.submit(f"{blob_stem}.json", metadata, "application/json")
+        return
+    if store is not None:
+        store(audio_ref)
+
+
+def _store_detection(device_id: str, prediction: dict, sensor_stats: dict, recorded_at: datetime,
+                     audio_ref: Optional[str]) -> None:
+    """Encola la detección para PostgreSQL (el flush la inserta en lote)."""
+    detections.add(Detection(
+        prediction.get("instrument", "Unknown"),
+        prediction.get("note", "Unknown"),
+        sensor_stats.get("humidity_avg", None),
+        recorded_at,
+        device_id,
+        prediction.get("confidence"),
+        audio_ref,
+    ))
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness (el proceso responde) y readiness (modelos y pool cargados) por separado"""
+    return {"status": "ok", "live": True, **readiness(),
+            "sessions": len(sessions), "inference_pending": inference_pool.pending,
+            "streaming_pending": streaming_pending(),
+            "db_buffer": detections.stats(),
+            "blob_uploads": blob_uploader.stats() if blob_uploader is not None else None}
+
+
+@app.get("/healthz/ready")
+def healthz_ready():
+    """Probe de readiness: 503 mientras el warm-up no terminó"""
+    state = readiness()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, headers={"Retry-After": "1"}, content={"status": "starting", **state})
+    return {"status": "ok", **state}
+
+
+@app.get("/feature_cache")
+def get_feature_cache_stats():
+    """Aciertos/fallos de la caché de vectores de características"""
+    return {"status": "ok", "feature_cache": inference_pool.feature_cache.stats()}
+
+
+# Contadores que ya llevan la caché, la cola de blobs y el buffer de PostgreSQL: se leen al scrapear
+def _feature_cache_lookups() -> dict:
+    stats = inference_pool.feature_cache.stats()
+    return {"hit": stats["hits"], "disk_hit": stats["disk_hits"], "miss": stats["misses"]}
+
+
+def _blob_counts(keys) -> Optional[dict]:
+    if blob_uploader is None:
+        return None
+    stats = blob_uploader.stats()
+    return {k: stats[k] for k in keys}
+
+
+metrics.callback("sessions", "Grabaciones abiertas", lambda: len(sessions))
+metrics.callback("inference_pending", "Análisis en curso o esperando en el pool", lambda: inference_pool.pending)
+metrics.callback("streaming_pending", "Trabajos de extracción incremental en cola o en curso", streaming_pending)
+metrics.callback("feature_cache_lookups_total", "Consultas a la caché de características",
+                 _feature_cache_lookups, kind="counter", labelname="result")
+metrics.callback("blob_uploads_total", "Subidas de blobs por resultado",
+                 lambda: _blob_counts(("uploaded", "retries", "failed", "spilled", "dropped")),
+                 kind="counter", labelname="result")
+metrics.callback("blob_queue", "Blobs esperando subida", lambda: _blob_counts(("queued", "spilled_pending")),
+                 labelname="queue")
+metrics.callback("db_rows_total", "Detecciones insertadas o descartadas por el buffer de PostgreSQL",
+                 lambda: {k: detections.stats()[k] for k in ("inserted", "dropped")},
+                 kind="counter", labelname="result")
+metrics.callback("db_failed_batches_total", "Lotes que fallaron tras todos los reintentos",
+                 lambda: detections.failed_batches, kind="counter")
+metrics.callback("db_buffer_pending", "Detecciones esperando inserción", lambda: len(detections))
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto de Prometheus (ver server/metrics.py)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _time_window(since: Optional[datetime], until: Optional[datetime],
+                 hours: Optional[float]):
+    """Ventana [since, until): `hours` sin `since` = últimas horas; con `since` fija `until`."""
+    if hours is not None:
+        if since is None:
+            since = (until or datetime.now(timezone.utc)) - timedelta(hours=hours)
+        elif until is None:
+            until = since + timedelta(hours=hours)
+    return since, until
 
 
 @app.get("/sensor_data")
-def get_sensor_data():
-    """Endpoint para obtener los datos del sensor por separado"""
-    conn = db_connect()
-    ins = set(["bateria","guitarra","violin","piano"])
-    dataInst = defaultdict(int)
-    dataNote = defaultdict(int)
-    dataHumidity = defaultdict(int)
-    lastInstrument = ""
-    lastNote = ""
-    lastHumidity = ""
-    if conn:
+def get_sensor_data(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    hours: Optional[float] = None):
+    """Endpoint para obtener los datos del sensor por separado.
+
+    Conteos por instrumento, nota y rango de humedad (`HUMIDITY_BUCKET`), leídos de los
+    contadores por hora. Ventana opcional: `since`/`until` (ISO 8601, UTC si no trae zona)
+    y/o `hours` (sin `since`: las últimas `hours` horas).
+    """
+    since, until = _time_window(since, until, hours)
+    if db.available:
         try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT instrument,note,humidity,count(*) AS total FROM public.detections GROUP BY instrument,note,humidity;"
-                )
-                data = cur.fetchall()
-                cur.execute(
-                    "SELECT instrument,note,humidity FROM public.detections ORDER BY id DESC limit 1;"
-                )
-                lastData = cur.fetchall()
-            for instrument,note,humidity,total in data:
-                dataInst[instrument] += total
-                dataNote[note] += total
-                dataHumidity[humidity] += total
-            lastInstrument,lastNote,lastHumidity = lastData[0]
-            
-            return {"status":"ok", "data":{"instrumentos": dict(dataInst),"notas": dict(dataNote),"humedades": dict(dataHumidity), "lastInstrument": lastInstrument, "lastNote": lastNote, "lastHumidity": lastHumidity}}
+            summary = db.detection_summary(since, until)
+            last = summary["last"] or {}
+            return {"status": "ok", "data": {"instrumentos": summary["instruments"], "notas": summary["notes"],
+                                             "humedades": summary["humidities"], "humidity_bucket": HUMIDITY_BUCKET,
+                                             "lastInstrument": last.get("instrument", ""),
+                                             "lastNote": last.get("note", ""),
+                                             "lastHumidity": last.get("humidity", "")}}
         except Exception as e:
             return {"status": "error", "message": f"Error al seleccionar datos en PostgreSQL: {e}"}
 
+
+@app.get("/detections")
+def list_detections(device_id: Optional[str] = None, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, limit: int = 50, cursor: Optional[str] = None,
+                    max_confidence: Optional[float] = None):
+    """Historial de detecciones (más recientes primero) paginado por cursor.
+
+    `next_cursor` de la respuesta se pasa como `cursor` para pedir la página siguiente.
+    `max_confidence` filtra las detecciones dudosas (confianza menor o sin confianza).
+    """
+    if not db.available:
+        return JSONResponse(status_code=503, content={"status": "error", "message": "PostgreSQL no configurado."})
+    limit = max(1, min(limit, 500))
+    try:
+        items, next_cursor = db.list_detections(
+            normalize_device_id(device_id) if device_id else None, since, until, limit, cursor,
+            max_confidence
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    except Exception as e:
+        return {"status": "error", "message": f"Error al seleccionar datos en PostgreSQL: {e}"}
+    return {"status": "ok", "items": items, "next_cursor": next_cursor}
+
+
+@app.get("/detections/summary")
+def detections_summary(device_id: Optional[str] = None, since: Optional[datetime] = None,
+                       until: Optional[datetime] = None, hours: Optional[float] = None):
+    """Conteos por dispositivo, instrumento, nota y humedad en una ventana de tiempo"""
+    if not db.available:
+        return JSONResponse(status_code=503, content={"status": "error", "message": "PostgreSQL no configurado."})
+    since, until = _time_window(since, until, hours)
+    try:
+        summary = db.detection_summary(since, until, normalize_device_id(device_id) if device_id else None)
+    except Exception as e:
+        return {"status": "error", "message": f"Error al seleccionar datos en PostgreSQL: {e}"}
+    return {"status": "ok", "since": since, "until": until, "humidity_bucket": HUMIDITY_BUCKET, **summary}
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,157 @@
+"""
+Formato compacto para los RandomForest entrenados.
+
+`export_forest` aplana todos los árboles de un `RandomForestClassifier` en arrays de nodos
+(feature, threshold, hijos, probabilidades por nodo) guardados como `.npy` en un directorio.
+`CompactForest` los abre con memory-map: cargar el modelo no deserializa 300 objetos `Tree`
+(arranque en milisegundos) y los workers que cargan el mismo archivo comparten las páginas.
+
+La predicción recorre todos los árboles a la vez con NumPy (un paso por nivel de
+profundidad) y reproduce `predict_proba`/`predict` de sklearn: X se compara en float32
+contra umbrales float64 y las probabilidades se promedian árbol por árbol.
+
+Si se exporta junto con el `LabelEncoder`, sus clases se guardan en `labels.npy` y
+`LabelDecoder` las decodifica sin importar sklearn.
+
+Convertir artefactos ya entrenados:
+    python -m model.compact_forest model_artifacts
+"""
+import json
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+
+FILES = ("feature", "threshold", "next_left", "next_right", "value", "roots", "classes")
+
+
+def export_forest(model, out_dir: str, labels: Optional[np.ndarray] = None) -> str:
+    """Exporta un `RandomForestClassifier` (o `DecisionTreeClassifier`) entrenado a `out_dir`.
+
+    `labels`: clases del `LabelEncoder` usado al entrenar (opcional).
+    """
+    estimators = getattr(model, "estimators_", None) or [model]
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in estimators:
+        tree = est.tree_
+        n = tree.node_count
+        nodes = np.arange(n)
+        is_leaf = tree.children_left == -1
+        # Las hojas apuntan a sí mismas: el recorrido por niveles no necesita máscaras
+        lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        value = tree.value[:, 0, :]
+        # sklearn >= 1.4 ya guarda fracciones y `predict_proba` las devuelve tal cual (dividir
+        # de nuevo cambia el último bit); las versiones anteriores guardan conteos y normalizan
+        sums = value.sum(axis=1, keepdims=True)
+        values.append(value if np.allclose(sums, 1.0) else value / sums)
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "next_left": np.concatenate(lefts).astype(np.int32),
+        "next_right": np.concatenate(rights).astype(np.int32),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "classes": np.asarray(model.classes_),
+    }
+    if labels is not None:
+        arrays["labels"] = np.asarray(labels).astype(str)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"n_trees": len(estimators), "n_nodes": offset, "max_depth": max_depth,
+                   "n_features": int(model.n_features_in_)}, f, indent=2)
+    return out_dir
+
+
+class CompactForest:
+    """Bosque exportado con `export_forest`, con `predict`/`predict_proba` como sklearn."""
+
+    def __init__(self, path: str, mmap: bool = True) -> None:
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.n_trees = int(meta["n_trees"])
+        self.max_depth = int(meta["max_depth"])
+        self.n_features_in_ = int(meta["n_features"])
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in FILES}
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.next_left = arrays["next_left"]
+        self.next_right = arrays["next_right"]
+        self.value = arrays["value"]
+        self.roots = np.asarray(arrays["roots"])
+        self.classes_ = np.asarray(arrays["classes"])
+        labels_path = os.path.join(path, "labels.npy")
+        self.labels = LabelDecoder(np.load(labels_path)) if os.path.exists(labels_path) else None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Índice global de la hoja alcanzada en cada árbol → (n_muestras, n_árboles)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaban {self.n_features_in_} características, se recibió {X.shape}")
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.next_left[node], self.next_right[node])
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.apply(X)
+        # Suma árbol por árbol (mismo orden de acumulación que sklearn)
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for t in range(self.n_trees):
+            proba += self.value[leaves[:, t]]
+        return proba / self.n_trees
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class LabelDecoder:
+    """Sustituto de `LabelEncoder.inverse_transform` a partir de las clases exportadas."""
+
+    def __init__(self, classes: np.ndarray) -> None:
+        self.classes_ = np.asarray(classes)
+
+    def inverse_transform(self, y: np.ndarray) -> np.ndarray:
+        return self.classes_[np.asarray(y, dtype=np.intp)]
+
+
+def export_artifacts(model_dir: str, names=(("instrument_rf", "instrument_encoder"),
+                                            ("note_rf", "note_encoder"))) -> None:
+    """Convierte los `<modelo>.pkl` (+ encoder) de `model_dir` a `<modelo>_compact/`."""
+    import pickle
+    for model_name, encoder_name in names:
+        pkl = os.path.join(model_dir, f"{model_name}.pkl")
+        if not os.path.exists(pkl):
+            continue
+        with open(pkl, "rb") as f:
+            model = pickle.load(f)
+        labels = None
+        encoder_pkl = os.path.join(model_dir, f"{encoder_name}.pkl")
+        if os.path.exists(encoder_pkl):
+            with open(encoder_pkl, "rb") as f:
+                labels = pickle.load(f).classes_
+        out = export_forest(model, os.path.join(model_dir, f"{model_name}_compact"), labels=labels)
+        print(f"✔ {pkl} → {out}")
+
+
+if __name__ == "__main__":
+    export_artifacts(sys.argv[1] if len(sys.argv) > 1 else os.getenv("MODEL_DIR", "model_artifacts"))
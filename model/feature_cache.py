@@ -0,0 +1,147 @@
+"""
+Caché de vectores de características direccionada por contenido.
+
+La clave es un SHA-256 del PCM (dtype, forma y bytes), su frecuencia de muestreo y los
+parámetros de extracción; así un clip reenviado por el dispositivo o un WAV archivado que se
+vuelve a puntuar no repite la extracción con librosa.
+
+Dos niveles:
+- memoria: LRU acotado a `max_items` vectores
+- disco (opcional): un `.npy` por clave en `disk_dir`, leído con memory-map; sobrevive a
+  reinicios y se comparte entre procesos
+
+Variables de entorno (opcional):
+- FEATURE_CACHE_SIZE: vectores en memoria (default: 1024; 0 desactiva la caché)
+- FEATURE_CACHE_DIR: directorio del nivel en disco (default: sin nivel en disco)
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+def cache_key(audio: np.ndarray, sr: int, params: Optional[dict] = None) -> str:
+    """Hash del PCM + `sr` + parámetros de extracción."""
+    audio = np.ascontiguousarray(audio)
+    h = hashlib.sha256()
+    h.update(json.dumps({"dtype": audio.dtype.str, "shape": audio.shape, "sr": int(sr),
+                         "params": params or {}}, sort_keys=True).encode())
+    h.update(memoryview(audio).cast("B"))
+    return h.hexdigest()
+
+
+def file_cache_key(path: str, params: Optional[dict] = None) -> str:
+    """Hash de los bytes del archivo de audio (sin decodificarlo) + parámetros."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"params": params or {}}, sort_keys=True).encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, max_items: Optional[int] = None, disk_dir: Optional[str] = None) -> None:
+        self.max_items = max_items if max_items is not None else int(os.getenv("FEATURE_CACHE_SIZE", "1024"))
+        self.disk_dir = disk_dir if disk_dir is not None else (os.getenv("FEATURE_CACHE_DIR") or None)
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0 or bool(self.disk_dir)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Vector cacheado (copia) o None; cuenta aciertos y fallos."""
+        with self._lock:
+            x = self._items.get(key)
+            if x is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return x.copy()
+        x = self._load(key)
+        with self._lock:
+            if x is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, x)
+        return x.copy()
+
+    def put(self, key: str, x: np.ndarray) -> None:
+        x = np.array(x, dtype=np.float32).ravel()
+        with self._lock:
+            self._remember(key, x)
+        self._store(key, x)
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        x = self.get(key)
+        if x is None:
+            x = compute()
+            self.put(key, x)
+        return x
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "items": len(self._items),
+            "max_items": self.max_items,
+            "disk_dir": self.disk_dir,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def _remember(self, key: str, x: np.ndarray) -> None:
+        if self.max_items <= 0:
+            return
+        self._items[key] = x
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    # --- Nivel en disco ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npy")
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        if not self.disk_dir:
+            return None
+        try:
+            return np.array(np.load(self._path(key), mmap_mode="r"))
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key: str, x: np.ndarray) -> None:
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        # Escritura atómica: otro proceso nunca lee un .npy a medias
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                np.save(f, x)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠ No se pudo guardar en la caché de características: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
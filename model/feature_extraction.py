@@ -1,10 +1,59 @@
 """
 Extracción de características consistente para entrenamiento e inferencia.
+
+Todas las características espectrales se derivan de una única STFT por audio:
+el espectrograma de magnitud alimenta centroid/rolloff/bandwidth y su potencia
+alimenta MFCC (vía mel) y chroma. RMS y ZCR comparten el mismo relleno/encuadre
+en el dominio temporal. El vector resultante es idéntico al de la versión que
+calculaba cada característica por separado (el modelo entrenado sigue siendo válido).
+
+Este módulo es la única implementación, compartida por el entrenamiento (train_colab.py) y
+la inferencia (predict_runtime.py). `extract_features_batch` procesa varias señales a la vez
+apilando las de igual longitud.
+
+La f0 se estima con el backend elegido en `PITCH_BACKEND`:
+- `yin` (default): librosa.yin sobre todo el audio (C2–C7), comportamiento original.
+- `autocorr`: autocorrelación por FFT vectorizada sobre los mismos frames.
+- `yin_gated`: librosa.yin solo sobre los frames con energía (RMS a menos de
+  `PITCH_GATE_DB` dB del pico, default 40).
+
+Detección de actividad (VAD) por energía, con el mismo RMS por frame de las características
+(`frame_rms`): un frame es activo si su RMS supera `VAD_MIN_DBFS` (default -60 dBFS) y está a
+menos de `VAD_REL_DB` dB del pico (default 40). `active_region` devuelve el tramo entre el
+primer y el último frame activo, ampliado `VAD_PAD_MS` (default 100) a cada lado, o None si hay
+menos de `VAD_MIN_ACTIVE_MS` (default 100) de frames activos: el clip es silencio.
+- `VAD_ENABLED` (default `1`): la API responde sin extraer ni clasificar los clips en silencio.
+- `VAD_TRIM` (default `0`): la extracción usa solo el tramo activo. Cambia el vector (la media
+  y la desviación ya no incluyen el silencio), así que hay que reentrenar con el mismo valor.
 """
-from typing import Dict
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 import numpy as np
+import scipy.fft
 import librosa
 
+PITCH_BACKENDS = ("yin", "autocorr", "yin_gated")
+PITCH_FMIN = float(librosa.note_to_hz('C2'))
+PITCH_FMAX = float(librosa.note_to_hz('C7'))
+
+
+def feature_dim(n_mfcc: int = 13) -> int:
+    """Longitud del vector: MFCC (2*n_mfcc) + Chroma (2*12) + espectrales (2*5) + f0 (2)."""
+    return 2*n_mfcc + 2*12 + 2*5 + 2
+
+
+def extraction_params(sample_rate: int = 16000, n_mfcc: int = 13, n_fft: int = 2048,
+                      hop_length: int = 512) -> Dict[str, object]:
+    """Parámetros que determinan el vector (para claves de caché)."""
+    params: Dict[str, object] = {"sample_rate": sample_rate, "n_mfcc": n_mfcc, "n_fft": n_fft,
+                                 "hop_length": hop_length, "pitch_backend": pitch_backend()}
+    if params["pitch_backend"] == "yin_gated":
+        params["pitch_gate_db"] = float(os.getenv("PITCH_GATE_DB", "40"))
+    if vad_trim():
+        params.update(vad_trim=True, **vad_params())
+    return params
+
 
 def extract_features_vector(audio_path: str, sample_rate: int = 16000,
                             n_mfcc: int = 13, n_fft: int = 2048, hop_length: int = 512) -> np.ndarray:
@@ -13,45 +62,298 @@ def extract_features_vector(audio_path: str, sample_rate: int = 16000,
     bandwidth, zcr, rms) y f0 (mean,std). Orden fijo.
     """
     y, sr = librosa.load(audio_path, sr=sample_rate, mono=True)
+    return extract_features_vector_from_array(y, sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
 
+
+def prepare_audio(y: np.ndarray, sr: int, sample_rate: int = 16000) -> np.ndarray:
+    """Lleva una señal en memoria al formato que usa `librosa.load`: mono float32 a `sample_rate`.
+
+    Acepta PCM int16 (se escala a [-1, 1) como al leer un WAV) o flotantes.
+    """
+    if np.issubdtype(y.dtype, np.integer):
+        y = y.astype(np.float32) / np.float32(np.iinfo(y.dtype).max + 1)
+    else:
+        y = y.astype(np.float32, copy=False)
+    if y.ndim > 1:
+        y = librosa.to_mono(y)
+    if sr != sample_rate and y.size > 0:
+        y = librosa.resample(y, orig_sr=sr, target_sr=sample_rate, res_type="soxr_hq")
+    return y
+
+
+def extract_features_vector_from_array(y: np.ndarray, sr: int = 16000,
+                                       n_mfcc: int = 13, n_fft: int = 2048, hop_length: int = 512,
+                                       timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Igual que `extract_features_vector` pero sobre una señal mono ya cargada a `sr`.
+
+    Con `timings` se suman ahí los ms de cada etapa (stft, mfcc, chroma, spectral, f0).
+    """
     # Evitar audios vacíos
     if y.size == 0:
-        return np.zeros(2*n_mfcc + 2*12 + 2*5 + 2, dtype=np.float32)
+        return np.zeros(feature_dim(n_mfcc), dtype=np.float32)
+    if vad_trim():
+        start = time.perf_counter()
+        y = trim_to_activity(y, sr, n_fft, hop_length)
+        _lap(timings, "vad", start)
+    return _extract_same_length(y[np.newaxis, :], sr, n_mfcc, n_fft, hop_length, timings)[0]
 
-    feats = []
 
-    # MFCC
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
-    feats.extend(np.mean(mfcc, axis=1))
-    feats.extend(np.std(mfcc, axis=1))
+def extract_features_batch(arrays: Sequence[np.ndarray], sr: int = 16000, n_mfcc: int = 13,
+                           n_fft: int = 2048, hop_length: int = 512, max_batch: int = 32) -> np.ndarray:
+    """Vectores de características de varias señales mono a `sr` → matriz (n, feature_dim).
 
-    # Chroma
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    feats.extend(np.mean(chroma, axis=1))
-    feats.extend(np.std(chroma, axis=1))
+    Las señales de igual longitud se apilan en un array 2-D (hasta `max_batch` por grupo) y
+    comparten STFT, mel, MFCC y características espectrales vectorizadas. No se rellena con
+    ceros: cada fila es idéntica a `extract_features_vector_from_array` sobre esa señal.
+    """
+    out = np.zeros((len(arrays), feature_dim(n_mfcc)), dtype=np.float32)
+    if vad_trim():
+        arrays = [trim_to_activity(np.asarray(y), sr, n_fft, hop_length) if y.size > 0 else y for y in arrays]
+    groups: Dict[int, List[int]] = {}
+    for i, y in enumerate(arrays):
+        if y.size > 0:
+            groups.setdefault(y.shape[-1], []).append(i)
+    for indices in groups.values():
+        for start in range(0, len(indices), max_batch):
+            chunk = indices[start:start + max_batch]
+            Y = np.stack([np.asarray(arrays[i], dtype=np.float32) for i in chunk])
+            out[chunk] = _extract_same_length(Y, sr, n_mfcc, n_fft, hop_length)
+    return out
+
+
+def _lap(timings: Optional[Dict[str, float]], stage: str, start: float) -> float:
+    """Suma a `timings[stage]` los ms desde `start`; devuelve el instante actual."""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + 1000 * (now - start)
+    return now
+
+
+def _extract_same_length(Y: np.ndarray, sr: int, n_mfcc: int, n_fft: int, hop_length: int,
+                         timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Características de un lote (k, n) de señales de igual longitud."""
+    t = time.perf_counter()
+    # Una sola STFT para todas las características espectrales
+    S = np.abs(librosa.stft(Y, n_fft=n_fft, hop_length=hop_length))
+    power = S ** 2
+    t = _lap(timings, "stft", t)
+
+    # MFCC (el umbral top_db de power_to_db se aplica por señal, no sobre el lote)
+    mel = librosa.feature.melspectrogram(S=power, sr=sr, n_fft=n_fft)
+    mel_db = librosa.power_to_db(mel, top_db=None)
+    mel_db = np.maximum(mel_db, mel_db.max(axis=(-2, -1), keepdims=True) - 80.0)
+    mfcc = librosa.feature.mfcc(S=mel_db, n_mfcc=n_mfcc)
+    t = _lap(timings, "mfcc", t)
 
     # Spectral centroid, rolloff, bandwidth, zcr, rms
-    spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    zcr = librosa.feature.zero_crossing_rate(y=y, hop_length=hop_length)
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)
-
-    feats.extend([float(np.mean(spectral_centroid)), float(np.std(spectral_centroid))])
-    feats.extend([float(np.mean(spectral_rolloff)), float(np.std(spectral_rolloff))])
-    feats.extend([float(np.mean(spectral_bandwidth)), float(np.std(spectral_bandwidth))])
-    feats.extend([float(np.mean(zcr)), float(np.std(zcr))])
-    feats.extend([float(np.mean(rms)), float(np.std(rms))])
-
-    # f0 (frecuencia fundamental)
-    f0 = librosa.yin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr)
-    f0_valid = f0[f0 > 0]
-    if f0_valid.size > 0:
-        feats.extend([float(np.mean(f0_valid)), float(np.std(f0_valid))])
-    else:
-        feats.extend([0.0, 0.0])
+    spectral_centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft)
+    spectral_rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr, n_fft=n_fft)
+    spectral_bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr, n_fft=n_fft, centroid=spectral_centroid)
+    rms, zcr = _rms_and_zcr(Y, frame_length=n_fft, hop_length=hop_length)
+    t = _lap(timings, "spectral", t)
+
+    out = np.empty((Y.shape[0], feature_dim(n_mfcc)), dtype=np.float32)
+    for i in range(Y.shape[0]):
+        feats = []
+        feats.extend(np.mean(mfcc[i], axis=1))
+        feats.extend(np.std(mfcc[i], axis=1))
+
+        # Chroma: la afinación se estima por señal
+        chroma = librosa.feature.chroma_stft(S=power[i], sr=sr, n_fft=n_fft)
+        feats.extend(np.mean(chroma, axis=1))
+        feats.extend(np.std(chroma, axis=1))
+        t = _lap(timings, "chroma", t)
+
+        for values in (spectral_centroid[i], spectral_rolloff[i], spectral_bandwidth[i], zcr[i], rms[i]):
+            feats.extend([float(np.mean(values)), float(np.std(values))])
+
+        # f0 (frecuencia fundamental)
+        f0 = estimate_f0(Y[i], sr, frame_length=n_fft, hop_length=hop_length, rms=rms[i, 0])
+        f0_valid = f0[f0 > 0]
+        if f0_valid.size > 0:
+            feats.extend([float(np.mean(f0_valid)), float(np.std(f0_valid))])
+        else:
+            feats.extend([0.0, 0.0])
+        t = _lap(timings, "f0", t)
+        out[i] = feats
+    return out
+
+
+def _rms_and_zcr(y: np.ndarray, frame_length: int = 2048, hop_length: int = 512):
+    """RMS y zero-crossing rate por frame con el mismo encuadre centrado que librosa.
+
+    Equivale a `librosa.feature.rms(y=...)` (relleno con ceros) y
+    `librosa.feature.zero_crossing_rate(y=...)` (relleno 'edge'), pero los cruces se
+    detectan una sola vez sobre la señal y se cuentan por frame con una suma acumulada.
+    """
+    pad = frame_length // 2
+    n_frames = 1 + (y.shape[-1] + 2 * pad - frame_length) // hop_length
+    starts = np.arange(n_frames) * hop_length
+    padding = [(0, 0)] * (y.ndim - 1) + [(pad, pad)]
+
+    rms = frame_rms(y, frame_length=frame_length, hop_length=hop_length)
+
+    # ZCR: un cruce en i si cambia el signo entre i-1 e i (valores ~0 cuentan como positivos)
+    edged = np.pad(y, padding, mode="edge")
+    signs = np.signbit(np.where(np.abs(edged) <= 1e-10, 0, edged))
+    changes = np.cumsum(signs[..., 1:] != signs[..., :-1], axis=-1)
+    crossings = np.concatenate((np.zeros(changes.shape[:-1] + (1,), dtype=changes.dtype), changes), axis=-1)
+    # Cruces dentro de [start, start + frame_length): pares (i-1, i) con start < i < start + frame_length
+    counts = crossings[..., starts + frame_length - 1] - crossings[..., starts]
+    zcr = (counts / frame_length)[..., np.newaxis, :]
+
+    return rms, zcr
+
+
+def frame_rms(y: np.ndarray, frame_length: int = 2048, hop_length: int = 512) -> np.ndarray:
+    """RMS por frame centrado, forma (..., 1, n_frames); igual a `librosa.feature.rms(y=...)`."""
+    pad = frame_length // 2
+    padding = [(0, 0)] * (y.ndim - 1) + [(pad, pad)]
+    # Frames (vista sin copia) sobre la señal rellenada con ceros
+    padded = np.pad(y, padding, mode="constant")
+    frames = librosa.util.frame(padded, frame_length=frame_length, hop_length=hop_length)
+    return np.sqrt(np.mean(librosa.util.abs2(frames, dtype=np.float32), axis=-2, keepdims=True))
+
+
+# -----------------------------
+#   DETECCIÓN DE ACTIVIDAD (VAD)
+# -----------------------------
+def vad_enabled() -> bool:
+    return os.getenv("VAD_ENABLED", "1") == "1"
+
+
+def vad_trim() -> bool:
+    return os.getenv("VAD_TRIM", "0") == "1"
+
+
+def vad_params() -> Dict[str, float]:
+    """Umbrales de la detección de actividad (para claves de caché)."""
+    return {"vad_min_dbfs": float(os.getenv("VAD_MIN_DBFS", "-60")),
+            "vad_rel_db": float(os.getenv("VAD_REL_DB", "40")),
+            "vad_min_active_ms": float(os.getenv("VAD_MIN_ACTIVE_MS", "100")),
+            "vad_pad_ms": float(os.getenv("VAD_PAD_MS", "100"))}
+
+
+def active_region(y: np.ndarray, sr: int = 16000, frame_length: Optional[int] = None,
+                  hop_length: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """Tramo [inicio, fin) en muestras con actividad; None si el clip es silencio.
+
+    Acepta PCM int16 o flotantes en [-1, 1). Sin `frame_length`/`hop_length` se usa la
+    duración del encuadre de las características (2048/512 muestras a 16 kHz) a la `sr` dada.
+    """
+    if y.size == 0:
+        return None
+    frame_length = frame_length or max(1, round(2048 * sr / 16000))
+    hop_length = hop_length or max(1, round(512 * sr / 16000))
+    if np.issubdtype(y.dtype, np.integer):
+        y = y.astype(np.float32) / np.float32(np.iinfo(y.dtype).max + 1)
+    params = vad_params()
+    rms = frame_rms(y, frame_length=frame_length, hop_length=hop_length).reshape(-1)
+    peak = float(rms.max())
+    threshold = max(10 ** (params["vad_min_dbfs"] / 20), peak * 10 ** (-params["vad_rel_db"] / 20))
+    active = np.flatnonzero(rms >= threshold)
+    if active.size * hop_length < params["vad_min_active_ms"] * sr / 1000:
+        return None
+    # Frame t centrado en t*hop: cubre [t*hop - frame_length/2, t*hop + frame_length/2)
+    pad = frame_length // 2 + int(params["vad_pad_ms"] * sr / 1000)
+    return max(0, int(active[0]) * hop_length - pad), min(y.shape[-1], int(active[-1]) * hop_length + pad)
+
+
+def trim_to_activity(y: np.ndarray, sr: int = 16000, frame_length: int = 2048,
+                     hop_length: int = 512) -> np.ndarray:
+    """Recorta `y` a su tramo activo; un clip sin actividad se deja entero."""
+    region = active_region(y, sr, frame_length, hop_length)
+    return y if region is None else y[..., region[0]:region[1]]
+
+
+def pitch_backend(backend: Optional[str] = None) -> str:
+    """Backend de f0 a usar: el indicado o el de `PITCH_BACKEND` (default `yin`)."""
+    backend = (backend or os.getenv("PITCH_BACKEND", "yin")).strip().lower()
+    if backend not in PITCH_BACKENDS:
+        raise ValueError(f"PITCH_BACKEND desconocido: {backend} (opciones: {', '.join(PITCH_BACKENDS)})")
+    return backend
+
+
+def estimate_f0(y: np.ndarray, sr: int = 16000, backend: Optional[str] = None,
+                frame_length: int = 2048, hop_length: int = 512,
+                rms: Optional[np.ndarray] = None, center: bool = True) -> np.ndarray:
+    """f0 por frame (Hz) con el backend indicado o el de `PITCH_BACKEND`.
+
+    Los frames sin tono (o descartados por energía) se devuelven como 0.
+    `rms` permite reutilizar la energía por frame ya calculada (mismo encuadre).
+    Con `center=False` no se rellena la señal (frames completos, para procesar por bloques).
+    """
+    backend = pitch_backend(backend)
+    if backend == "autocorr":
+        return _autocorr_f0(y, sr, frame_length, hop_length, center=center)
+    if backend == "yin_gated" and center:
+        return _gated_yin_f0(y, sr, frame_length, hop_length, rms)
+    return librosa.yin(y, fmin=PITCH_FMIN, fmax=PITCH_FMAX, sr=sr,
+                       frame_length=frame_length, hop_length=hop_length, center=center)
+
+
+def energy_gate(rms: np.ndarray) -> np.ndarray:
+    """Frames con RMS a menos de `PITCH_GATE_DB` dB (default 40) del pico del audio."""
+    gate_db = float(os.getenv("PITCH_GATE_DB", "40"))
+    peak = np.max(rms) if rms.size else 0.0
+    if peak <= 0:
+        return np.zeros(rms.shape, dtype=bool)
+    return rms >= peak * 10 ** (-gate_db / 20)
+
+
+def _autocorr_f0(y: np.ndarray, sr: int, frame_length: int, hop_length: int,
+                 voicing_threshold: float = 0.3, center: bool = True) -> np.ndarray:
+    """Autocorrelación normalizada vía FFT de todos los frames a la vez."""
+    padded = np.pad(y, frame_length // 2, mode="constant") if center else y
+    frames = librosa.util.frame(padded, frame_length=frame_length, hop_length=hop_length)
+    frames = frames - np.mean(frames, axis=0, keepdims=True)
+
+    min_lag = int(np.floor(sr / PITCH_FMAX))
+    max_lag = min(int(np.ceil(sr / PITCH_FMIN)), frame_length - 2)
+
+    # Relleno mínimo para que la correlación circular sea lineal hasta max_lag
+    n = scipy.fft.next_fast_len(frame_length + max_lag + 2, real=True)
+    spec = scipy.fft.rfft(frames, n=n, axis=0)
+    acf = scipy.fft.irfft(spec.real ** 2 + spec.imag ** 2, n=n, axis=0)[:max_lag + 2]
+    energy = acf[0]
+    acf = acf / np.maximum(energy, 1e-12)
+
+    # Primer pico cercano al máximo: evita errores de sub-octava (lags múltiplos del periodo)
+    window = acf[min_lag:max_lag + 1]
+    peak_value = np.max(window, axis=0)
+    is_peak = (window[1:-1] >= window[:-2]) & (window[1:-1] >= window[2:]) & (window[1:-1] >= 0.9 * peak_value)
+    has_peak = np.any(is_peak, axis=0)
+    lag = min_lag + 1 + np.argmax(is_peak, axis=0)
+
+    # Interpolación parabólica alrededor del pico
+    cols = np.arange(acf.shape[1])
+    left, center, right = acf[lag - 1, cols], acf[lag, cols], acf[lag + 1, cols]
+    denom = left - 2 * center + right
+    shift = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / np.where(denom == 0, 1, denom), 0.0)
+    period = lag + np.clip(shift, -1, 1)
+
+    voiced = has_peak & (peak_value >= voicing_threshold) & (energy > 0)
+    return np.where(voiced, sr / period, 0.0)
+
+
+def _gated_yin_f0(y: np.ndarray, sr: int, frame_length: int, hop_length: int,
+                  rms: Optional[np.ndarray] = None) -> np.ndarray:
+    """YIN restringido al tramo con energía; los frames silenciosos quedan en 0."""
+    if rms is None:
+        rms = _rms_and_zcr(y, frame_length=frame_length, hop_length=hop_length)[0][0]
+    active = energy_gate(rms)
+    f0 = np.zeros(rms.shape[-1], dtype=np.float64)
+    if not np.any(active):
+        return f0
 
-    return np.asarray(feats, dtype=np.float32)
+    # Frames [first, last]: mismo encuadre centrado que yin, sin calcular los extremos silenciosos
+    first, last = np.flatnonzero(active)[[0, -1]]
+    padded = np.pad(y, frame_length // 2, mode="constant")
+    segment = padded[first * hop_length:last * hop_length + frame_length]
+    f0[first:last + 1] = librosa.yin(segment, fmin=PITCH_FMIN, fmax=PITCH_FMAX, sr=sr,
+                                     frame_length=frame_length, hop_length=hop_length, center=False)
+    f0[~active] = 0.0
+    return f0
 
 
 def hz_to_note_name(freq: float) -> str:
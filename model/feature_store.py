@@ -0,0 +1,76 @@
+"""
+Almacén de características en disco para el entrenamiento, en shards `.npz`.
+
+Cada shard guarda un lote de archivos ya procesados: ruta relativa al dataset, estado
+(`STATUS_OK`, `STATUS_SHORT`, `STATUS_ERROR`) y vector de características. Los shards se
+escriben de forma atómica a medida que termina cada lote, así una extracción interrumpida
+se reanuda desde el último shard completo y reentrenar con otros hiperparámetros no vuelve
+a extraer nada.
+
+El directorio incluye un hash de los parámetros de extracción: si cambian, se usa un
+almacén nuevo en lugar de mezclar vectores incompatibles.
+"""
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+STATUS_OK = 1
+STATUS_SHORT = 0
+STATUS_ERROR = -1
+
+
+class FeatureStore:
+    def __init__(self, root: str, params: Dict[str, object], dim: int) -> None:
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+        self.dir = os.path.join(root, digest)
+        self.dim = dim
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, "params.json"), "w") as f:
+            json.dump(params, f, indent=2, sort_keys=True)
+
+        self._entries: Dict[str, Tuple[int, np.ndarray]] = {}
+        self._next_shard = 0
+        for shard in sorted(glob.glob(os.path.join(self.dir, "shard_*.npz"))):
+            self._load_shard(shard)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Tuple[int, np.ndarray]]:
+        return self._entries.get(key)
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        return [k for k in keys if k not in self._entries]
+
+    def add_shard(self, keys: List[str], statuses: List[int], features: np.ndarray) -> None:
+        """Persiste un lote como shard nuevo (escritura atómica) y lo incorpora al índice."""
+        if not keys:
+            return
+        features = np.asarray(features, dtype=np.float32).reshape(len(keys), self.dim)
+        path = os.path.join(self.dir, f"shard_{self._next_shard:06d}.npz")
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, keys=np.asarray(keys), statuses=np.asarray(statuses, dtype=np.int8), features=features)
+        os.replace(tmp, path)
+        self._next_shard += 1
+        for key, status, x in zip(keys, statuses, features):
+            self._entries[key] = (int(status), x)
+
+    def _load_shard(self, path: str) -> None:
+        try:
+            with np.load(path) as data:
+                keys, statuses, features = data["keys"], data["statuses"], data["features"]
+        except Exception as e:
+            print(f"Shard ignorado ({os.path.basename(path)}): {e}")
+            return
+        for key, status, x in zip(keys, statuses, features):
+            self._entries[str(key)] = (int(status), x)
+        index = int(os.path.basename(path)[len("shard_"):-len(".npz")])
+        self._next_shard = max(self._next_shard, index + 1)
@@ -1,7 +1,7 @@
 """
 Cargador de modelo y predictor para Azure runtime.
 - Carga RandomForest entrenado (pickle)
-- Extrae características con feature_extraction.extract_features_vector
+- Extrae características con feature_extraction (desde archivo o desde un array en memoria)
 - Devuelve instrumento y nota estimada
 
 Variables de entorno esperadas (opcional, para rutas por defecto):
@@ -10,38 +10,75 @@ Variables de entorno esperadas (opcional, para rutas por defecto):
 - NOTE_MODEL_FILE (default: note_rf.pkl)  # opcional si solo usamos f0->nota
 - INSTRUMENT_ENCODER_FILE (default: instrument_encoder.pkl)
 - NOTE_ENCODER_FILE (default: note_encoder.pkl)
+- MODEL_N_JOBS (default: 1)  # hilos de sklearn por predict; >1 solo compensa con lotes grandes
+- INSTRUMENT_COMPACT_DIR (default: instrument_rf_compact), NOTE_COMPACT_DIR (default: note_rf_compact)
+- MODEL_FORMAT (default: auto)  # auto: usa el formato compacto (compact_forest) si existe; pickle: siempre .pkl
+- PREDICT_TOP_K (default: 3)  # candidatos por modelo en `top_instruments` / `top_notes`
+- REJECT_THRESHOLD (default: 0)  # probabilidad mínima; por debajo la etiqueta es "Unknown"
+
+Cada modelo se recorre una sola vez (`predict_proba`): de esas probabilidades salen la
+etiqueta, su `confidence` y los top-k candidatos. `confidence` del resultado es la menor
+entre la del instrumento y la de la nota (si la nota sale del modelo; la nota estimada por f0
+no tiene probabilidad).
+
+Con `feature_cache` (ver feature_cache.FeatureCache) los vectores se cachean por hash del audio.
 """
 import os
 import pickle
-from typing import Dict, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
-from .feature_extraction import extract_features_vector, hz_to_note_name
+from .compact_forest import CompactForest
+from .feature_cache import FeatureCache, cache_key, file_cache_key
+from .feature_extraction import (extract_features_batch, extract_features_vector,
+                                 extract_features_vector_from_array, extraction_params, feature_dim,
+                                 hz_to_note_name, prepare_audio)
+
+
+PREDICT_TOP_K = int(os.getenv("PREDICT_TOP_K", "3"))
+REJECT_THRESHOLD = float(os.getenv("REJECT_THRESHOLD", "0"))
 
 
 class AudioPredictor:
-    def __init__(self, model_dir: Optional[str] = None) -> None:
+    def __init__(self, model_dir: Optional[str] = None, feature_cache: Optional[FeatureCache] = None,
+                 top_k: Optional[int] = None, reject_threshold: Optional[float] = None) -> None:
         base = model_dir or os.getenv("MODEL_DIR", os.path.join(os.getcwd(), "model_artifacts"))
         self.instrument_model_path = os.path.join(base, os.getenv("INSTRUMENT_MODEL_FILE", "instrument_rf.pkl"))
         self.instrument_encoder_path = os.path.join(base, os.getenv("INSTRUMENT_ENCODER_FILE", "instrument_encoder.pkl"))
         self.note_model_path = os.path.join(base, os.getenv("NOTE_MODEL_FILE", "note_rf.pkl"))
         self.note_encoder_path = os.path.join(base, os.getenv("NOTE_ENCODER_FILE", "note_encoder.pkl"))
+        self.instrument_compact_path = os.path.join(base, os.getenv("INSTRUMENT_COMPACT_DIR", "instrument_rf_compact"))
+        self.note_compact_path = os.path.join(base, os.getenv("NOTE_COMPACT_DIR", "note_rf_compact"))
+        use_compact = os.getenv("MODEL_FORMAT", "auto").strip().lower() != "pickle"
+
+        # Frecuencia de muestreo con la que se entrenaron los modelos
+        self.sample_rate = 16000
+        self.feature_cache = feature_cache
+        self.top_k = max(1, top_k if top_k is not None else PREDICT_TOP_K)
+        self.reject_threshold = reject_threshold if reject_threshold is not None else REJECT_THRESHOLD
 
         self.inst_model = None
         self.inst_encoder = None
         self.note_model = None
         self.note_encoder = None
 
+        # Formato compacto (memory-map, sin deserializar árboles ni importar sklearn)
+        if use_compact:
+            self.inst_model, self.inst_encoder = self._load_compact(self.instrument_compact_path,
+                                                                    self.instrument_encoder_path)
+            self.note_model, self.note_encoder = self._load_compact(self.note_compact_path, self.note_encoder_path)
+
         # Intentar cargar modelo/encoder de instrumento
-        if os.path.exists(self.instrument_model_path) and os.path.exists(self.instrument_encoder_path):
+        if self.inst_model is None and os.path.exists(self.instrument_model_path) and os.path.exists(self.instrument_encoder_path):
             with open(self.instrument_model_path, 'rb') as f:
                 self.inst_model = pickle.load(f)
             with open(self.instrument_encoder_path, 'rb') as f:
                 self.inst_encoder = pickle.load(f)
 
         # Nota (opcional); si falta, usaremos f0 para nota
-        if os.path.exists(self.note_model_path) and os.path.exists(self.note_encoder_path):
+        if self.note_model is None and os.path.exists(self.note_model_path) and os.path.exists(self.note_encoder_path):
             try:
                 with open(self.note_model_path, 'rb') as f:
                     self.note_model = pickle.load(f)
@@ -51,36 +88,153 @@ class AudioPredictor:
                 self.note_model = None
                 self.note_encoder = None
 
-    def predict(self, audio_path: str) -> Dict[str, str]:
-        x = extract_features_vector(audio_path)
-        x2d = x.reshape(1, -1)
+        # Repartir árboles entre hilos no compensa con lotes pequeños (y compite con el pool de la API)
+        n_jobs = int(os.getenv("MODEL_N_JOBS", "1"))
+        for m in (self.inst_model, self.note_model):
+            if m is not None and hasattr(m, "n_jobs"):
+                m.n_jobs = n_jobs
+
+    @staticmethod
+    def _load_compact(path: str, encoder_path: str):
+        """(modelo, decodificador de etiquetas) desde un directorio exportado, o (None, None)."""
+        if not CompactForest.exists(path):
+            return None, None
+        try:
+            model = CompactForest(path)
+            encoder = model.labels
+            if encoder is None and os.path.exists(encoder_path):
+                with open(encoder_path, 'rb') as f:
+                    encoder = pickle.load(f)
+            return (model, encoder) if encoder is not None else (None, None)
+        except Exception as e:
+            print(f"No se pudo cargar el modelo compacto {path}: {e}")
+            return None, None
+
+    def predict(self, audio: Union[str, np.ndarray], sr: Optional[int] = None) -> Dict[str, Any]:
+        """Predice instrumento y nota desde una ruta de audio o un array (con su `sr`)."""
+        if isinstance(audio, str):
+            x = self._cached(lambda: file_cache_key(audio, extraction_params(self.sample_rate)),
+                             lambda: extract_features_vector(audio, sample_rate=self.sample_rate))
+        else:
+            if sr is None:
+                raise ValueError("Se requiere sr para predecir desde un array")
+            x = self.features_from_array(audio, sr)
+        return self.predict_features(x)
+
+    def features_from_array(self, audio: np.ndarray, sr: int,
+                            timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """PCM int16 o float a cualquier `sr` → vector de características (sin pasar por disco).
+
+        Con `timings` se suman ahí los ms de cada etapa (`resample` y las de la extracción).
+        """
+        def compute() -> np.ndarray:
+            start = time.perf_counter()
+            y = prepare_audio(audio, sr, sample_rate=self.sample_rate)
+            if timings is not None:
+                timings["resample"] = timings.get("resample", 0.0) + 1000 * (time.perf_counter() - start)
+            return extract_features_vector_from_array(y, self.sample_rate, timings=timings)
+
+        return self._cached(lambda: cache_key(audio, sr, extraction_params(self.sample_rate)), compute)
 
-        result = {"instrument": "Unknown", "note": "Unknown"}
+    def _cached(self, key_fn: Callable[[], str], compute: Callable[[], np.ndarray]) -> np.ndarray:
+        if self.feature_cache is None or not self.feature_cache.enabled:
+            return compute()
+        return self.feature_cache.get_or_compute(key_fn(), compute)
+
+    def predict_batch(self, audios: Sequence[np.ndarray], sr: int) -> List[Dict[str, Any]]:
+        """Predice varios audios (arrays a la misma `sr`) con una sola pasada de cada modelo.
+
+        Útil para re-puntuar grabaciones archivadas tras actualizar el modelo (con
+        `feature_cache` solo se extraen los audios nuevos).
+        """
+        if not audios:
+            return []
+        return self.predict_features_batch(self.features_batch(audios, sr))
+
+    def features_batch(self, audios: Sequence[np.ndarray], sr: int) -> np.ndarray:
+        """Matriz de características de varios audios; los de igual duración se extraen juntos."""
+        X = np.zeros((len(audios), feature_dim()), dtype=np.float32)
+        todo = list(range(len(audios)))
+        keys: Dict[int, str] = {}
+        if self.feature_cache is not None and self.feature_cache.enabled:
+            params = extraction_params(self.sample_rate)
+            keys = {i: cache_key(a, sr, params) for i, a in enumerate(audios)}
+            todo = []
+            for i, key in keys.items():
+                x = self.feature_cache.get(key)
+                if x is None:
+                    todo.append(i)
+                else:
+                    X[i] = x
+        if todo:
+            ys = [prepare_audio(audios[i], sr, sample_rate=self.sample_rate) for i in todo]
+            X[todo] = extract_features_batch(ys, self.sample_rate)
+            for i in todo:
+                if i in keys:
+                    self.feature_cache.put(keys[i], X[i])
+        return X
+
+    def predict_features(self, x: np.ndarray) -> Dict[str, Any]:
+        return self.predict_features_batch(x.reshape(1, -1))[0]
+
+    def predict_features_batch(self, X: np.ndarray) -> List[Dict[str, Any]]:
+        """Clasifica una matriz (n, n_features): un solo `predict_proba` vectorizado por modelo.
+
+        Cada resultado trae `instrument` y `note` ("Unknown" si la probabilidad no llega a
+        `reject_threshold`), `confidence`, las probabilidades por modelo y los top-k candidatos.
+        """
+        X = np.atleast_2d(X)
+        n = X.shape[0]
+        results: List[Dict[str, Any]] = [{"instrument": "Unknown", "note": "Unknown"} for _ in range(n)]
+        if n == 0:
+            return results
 
         # Instrumento
         if self.inst_model is not None and self.inst_encoder is not None:
             try:
-                y_pred = self.inst_model.predict(x2d)
-                label = self.inst_encoder.inverse_transform(y_pred)[0]
-                result["instrument"] = str(label)
-            except Exception:
-                pass
+                self._apply_top_k(results, "instrument", "top_instruments",
+                                  self._top_k(self.inst_model, self.inst_encoder, X))
+            except Exception as e:
+                print(f"⚠ Error en el modelo de instrumento: {e}")
 
         # Nota via modelo o f0
+        note_from_model = False
         if self.note_model is not None and self.note_encoder is not None:
             try:
-                y_note = self.note_model.predict(x2d)
-                note_label = self.note_encoder.inverse_transform(y_note)[0]
-                result["note"] = str(note_label)
-                return result
-            except Exception:
-                pass
+                self._apply_top_k(results, "note", "top_notes", self._top_k(self.note_model, self.note_encoder, X))
+                note_from_model = True
+            except Exception as e:
+                print(f"⚠ Error en el modelo de nota, se estima desde f0: {e}")
 
-        # Fallback: derivar nota desde f0 mean (está en las últimas 2 features)
-        try:
-            f0_mean = float(x[-2])
-            result["note"] = hz_to_note_name(f0_mean)
-        except Exception:
-            result["note"] = "Unknown"
+        if not note_from_model:
+            # Fallback: derivar nota desde f0 mean (está en las últimas 2 features)
+            for result, f0_mean in zip(results, X[:, -2]):
+                try:
+                    result["note"] = hz_to_note_name(float(f0_mean))
+                except Exception:
+                    result["note"] = "Unknown"
+
+        for result in results:
+            result["note_source"] = "model" if note_from_model else "f0"
+            scores = [result[k] for k in ("instrument_confidence", "note_confidence") if k in result]
+            if scores:
+                result["confidence"] = min(scores)
+        return results
+
+    def _top_k(self, model, encoder, X: np.ndarray) -> List[List[Tuple[str, float]]]:
+        """(etiqueta, probabilidad) de los `top_k` candidatos por fila, de un solo recorrido del bosque."""
+        proba = np.asarray(model.predict_proba(X))
+        k = min(self.top_k, proba.shape[1])
+        # Orden estable: ante un empate gana la primera clase, como en `predict` (argmax)
+        order = np.argsort(-proba, axis=1, kind="stable")[:, :k]
+        labels = encoder.inverse_transform(np.asarray(model.classes_)[order].ravel()).reshape(order.shape)
+        return [[(str(label), float(p)) for label, p in zip(row_labels, proba[i, row_order])]
+                for i, (row_labels, row_order) in enumerate(zip(labels, order))]
 
-        return result
+    def _apply_top_k(self, results: List[Dict[str, Any]], key: str, top_key: str,
+                     candidates: List[List[Tuple[str, float]]]) -> None:
+        for result, top in zip(results, candidates):
+            label, probability = top[0]
+            result[key] = label if probability >= self.reject_threshold else "Unknown"
+            result[f"{key}_confidence"] = round(probability, 4)
+            result[top_key] = [{"label": lab, "probability": round(p, 4)} for lab, p in top]
@@ -3,13 +3,18 @@ Entrenamiento en un solo script (compatible con Google Colab) para un modelo Ran
 que clasifica instrumento (piano, guitarra, batería, violín) y nota musical.
 
 - Descarga el dataset de Kaggle (soumendraprasad/musical-instruments-sound-dataset) con kagglehub
-- Extrae características con librosa
+- Extrae características con model/feature_extraction.py (la misma implementación que usa la
+  API, sin copias locales) en un pool de procesos, por lotes, guardándolas en un
+  almacén en disco (model/feature_store.py): una ejecución interrumpida se reanuda y reentrenar
+  no vuelve a extraer
 - Entrena RandomForest para instrumento y otro para nota (nota derivada por f0 si no existe en nombre)
-- Guarda los artefactos en ./model_artifacts/*.pkl
+- Guarda los artefactos en ./model_artifacts/*.pkl y su versión compacta (model/compact_forest.py)
+  en ./model_artifacts/*_compact/, que es la que carga la API
 """
 import os
 import sys
 import pickle
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from typing import List, Tuple, Dict, Optional
 
 # Instalar dependencias automáticamente si estamos en Colab
@@ -47,63 +52,14 @@ except Exception as e:
     print("kagglehub no disponible. Asegúrate de instalarlo si deseas descargar el dataset automáticamente.")
     kagglehub = None  # type: ignore
 
+# Raíz del repo en el path para importar el paquete `model` al ejecutar este archivo como script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model.feature_extraction import (extract_features_batch, extraction_params, feature_dim,  # noqa: E402
+                                      hz_to_note_name)
+from model.compact_forest import export_forest  # noqa: E402
+from model.feature_store import STATUS_ERROR, STATUS_OK, STATUS_SHORT, FeatureStore  # noqa: E402
 
-def extract_features_vector_from_array(y: np.ndarray, sr: int = 16000,
-                                       n_mfcc: int = 13, n_fft: int = 2048, hop_length: int = 512) -> np.ndarray:
-    if y.size == 0:
-        return np.zeros(2*n_mfcc + 2*12 + 2*5 + 2, dtype=np.float32)
-
-    feats: List[float] = []
-
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
-    feats.extend(np.mean(mfcc, axis=1))
-    feats.extend(np.std(mfcc, axis=1))
-
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    feats.extend(np.mean(chroma, axis=1))
-    feats.extend(np.std(chroma, axis=1))
-
-    spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)
-    zcr = librosa.feature.zero_crossing_rate(y=y, hop_length=hop_length)
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)
-
-    feats.extend([float(np.mean(spectral_centroid)), float(np.std(spectral_centroid))])
-    feats.extend([float(np.mean(spectral_rolloff)), float(np.std(spectral_rolloff))])
-    feats.extend([float(np.mean(spectral_bandwidth)), float(np.std(spectral_bandwidth))])
-    feats.extend([float(np.mean(zcr)), float(np.std(zcr))])
-    feats.extend([float(np.mean(rms)), float(np.std(rms))])
-
-    # f0
-    f0 = librosa.yin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr)
-    f0_valid = f0[f0 > 0]
-    if f0_valid.size > 0:
-        feats.extend([float(np.mean(f0_valid)), float(np.std(f0_valid))])
-    else:
-        feats.extend([0.0, 0.0])
-
-    return np.asarray(feats, dtype=np.float32)
-
-
-def hz_to_note_name(freq: float) -> str:
-    if freq <= 0:
-        return "Unknown"
-    try:
-        note_number = librosa.hz_to_midi(freq)
-        return str(librosa.midi_to_note(int(round(note_number))))
-    except Exception:
-        return "Unknown"
-
-
-def hz_to_note_name(freq: float) -> str:
-    if freq <= 0:
-        return "Unknown"
-    try:
-        note_number = librosa.hz_to_midi(freq)
-        return str(librosa.midi_to_note(int(round(note_number))))
-    except Exception:
-        return "Unknown"
+FEATURE_DIM = feature_dim()
 
 
 def derive_note_from_filename(path: str) -> Optional[str]:
@@ -150,6 +106,121 @@ def map_instrument(path: str) -> Optional[str]:
     return None
 
 
+def _extract_chunk(paths: List[str], sr: int) -> List[Tuple[str, int, np.ndarray, str]]:
+    """Trabajo de un proceso del pool: carga y extrae un lote de archivos.
+
+    Devuelve (ruta, estado, características, error) por archivo; los fallos se reportan
+    en lugar de descartarse en silencio.
+    """
+    results = []
+    loaded: List[Tuple[int, np.ndarray]] = []
+    empty = np.zeros(FEATURE_DIM, dtype=np.float32)
+    for path in paths:
+        try:
+            y, _ = librosa.load(path, sr=sr, mono=True)
+            if y.size < sr // 2:  # al menos 0.5s
+                results.append((path, STATUS_SHORT, empty, ""))
+                continue
+            loaded.append((len(results), y))
+            results.append((path, STATUS_OK, empty, ""))
+        except Exception as e:
+            results.append((path, STATUS_ERROR, empty, f"{type(e).__name__}: {e}"))
+
+    # Clips de igual duración comparten STFT/MFCC vectorizados
+    try:
+        X = extract_features_batch([y for _, y in loaded], sr)
+        for (i, _), x in zip(loaded, X):
+            results[i] = (results[i][0], STATUS_OK, x, "")
+    except Exception as e:
+        for i, _ in loaded:
+            results[i] = (results[i][0], STATUS_ERROR, empty, f"{type(e).__name__}: {e}")
+    return results
+
+
+def extract_dataset(files_by_class: Dict[str, List[str]], dataset_dir: str, store: FeatureStore,
+                    sr: int, max_per_class: int, workers: int, chunk_size: int) -> Dict[str, List[str]]:
+    """Extrae (en paralelo) lo necesario para cubrir `max_per_class` por clase.
+
+    Los candidatos de cada clase se recorren en orden de ruta y se envían por lotes solo
+    mientras las muestras válidas más las pendientes no alcanzan la cuota; lo ya guardado en
+    `store` no se vuelve a extraer. Devuelve, por clase, los primeros `max_per_class` archivos
+    válidos en ese orden: el resultado es el mismo con cualquier número de workers y al
+    reanudar una ejecución interrumpida.
+    """
+    def key(path: str) -> str:
+        return os.path.relpath(path, dataset_dir)
+
+    pos = {inst: 0 for inst in files_by_class}
+    valid = {inst: 0 for inst in files_by_class}
+    in_flight = {inst: 0 for inst in files_by_class}
+    pending = {}
+    errors: List[str] = []
+    executor: Optional[ProcessPoolExecutor] = None
+    expected = sum(min(max_per_class, len(c)) for c in files_by_class.values())
+    progress = tqdm(total=expected, desc="Extrayendo características")
+
+    def refill(inst: str) -> None:
+        nonlocal executor
+        candidates = files_by_class[inst]
+        while valid[inst] + in_flight[inst] < max_per_class and pos[inst] < len(candidates):
+            chunk: List[str] = []
+            while len(chunk) < chunk_size and pos[inst] < len(candidates):
+                path = candidates[pos[inst]]
+                pos[inst] += 1
+                entry = store.get(key(path))
+                if entry is None:
+                    chunk.append(path)
+                elif entry[0] == STATUS_OK and valid[inst] < max_per_class:
+                    valid[inst] += 1
+                    progress.update(1)
+                if valid[inst] + in_flight[inst] + len(chunk) >= max_per_class:
+                    break
+            if not chunk:
+                continue
+            if executor is None:
+                executor = ProcessPoolExecutor(max_workers=workers)
+            pending[executor.submit(_extract_chunk, chunk, sr)] = inst
+            in_flight[inst] += len(chunk)
+
+    try:
+        for inst in files_by_class:
+            refill(inst)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                inst = pending.pop(future)
+                results = future.result()
+                store.add_shard([key(p) for p, _, _, _ in results], [st for _, st, _, _ in results],
+                                np.vstack([x for _, _, x, _ in results]))
+                in_flight[inst] -= len(results)
+                ok = sum(1 for _, st, _, _ in results if st == STATUS_OK)
+                progress.update(max(0, min(ok, max_per_class - valid[inst])))
+                valid[inst] += ok
+                errors.extend(f"{key(p)}: {err}" for p, st, _, err in results if st == STATUS_ERROR)
+                refill(inst)
+    finally:
+        progress.close()
+        if executor is not None:
+            executor.shutdown()
+
+    if errors:
+        print(f"Archivos con error de lectura/extracción: {len(errors)}")
+        for line in errors[:5]:
+            print("  ", line)
+
+    selected: Dict[str, List[str]] = {}
+    for inst, candidates in files_by_class.items():
+        chosen: List[str] = []
+        for path in candidates:
+            if len(chosen) >= max_per_class:
+                break
+            entry = store.get(key(path))
+            if entry is not None and entry[0] == STATUS_OK:
+                chosen.append(path)
+        selected[inst] = chosen
+    return selected
+
+
 def main():
     sr = 16000
     out_dir = os.path.join(os.getcwd(), "model_artifacts")
@@ -180,37 +251,41 @@ def main():
     y_note: List[str] = []
 
     max_per_class = int(os.getenv("MAX_PER_CLASS", "400"))  # para mantener razonable
-    counts: Dict[str, int] = {"piano": 0, "guitarra": 0, "bateria": 0, "violin": 0}
-
-    for path in tqdm(all_files, desc="Extrayendo características"):
+    files_by_class: Dict[str, List[str]] = {"piano": [], "guitarra": [], "bateria": [], "violin": []}
+    for path in sorted(all_files):
         inst = map_instrument(path)
-        if inst is None:
-            continue
-        if counts[inst] >= max_per_class:
-            continue
-
-        try:
-            y, _ = librosa.load(path, sr=sr, mono=True)
-            if y.size < sr // 2:  # al menos 0.5s
-                continue
-            feats = extract_features_vector_from_array(y, sr)
-            X_inst.append(feats)
-            y_inst.append(inst)
-
-            # Nota para entrenamiento: 1) intentar por nombre 2) si no, por f0
-            note = derive_note_from_filename(path)
-            if note is None:
-                f0 = feats[-2]  # mean f0
-                note = hz_to_note_name(float(f0))
-            X_note.append(feats)
-            y_note.append(note)
+        if inst is not None:
+            files_by_class[inst].append(path)
+
+    # Almacén de características: reanuda extracciones interrumpidas y evita repetirlas al reentrenar
+    store = FeatureStore(
+        os.getenv("FEATURE_STORE_DIR", os.path.join(os.getcwd(), "feature_store")),
+        params=dict(extraction_params(sr), min_seconds=0.5),
+        dim=FEATURE_DIM,
+    )
+    print(f"Características ya almacenadas: {len(store)} ({store.dir})")
+    selected = extract_dataset(
+        files_by_class, dataset_dir, store, sr, max_per_class,
+        workers=int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1))),
+        chunk_size=int(os.getenv("EXTRACT_CHUNK_SIZE", "16")),
+    )
+
+    for path in sorted(p for paths in selected.values() for p in paths):
+        inst = map_instrument(path)
+        feats = store.get(os.path.relpath(path, dataset_dir))[1]
+        X_inst.append(feats)
+        y_inst.append(inst)
 
-            counts[inst] += 1
-        except Exception:
-            continue
+        # Nota para entrenamiento: 1) intentar por nombre 2) si no, por f0
+        note = derive_note_from_filename(path)
+        if note is None:
+            f0 = feats[-2]  # mean f0
+            note = hz_to_note_name(float(f0))
+        X_note.append(feats)
+        y_note.append(note)
 
-    X_inst_arr = np.vstack(X_inst) if X_inst else np.empty((0, 2*13+2*12+2*5+2), dtype=np.float32)
-    X_note_arr = np.vstack(X_note) if X_note else np.empty((0, 2*13+2*12+2*5+2), dtype=np.float32)
+    X_inst_arr = np.vstack(X_inst) if X_inst else np.empty((0, FEATURE_DIM), dtype=np.float32)
+    X_note_arr = np.vstack(X_note) if X_note else np.empty((0, FEATURE_DIM), dtype=np.float32)
 
     print("Muestras instrumento:", len(y_inst))
     print("Muestras nota:", len(y_note))
@@ -269,12 +344,14 @@ def main():
             pickle.dump(inst_model, f)
         with open(os.path.join(out_dir, "instrument_encoder.pkl"), 'wb') as f:
             pickle.dump(inst_le, f)
+        export_forest(inst_model, os.path.join(out_dir, "instrument_rf_compact"), labels=inst_le.classes_)
 
     if note_model is not None:
         with open(os.path.join(out_dir, "note_rf.pkl"), 'wb') as f:
             pickle.dump(note_model, f)
         with open(os.path.join(out_dir, "note_encoder.pkl"), 'wb') as f:
             pickle.dump(note_le, f)
+        export_forest(note_model, os.path.join(out_dir, "note_rf_compact"), labels=note_le.classes_)
 
     print("Artefactos guardados en:", out_dir)
 
@@ -0,0 +1,3 @@
+"""
+Componentes de la API (sesiones de grabación, utilidades de audio, etc.) usados por main.py.
+"""
@@ -0,0 +1,86 @@
+"""
+Codificación del audio archivado en Blob Storage.
+
+`ARCHIVE_FORMAT` elige el formato del blob:
+- `flac` (default): FLAC sin pérdida a la frecuencia original (32 kHz) vía `soundfile`.
+- `flac16k`: FLAC remuestreado a 16 kHz, la `sample_rate` del modelo. El band-pass ya deja
+  la señal por debajo de 3,4 kHz, así que 16 kHz no pierde información útil.
+- `wav16k`: PCM 16-bit a 16 kHz (sin dependencias de códec).
+- `wav`: PCM 16-bit a la frecuencia original (comportamiento anterior).
+
+Si `soundfile` no está disponible, los formatos FLAC caen a su equivalente WAV.
+
+Junto a cada audio se sube `<nombre>.json` con los metadatos de la detección (dispositivo,
+instante, formato, estadísticas de humedad y predicción), así el blob se puede
+interpretar sin consultar PostgreSQL.
+
+Comparativa tiempo de codificación vs tamaño: `python bench/bench_archive.py`.
+"""
+import io
+import json
+import os
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from .audio import wav_bytes
+from .lazy import lazy_import, module_available
+
+soxr = lazy_import("soxr")
+
+ARCHIVE_FORMATS = ("flac", "flac16k", "wav16k", "wav")
+ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "flac").lower()
+ARCHIVE_SAMPLE_RATE = 16000
+
+SOUNDFILE_AVAILABLE = module_available("soundfile")
+
+
+class EncodedAudio(NamedTuple):
+    data: bytes
+    extension: str
+    content_type: str
+    sample_rate: int
+    format: str
+
+
+def resample_pcm16(audio: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    """Remuestrea PCM int16 (soxr HQ, el mismo remuestreador que usa la extracción)."""
+    if sr == target_sr:
+        return np.asarray(audio, dtype=np.int16)
+    y = soxr.resample(np.asarray(audio, dtype=np.float32), sr, target_sr, quality="HQ")
+    return np.clip(np.round(y), -32768, 32767).astype(np.int16)
+
+
+def flac_bytes(audio: np.ndarray, sr: int) -> bytes:
+    import soundfile as sf
+    buf = io.BytesIO()
+    sf.write(buf, np.ascontiguousarray(audio, dtype=np.int16), sr, format="FLAC", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def encode_archive(audio: np.ndarray, sr: int, fmt: Optional[str] = None) -> EncodedAudio:
+    """Codifica PCM int16 en el formato de archivado (`ARCHIVE_FORMAT` si no se indica)."""
+    fmt = (fmt or ARCHIVE_FORMAT).lower()
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"ARCHIVE_FORMAT inválido: {fmt!r} (opciones: {', '.join(ARCHIVE_FORMATS)})")
+    if fmt.startswith("flac") and not SOUNDFILE_AVAILABLE:
+        fmt = fmt.replace("flac", "wav")
+    out_sr = ARCHIVE_SAMPLE_RATE if fmt.endswith("16k") else sr
+    pcm = resample_pcm16(audio, sr, out_sr)
+    if fmt.startswith("flac"):
+        return EncodedAudio(flac_bytes(pcm, out_sr), "flac", "audio/flac", out_sr, fmt)
+    return EncodedAudio(wav_bytes(pcm, out_sr), "wav", "audio/wav", out_sr, fmt)
+
+
+def archive_metadata(encoded: EncodedAudio, n_samples: int, sr: int, **fields: Any) -> bytes:
+    """Sidecar JSON del audio archivado; `fields` agrega dispositivo, sensores, predicción, etc."""
+    meta: Dict[str, Any] = {
+        "format": encoded.format,
+        "content_type": encoded.content_type,
+        "sample_rate": encoded.sample_rate,
+        "source_sample_rate": sr,
+        "duration_s": round(n_samples / sr, 3),
+        "bytes": len(encoded.data),
+        **fields,
+    }
+    return json.dumps(meta, ensure_ascii=False, default=str).encode("utf-8")
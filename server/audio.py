@@ -0,0 +1,33 @@
+"""
+Utilidades de audio en memoria para la API: PCM 16-bit → WAV (solo al archivar).
+
+El filtro band-pass está en `filters`; se reexporta aquí por compatibilidad.
+"""
+import io
+import wave
+
+import numpy as np
+
+from .filters import BANDPASS_HIGH_HZ, BANDPASS_LOW_HZ, bandpass_pcm16  # noqa: F401
+
+
+def pcm16_from_bytes(raw_data: bytes) -> np.ndarray:
+    """Vista int16 (sin copia) del PCM little-endian recibido del ESP32."""
+    usable = len(raw_data) - (len(raw_data) % 2)
+    return np.frombuffer(raw_data, dtype=np.int16, count=usable // 2)
+
+
+def wav_bytes(audio: np.ndarray, sr: int, num_channels: int = 1) -> bytes:
+    """Codifica PCM int16 como WAV en memoria."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf_out:
+        wf_out.setnchannels(num_channels)
+        wf_out.setsampwidth(2)
+        wf_out.setframerate(sr)
+        wf_out.writeframes(np.ascontiguousarray(audio, dtype=np.int16).tobytes())
+    return buf.getvalue()
+
+
+def write_wav(path: str, audio: np.ndarray, sr: int) -> None:
+    with open(path, "wb") as f:
+        f.write(wav_bytes(audio, sr))
@@ -0,0 +1,60 @@
+"""
+Micro-batching de predicciones.
+
+Las peticiones concurrentes de `/finalize_wav` dejan su vector de características en una
+cola; en cuanto se juntan `BATCH_MAX_ITEMS` vectores o pasan `BATCH_MAX_WAIT_MS` desde el
+primero, se hace una sola llamada vectorizada a los modelos y cada petición recibe su fila.
+Un `predict` de RandomForest sobre 32 filas cuesta casi lo mismo que sobre una.
+
+Variables de entorno (opcional):
+- BATCH_MAX_ITEMS (default: 32; 1 desactiva el batching)
+- BATCH_MAX_WAIT_MS (default: 10)
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+BatchPredictFn = Callable[[np.ndarray], Awaitable[List[dict]]]
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch: BatchPredictFn, max_items: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None) -> None:
+        self._predict_batch = predict_batch
+        self.max_items = max(1, max_items or int(os.getenv("BATCH_MAX_ITEMS", "32")))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("BATCH_MAX_WAIT_MS", "10"))) / 1000
+        self._items: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def predict(self, x: np.ndarray) -> dict:
+        """Encola un vector de características y espera la predicción de su lote."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append((x, future))
+        if len(self._items) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if items:
+            asyncio.ensure_future(self._run(items))
+
+    async def _run(self, items: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+        try:
+            results = await self._predict_batch(np.vstack([x for x, _ in items]))
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
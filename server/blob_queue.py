@@ -0,0 +1,300 @@
+"""
+Subida de audio archivado en segundo plano, con cola acotada, reintentos y spill a disco.
+
+`finalize_wav` responde apenas tiene la predicción; el audio codificado en memoria se
+entrega a `BlobUploader.submit()`, que nunca bloquea:
+- la cola en memoria tiene `BLOB_QUEUE_SIZE` lugares; si está llena el blob se escribe en
+  `BLOB_SPILL_DIR` y se sube cuando la cola tiene lugar (también tras reiniciar el proceso);
+- `BLOB_WORKERS` hilos suben en paralelo (límite de concurrencia hacia Storage);
+- cada subida se reintenta con backoff exponencial (`BLOB_MAX_RETRIES`); si sigue fallando
+  va al spill y se vuelve a intentar pasados `BLOB_SPILL_RETRY_SECONDS`. Si no hay
+  contenedor (Azure no configurado o su inicialización falló) no se reintenta: va directo al spill.
+
+`submit(..., on_stored=fn)` llama a `fn(True)` cuando el blob quedó subido o guardado en el
+spill (se subirá tarde o temprano) y `fn(False)` si se descartó; `main.py` lo usa para que
+`detections.audio_ref` no apunte a un blob que nunca se va a subir.
+
+Destino: el contenedor de Azure Blob (también sirve el emulador Azurite con su connection
+string) o, con `BLOB_LOCAL_DIR`, un directorio local con la misma interfaz `upload_blob`.
+
+Variables de entorno:
+- BLOB_QUEUE_SIZE (default: 64), BLOB_WORKERS (default: 2), BLOB_MAX_RETRIES (default: 4)
+- BLOB_SPILL_DIR (default: ./blob_spill), BLOB_SPILL_RETRY_SECONDS (default: 30)
+- BLOB_LOCAL_DIR (opcional): sustituye a Azure Blob por el sistema de archivos
+"""
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from .metrics import span
+
+BLOB_QUEUE_SIZE = int(os.getenv("BLOB_QUEUE_SIZE", "64"))
+BLOB_WORKERS = int(os.getenv("BLOB_WORKERS", "2"))
+BLOB_MAX_RETRIES = int(os.getenv("BLOB_MAX_RETRIES", "4"))
+BLOB_SPILL_DIR = os.getenv("BLOB_SPILL_DIR", "blob_spill")
+BLOB_SPILL_RETRY_SECONDS = float(os.getenv("BLOB_SPILL_RETRY_SECONDS", "30"))
+BLOB_LOCAL_DIR = os.getenv("BLOB_LOCAL_DIR")
+
+
+class LocalBlobContainer:
+    """Sustituto de `ContainerClient` que guarda los blobs como archivos (pruebas y desarrollo)."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def upload_blob(self, name: str, data, overwrite: bool = False, **kwargs) -> None:
+        path = os.path.join(self.root, *name.split("/"))
+        if not overwrite and os.path.exists(path):
+            raise FileExistsError(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data if isinstance(data, (bytes, bytearray, memoryview)) else data.read())
+        os.replace(tmp, path)
+
+
+def _content_settings(content_type: Optional[str]) -> Dict[str, object]:
+    """`content_settings` para `upload_blob` (solo si el SDK de Azure está instalado)."""
+    if not content_type:
+        return {}
+    try:
+        from azure.storage.blob import ContentSettings  # type: ignore
+    except ImportError:
+        return {}
+    return {"content_settings": ContentSettings(content_type=content_type)}
+
+
+def _notify(on_stored: Optional[Callable[[bool], None]], stored: bool) -> None:
+    if on_stored is None:
+        return
+    try:
+        on_stored(stored)
+    except Exception as e:
+        print(f"⚠ Error en el aviso de subida: {e}")
+
+
+class _Upload(NamedTuple):
+    name: str
+    data: bytes
+    content_type: Optional[str]
+    spill_path: Optional[str]
+    on_stored: Optional[Callable[[bool], None]] = None
+
+
+class BlobUploader:
+    def __init__(self, container_factory: Callable[[], object], max_queue: int = BLOB_QUEUE_SIZE,
+                 workers: int = BLOB_WORKERS, max_retries: int = BLOB_MAX_RETRIES,
+                 spill_dir: Optional[str] = BLOB_SPILL_DIR,
+                 spill_retry_seconds: float = BLOB_SPILL_RETRY_SECONDS, backoff: float = 0.5) -> None:
+        # La fábrica se llama en los workers: crear el cliente de Azure no retrasa la respuesta
+        self._container_factory = container_factory
+        self._queue: "queue.Queue[Optional[_Upload]]" = queue.Queue(maxsize=max(1, max_queue))
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.spill_dir = spill_dir
+        self.spill_retry_seconds = spill_retry_seconds
+        self.backoff = backoff
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._inflight_spills: Set[str] = set()
+        self._next_spill_scan = 0.0
+        self._stopping = False
+        self.uploaded = 0
+        self.retries = 0
+        self.failed = 0
+        self.unavailable = 0  # blobs que no se intentaron subir por falta de contenedor
+        self.spilled = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"blob-upload-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, name: str, data: bytes, content_type: Optional[str] = None,
+               on_stored: Optional[Callable[[bool], None]] = None) -> bool:
+        """Encola una subida sin bloquear. False si no cupo en la cola ni en el spill.
+
+        `on_stored(durable)` se llama una vez, desde un worker (o aquí mismo si la cola está
+        llena), con True si el blob se subió o quedó en el spill y False si se descartó.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(_Upload(name, bytes(data), content_type, None, on_stored))
+            return True
+        except queue.Full:
+            stored = self._spill(name, data, content_type) is not None
+            _notify(on_stored, stored)
+            return stored
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def spilled_pending(self) -> int:
+        if not self.spill_dir:
+            return 0
+        return len(glob.glob(os.path.join(self.spill_dir, "*.json")))
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self.pending, "spilled_pending": self.spilled_pending(), "uploaded": self.uploaded,
+                "retries": self.retries, "failed": self.failed, "unavailable": self.unavailable, "spilled": self.spilled, "dropped": self.dropped}
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Al apagar: espera a vaciar la cola hasta `timeout`; lo que queda se pasa al spill."""
+        deadline = time.monotonic() + timeout
+        while self._threads and not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping = True
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item.spill_path is None:
+                _notify(item.on_stored, self._spill(item.name, item.data, item.content_type) is not None)
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout=max(0.1, deadline - time.monotonic()))
+        self._threads = []
+
+    # -----------------------------
+    #   WORKERS
+    # -----------------------------
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping:
+                    return
+                self._refill_from_spill()
+                continue
+            if item is None:
+                return
+            self._upload(item)
+            # Con tráfico constante la cola nunca queda 0,5 s vacía: si hay lugar, drenar el spill
+            # también aquí (hasta la mitad de la cola, para no desplazar subidas nuevas al spill)
+            self._refill_from_spill(limit=max(1, self._queue.maxsize // 2))
+
+    def _upload(self, item: _Upload) -> None:
+        kwargs = _content_settings(item.content_type)
+        # Sin contenedor (Azure no configurado o su inicialización falló) reintentar con backoff
+        # no cambia nada: el blob pasa directo al spill y no ocupa al worker
+        try:
+            container = self._container_factory()
+        except Exception as e:
+            print(f"⚠ Contenedor de blobs no disponible: {e}")
+            container = None
+        if container is None:
+            self.unavailable += 1
+            self._give_up(item, f"⚠ Contenedor de blobs no disponible, audio descartado: {item.name}")
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("blob_upload"):
+                    container.upload_blob(name=item.name, data=item.data, overwrite=True, **kwargs)
+                self.uploaded += 1
+                print(f"✔ Audio subido a Blob Storage: {item.name}")
+                if item.spill_path:
+                    self._remove_spill(item.spill_path)
+                _notify(item.on_stored, True)
+                return
+            except Exception as e:
+                print(f"⚠ Error al subir {item.name} (intento {attempt + 1}): {e}")
+                if attempt < self.max_retries and not self._stopping:
+                    self.retries += 1
+                    # Backoff exponencial con jitter: los workers no reintentan todos a la vez
+                    time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        self.failed += 1
+        self._give_up(item, f"⚠ Audio descartado tras {self.max_retries + 1} intentos: {item.name}")
+
+    def _give_up(self, item: _Upload, dropped_message: str) -> None:
+        """Deja el blob en el spill para el próximo barrido (o lo descarta si no hay spill)."""
+        # Storage está fallando: no volver a leer el spill antes de `spill_retry_seconds`
+        self._next_spill_scan = time.monotonic() + self.spill_retry_seconds
+        if item.spill_path:
+            with self._lock:
+                self._inflight_spills.discard(item.spill_path)
+            return
+        stored = self._spill(item.name, item.data, item.content_type) is not None
+        if not stored:
+            print(dropped_message)
+        _notify(item.on_stored, stored)
+
+    # -----------------------------
+    #   SPILL A DISCO
+    # -----------------------------
+    def _spill(self, name: str, data: bytes, content_type: Optional[str]) -> Optional[str]:
+        if not self.spill_dir:
+            self.dropped += 1
+            print(f"⚠ Cola de subida llena, audio descartado: {name}")
+            return None
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            base = os.path.join(self.spill_dir, f"{time.time_ns()}_{uuid.uuid4().hex[:8]}")
+            with open(f"{base}.bin", "wb") as f:
+                f.write(data)
+            # El .json se escribe al final: un spill sin .json está incompleto y se ignora
+            with open(f"{base}.json.tmp", "w") as f:
+                json.dump({"name": name, "content_type": content_type}, f)
+            os.replace(f"{base}.json.tmp", f"{base}.json")
+            self.spilled += 1
+            return f"{base}.json"
+        except Exception as e:
+            self.dropped += 1
+            print(f"⚠ No se pudo guardar el audio en {self.spill_dir}: {e}")
+            return None
+
+    def _refill_from_spill(self, limit: Optional[int] = None) -> None:
+        """Reencola los blobs guardados en disco (más viejos primero) hasta `limit` en cola."""
+        limit = self._queue.maxsize if limit is None else limit
+        if (not self.spill_dir or self._stopping or time.monotonic() < self._next_spill_scan
+                or self._queue.qsize() >= limit):
+            return
+        self._next_spill_scan = time.monotonic() + self.spill_retry_seconds
+        for meta_path in sorted(glob.glob(os.path.join(self.spill_dir, "*.json"))):
+            if self._queue.qsize() >= limit:
+                # Queda trabajo en disco: volver a mirar apenas haya lugar
+                self._next_spill_scan = 0.0
+                return
+            with self._lock:
+                if meta_path in self._inflight_spills:
+                    continue
+                self._inflight_spills.add(meta_path)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                with open(meta_path[:-len(".json")] + ".bin", "rb") as f:
+                    data = f.read()
+                self._queue.put_nowait(_Upload(meta["name"], data, meta.get("content_type"), meta_path))
+            except queue.Full:
+                with self._lock:
+                    self._inflight_spills.discard(meta_path)
+                self._next_spill_scan = 0.0
+                return
+            except Exception as e:
+                print(f"⚠ Spill ilegible ({os.path.basename(meta_path)}): {e}")
+                with self._lock:
+                    self._inflight_spills.discard(meta_path)
+
+    def _remove_spill(self, meta_path: str) -> None:
+        for path in (meta_path, meta_path[:-len(".json")] + ".bin"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._inflight_spills.discard(meta_path)
@@ -0,0 +1,554 @@
+"""
+PostgreSQL: pool de conexiones thread-safe y buffer de inserciones de detecciones.
+
+- `Database`: `ThreadedConnectionPool` creado en el primer uso; el esquema (`CREATE TABLE IF
+  NOT EXISTS` + migraciones idempotentes) se ejecuta una sola vez por proceso.
+- `DetectionBuffer`: `finalize_wav` solo encola la fila; un hilo la inserta junto con las
+  demás con `execute_values` cuando se juntan `DB_FLUSH_ROWS` filas o pasan
+  `DB_FLUSH_INTERVAL_MS`. Si la inserción falla se reintenta con backoff
+  (`DB_MAX_RETRIES`); si sigue fallando las filas vuelven al buffer (hasta `DB_BUFFER_MAX`).
+
+Esquema de `public.detections`: una fila por detección con dispositivo, instante
+(`recorded_at`), instrumento, nota, humedad, confianza y referencia al audio archivado.
+Índices `(recorded_at, id)` y `(device_id, recorded_at, id)`: el historial se pagina por
+cursor (keyset, sin OFFSET) y las consultas por dispositivo o rango de tiempo no recorren la
+tabla. Tablas creadas con la versión anterior se migran al arrancar (`humidity_avg` →
+`humidity`, columnas nuevas con valores por defecto). Con `DB_PARTITION_MONTHLY=1`, una
+instalación nueva crea `detections` particionada por mes (más una partición DEFAULT) y las
+particiones de los próximos meses se crean solas.
+
+Resumen para `/sensor_data` y `/detections/summary`: cada flush suma, en la misma
+transacción, las detecciones del lote a `public.detection_counts` (una fila por hora,
+dispositivo, instrumento, nota y rango de humedad). Su costo depende de los valores distintos
+y no del tamaño de `detections`. Si la tabla de contadores está vacía al arrancar se
+reconstruye desde `detections` (p. ej. tras cambiar `HUMIDITY_BUCKET` y vaciarla).
+
+Variables de entorno:
+- DATABASE_URL o AZURE_POSTGRESQL_CONNECTION_STRING, o PGHOST/PGDATABASE/PGUSER/PGPASSWORD/PGPORT
+- PGSSLMODE (default: require; `disable` para un Postgres local)
+- DB_POOL_MIN (default: 1), DB_POOL_MAX (default: 4)
+- DB_FLUSH_ROWS (default: 50), DB_FLUSH_INTERVAL_MS (default: 1000)
+- DB_MAX_RETRIES (default: 3), DB_BUFFER_MAX (default: 10000)
+- HUMIDITY_BUCKET (default: 5): ancho de los rangos de humedad en `detection_counts`
+- DB_PARTITION_MONTHLY (default: 0), DB_PARTITION_AHEAD (default: 2 meses)
+"""
+import base64
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .lazy import module_available
+from .metrics import span
+
+DB_PARTITION_MONTHLY = os.getenv("DB_PARTITION_MONTHLY", "0") == "1"
+DB_PARTITION_AHEAD = int(os.getenv("DB_PARTITION_AHEAD", "2"))
+
+_DETECTION_COLUMNS = """
+        device_id TEXT NOT NULL DEFAULT 'default',
+        recorded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        instrument TEXT,
+        note TEXT,
+        humidity DOUBLE PRECISION,
+        confidence DOUBLE PRECISION,
+        audio_ref TEXT"""
+
+TABLE_SQL = (
+    f"""
+    CREATE TABLE IF NOT EXISTS public.detections (
+        id BIGSERIAL PRIMARY KEY,{_DETECTION_COLUMNS}
+    );
+    """
+)
+
+# La clave primaria de una tabla particionada debe incluir la columna de partición
+PARTITIONED_TABLE_SQL = (
+    f"""
+    CREATE TABLE IF NOT EXISTS public.detections (
+        id BIGSERIAL,{_DETECTION_COLUMNS},
+        PRIMARY KEY (id, recorded_at)
+    ) PARTITION BY RANGE (recorded_at);
+    CREATE TABLE IF NOT EXISTS public.detections_default PARTITION OF public.detections DEFAULT;
+    """
+)
+
+# Migraciones idempotentes desde el esquema anterior (id, instrument, note, humidity_avg):
+# el DDL creaba `humidity_avg` pero las inserciones siempre usaron `humidity`
+MIGRATE_SQL = """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public'
+                   AND table_name = 'detections' AND column_name = 'humidity_avg') THEN
+            IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public'
+                       AND table_name = 'detections' AND column_name = 'humidity') THEN
+                UPDATE public.detections SET humidity = humidity_avg
+                WHERE humidity IS NULL AND humidity_avg IS NOT NULL;
+                ALTER TABLE public.detections DROP COLUMN humidity_avg;
+            ELSE
+                ALTER TABLE public.detections RENAME COLUMN humidity_avg TO humidity;
+            END IF;
+        END IF;
+        -- Contadores sin dispositivo (versión anterior): son derivados, se reconstruyen
+        IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_schema = 'public'
+                   AND table_name = 'detection_counts')
+           AND NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public'
+                           AND table_name = 'detection_counts' AND column_name = 'device_id') THEN
+            DROP TABLE public.detection_counts;
+        END IF;
+    END $$;
+    ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS humidity DOUBLE PRECISION;
+    ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT 'default';
+    ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMPTZ NOT NULL DEFAULT now();
+    ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS confidence DOUBLE PRECISION;
+    ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS audio_ref TEXT;
+    DROP INDEX IF EXISTS public.detections_recorded_at_idx;
+    CREATE INDEX IF NOT EXISTS detections_recorded_at_id_idx ON public.detections (recorded_at, id);
+    CREATE INDEX IF NOT EXISTS detections_device_recorded_at_idx ON public.detections (device_id, recorded_at, id);
+    CREATE TABLE IF NOT EXISTS public.detection_counts (
+        bucket_start TIMESTAMPTZ NOT NULL,
+        device_id TEXT NOT NULL,
+        instrument TEXT NOT NULL,
+        note TEXT NOT NULL,
+        humidity_bucket DOUBLE PRECISION NOT NULL,
+        total BIGINT NOT NULL,
+        PRIMARY KEY (bucket_start, device_id, instrument, note, humidity_bucket)
+    );
+    CREATE INDEX IF NOT EXISTS detection_counts_device_idx ON public.detection_counts (device_id, bucket_start);
+"""
+
+HUMIDITY_BUCKET = float(os.getenv("HUMIDITY_BUCKET", "5"))
+
+# Sin lectura de humedad el rango es NaN (en PostgreSQL NaN = NaN, sirve como clave)
+_BUCKET_SQL = "COALESCE(floor(humidity / %(width)s) * %(width)s, 'NaN')"
+
+BACKFILL_SQL = f"""
+    LOCK TABLE public.detection_counts IN EXCLUSIVE MODE;
+    INSERT INTO public.detection_counts (bucket_start, device_id, instrument, note, humidity_bucket, total)
+    SELECT date_trunc('hour', recorded_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', device_id,
+           COALESCE(instrument, 'Unknown'), COALESCE(note, 'Unknown'), {_BUCKET_SQL}, count(*)
+    FROM public.detections
+    WHERE NOT EXISTS (SELECT 1 FROM public.detection_counts)
+    GROUP BY 1, 2, 3, 4, 5;
+"""
+
+INSERT_SQL = (
+    "INSERT INTO public.detections "
+    "(instrument, note, humidity, recorded_at, device_id, confidence, audio_ref) VALUES %s"
+)
+
+COUNTS_SQL = (
+    "INSERT INTO public.detection_counts (bucket_start, device_id, instrument, note, humidity_bucket, total) "
+    "VALUES %s ON CONFLICT (bucket_start, device_id, instrument, note, humidity_bucket) "
+    "DO UPDATE SET total = detection_counts.total + EXCLUDED.total"
+)
+
+LIST_COLUMNS = ("id", "device_id", "recorded_at", "instrument", "note", "humidity", "confidence", "audio_ref")
+
+
+class Detection(NamedTuple):
+    instrument: str
+    note: str
+    humidity: Optional[float]
+    recorded_at: datetime
+    device_id: str = "default"
+    confidence: Optional[float] = None
+    audio_ref: Optional[str] = None
+
+
+def humidity_bucket(humidity: Optional[float], width: float = HUMIDITY_BUCKET) -> Optional[float]:
+    """Inicio del rango de humedad (None si no hay lectura).
+
+    Misma expresión que `_BUCKET_SQL` (`floor(h / w) * w`): con un ancho fraccionario `//`
+    no coincide (`1.0 // 0.1 == 9.0`, `floor(1.0 / 0.1) == 10`).
+    """
+    if humidity is None or humidity != humidity:
+        return None
+    return float(math.floor(humidity / width) * width)
+
+
+def hour_floor(ts: datetime) -> datetime:
+    """Inicio de la hora (en UTC, igual que `detection_counts.bucket_start`)."""
+    return _to_utc(ts).astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def month_floor(ts: datetime) -> datetime:
+    return hour_floor(ts).replace(day=1, hour=0)
+
+
+def _next_month(ts: datetime) -> datetime:
+    return (ts.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _to_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    """Fechas sin zona horaria se interpretan como UTC."""
+    if ts is None or ts.tzinfo is not None:
+        return ts
+    return ts.replace(tzinfo=timezone.utc)
+
+
+def encode_cursor(recorded_at: datetime, row_id: int) -> str:
+    """Cursor opaco para `/detections`: posición (recorded_at, id) de la última fila devuelta."""
+    return base64.urlsafe_b64encode(f"{recorded_at.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverso de `encode_cursor`; ValueError si el cursor no es válido."""
+    try:
+        ts, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception as e:
+        raise ValueError(f"cursor inválido: {cursor!r}") from e
+
+
+def _filters(column: str, device_id: Optional[str], lo: Optional[datetime],
+             hi: Optional[datetime]) -> Tuple[str, Dict[str, Any]]:
+    """WHERE con solo las condiciones presentes (así el planner usa los índices compuestos)."""
+    clauses, params = [], {}
+    if device_id is not None:
+        clauses.append("device_id = %(device_id)s")
+        params["device_id"] = device_id
+    if lo is not None:
+        clauses.append(f"{column} >= %(lo)s")
+        params["lo"] = lo
+    if hi is not None:
+        clauses.append(f"{column} < %(hi)s")
+        params["hi"] = hi
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def resolve_dsn() -> Optional[str]:
+    """Cadena de conexión desde las variables de entorno (None si no hay configuración)."""
+    # Opción 1: cadena de conexión completa (recomendada)
+    dsn = os.getenv("DATABASE_URL") or os.getenv("AZURE_POSTGRESQL_CONNECTION_STRING")
+    if dsn and dsn.startswith("postgres://"):
+        # Normalizar prefijo para psycopg2
+        dsn = dsn.replace("postgres://", "postgresql://", 1)
+
+    # Opción 2: componentes sueltos
+    if not dsn:
+        host = os.getenv("PGHOST")
+        db = os.getenv("PGDATABASE")
+        user = os.getenv("PGUSER")
+        pwd = os.getenv("PGPASSWORD")
+        port = os.getenv("PGPORT", "5432")
+        if host and db and user and pwd:
+            dsn = f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
+    return dsn
+
+
+class Database:
+    def __init__(self, dsn: Optional[str] = None, partition_monthly: bool = DB_PARTITION_MONTHLY) -> None:
+        self.dsn = dsn if dsn is not None else resolve_dsn()
+        self.partition_monthly = partition_monthly
+        self.available = bool(self.dsn)
+        if self.available:
+            # Solo se comprueba que esté instalado; se importa en la primera conexión
+            if module_available("psycopg2"):
+                print("psycopg2 disponible; inserciones a PostgreSQL habilitadas si la conexión funciona")
+            else:
+                self.available = False
+                print("psycopg2 no disponible")
+        self._pool = None
+        self._lock = threading.Lock()
+        self.partitioned = False
+        # Primer mes sin partición propia (las filas posteriores irían a la partición DEFAULT)
+        self._partitions_until: Optional[datetime] = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool  # type: ignore
+                    # SSL requerido generalmente en Azure
+                    pool = ThreadedConnectionPool(
+                        int(os.getenv("DB_POOL_MIN", "1")), int(os.getenv("DB_POOL_MAX", "4")),
+                        self.dsn, sslmode=os.getenv("PGSSLMODE", "require"),
+                    )
+                    try:
+                        self._ensure_schema(pool)
+                    except Exception:
+                        # Sin esquema no se instala el pool: la próxima conexión reintenta la migración
+                        pool.closeall()
+                        raise
+                    self._pool = pool
+        return self._pool
+
+    def _ensure_schema(self, pool) -> None:
+        """Crea o migra las tablas; si falla (p. ej. `lock_timeout`) propaga el error."""
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                # El ALTER TABLE pide un lock exclusivo: no quedarse esperando detrás de lecturas largas
+                cur.execute("SET LOCAL lock_timeout = '5s'")
+                cur.execute(PARTITIONED_TABLE_SQL if self.partition_monthly else TABLE_SQL)
+                cur.execute(MIGRATE_SQL)
+                cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                            "WHERE partrelid = 'public.detections'::regclass)")
+                self.partitioned = bool(cur.fetchone()[0])
+                if self.partitioned:
+                    self._ensure_partitions(cur, datetime.now(timezone.utc))
+                cur.execute(BACKFILL_SQL, {"width": HUMIDITY_BUCKET})
+            conn.commit()
+        except Exception as e:
+            if not conn.closed:
+                conn.rollback()
+            print(f"⚠ No se pudo crear el esquema en PostgreSQL, se reintentará: {e}")
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def _ensure_partitions(self, cur, until: datetime) -> None:
+        """Particiones mensuales desde el mes actual hasta `DB_PARTITION_AHEAD` meses después de `until`."""
+        month = month_floor(min(until, datetime.now(timezone.utc)))
+        last = month_floor(until)
+        for _ in range(DB_PARTITION_AHEAD):
+            last = _next_month(last)
+        while month <= last:
+            end = _next_month(month)
+            # Falla si la partición DEFAULT ya tiene filas de ese mes: no abortar la transacción
+            cur.execute("SAVEPOINT partition")
+            try:
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS public.detections_{month:%Y_%m} PARTITION OF public.detections "
+                    "FOR VALUES FROM (%s) TO (%s)", (month, end))
+                cur.execute("RELEASE SAVEPOINT partition")
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT partition")
+                print(f"⚠ No se pudo crear la partición detections_{month:%Y_%m}: {e}")
+            month = end
+        self._partitions_until = month
+
+    def _ensure_partitions_for(self, cur, rows: Sequence[Detection]) -> None:
+        latest = max(_to_utc(r.recorded_at) for r in rows)
+        if self._partitions_until is not None and latest >= self._partitions_until:
+            self._ensure_partitions(cur, latest)
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """Conexión del pool; se descarta si quedó rota y se hace rollback si hubo error."""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def insert_detections(self, rows: Sequence[Detection]) -> None:
+        """Inserta el lote y actualiza los contadores por hora en una sola transacción."""
+        from psycopg2.extras import execute_values  # type: ignore
+        counts = Counter(
+            (hour_floor(r.recorded_at), r.device_id, r.instrument, r.note, humidity_bucket(r.humidity))
+            for r in rows
+        )
+        # Orden fijo: dos flush concurrentes bloquean las filas de contadores en el mismo orden
+        count_rows = [(hour, device, instrument, note, float("nan") if bucket is None else bucket, n)
+                      for (hour, device, instrument, note, bucket), n in sorted(counts.items(), key=str)]
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                if self.partitioned:
+                    self._ensure_partitions_for(cur, rows)
+                execute_values(cur, INSERT_SQL, rows, page_size=max(1, len(rows)))
+                execute_values(cur, COUNTS_SQL, count_rows, page_size=max(1, len(count_rows)))
+            conn.commit()
+
+    def list_detections(self, device_id: Optional[str] = None, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, limit: int = 50,
+                        cursor: Optional[str] = None,
+                        max_confidence: Optional[float] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Detecciones más recientes primero, paginadas por cursor (keyset sobre (recorded_at, id)).
+
+        `max_confidence` deja solo las de confianza menor (y las que no la tienen: filas viejas
+        o sin modelo), para volver a procesarlas. Devuelve (filas, cursor de la página
+        siguiente o None si no hay más).
+        """
+        where, params = _filters("recorded_at", device_id, _to_utc(since), _to_utc(until))
+        if max_confidence is not None:
+            params["max_conf"] = max_confidence
+            where += (" AND " if where else " WHERE ") + "(confidence < %(max_conf)s OR confidence IS NULL)"
+        if cursor:
+            params["c_ts"], params["c_id"] = decode_cursor(cursor)
+            where += (" AND " if where else " WHERE ") + "(recorded_at, id) < (%(c_ts)s, %(c_id)s)"
+        params["limit"] = limit + 1
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM public.detections{where} "
+                "ORDER BY recorded_at DESC, id DESC LIMIT %(limit)s", params)
+            rows = cur.fetchall()
+        items = [dict(zip(LIST_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(items[-1]["recorded_at"], items[-1]["id"])
+        return items, next_cursor
+
+    def detection_summary(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          device_id: Optional[str] = None) -> Dict[str, Any]:
+        """Conteos por dispositivo, instrumento, nota y rango de humedad en [since, until).
+
+        Las horas completas salen de `detection_counts`; los extremos que no caen en una
+        hora exacta se cuentan sobre `detections` usando los índices de `recorded_at`.
+        """
+        since, until = _to_utc(since), _to_utc(until)
+        start = since if since is None or since == hour_floor(since) else hour_floor(since) + timedelta(hours=1)
+        end = until if until is None or until == hour_floor(until) else hour_floor(until)
+        ranges: List[Tuple[str, Optional[datetime], Optional[datetime]]] = []
+        if start is not None and end is not None and start >= end:
+            ranges.append(("raw", since, until))
+        else:
+            if since is not None and start != since:
+                ranges.append(("raw", since, start))
+            ranges.append(("counts", start, end))
+            if until is not None and end != until:
+                ranges.append(("raw", end, until))
+
+        devices: Counter = Counter()
+        instruments: Counter = Counter()
+        notes: Counter = Counter()
+        humidities: Counter = Counter()
+        with self.connection() as conn, conn.cursor() as cur:
+            for source, lo, hi in ranges:
+                if source == "counts":
+                    where, params = _filters("bucket_start", device_id, lo, hi)
+                    cur.execute(
+                        "SELECT device_id, instrument, note, humidity_bucket, sum(total) "
+                        f"FROM public.detection_counts{where} GROUP BY 1, 2, 3, 4", params)
+                else:
+                    where, params = _filters("recorded_at", device_id, lo, hi)
+                    params["width"] = HUMIDITY_BUCKET
+                    cur.execute(
+                        "SELECT device_id, COALESCE(instrument, 'Unknown'), COALESCE(note, 'Unknown'), "
+                        f"{_BUCKET_SQL}, count(*) FROM public.detections{where} GROUP BY 1, 2, 3, 4", params)
+                for device, instrument, note, bucket, total in cur.fetchall():
+                    devices[device] += int(total)
+                    instruments[instrument] += int(total)
+                    notes[note] += int(total)
+                    humidities[None if bucket != bucket else bucket] += int(total)
+            where, params = _filters("recorded_at", device_id, since, until)
+            cur.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM public.detections{where} "
+                "ORDER BY recorded_at DESC, id DESC LIMIT 1", params)
+            last = cur.fetchone()
+        return {"total": sum(devices.values()), "devices": dict(devices), "instruments": dict(instruments),
+                "notes": dict(notes), "humidities": dict(humidities),
+                "last": dict(zip(LIST_COLUMNS, last)) if last else None}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+class MemoryDatabase:
+    """Sustituto de `Database` que guarda las detecciones en una lista (pruebas de carga)."""
+
+    available = True
+
+    def __init__(self) -> None:
+        self.rows: List[Detection] = []
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def insert_detections(self, rows: Sequence[Detection]) -> None:
+        with self._lock:
+            self.rows.extend(rows)
+            self.batches += 1
+
+    def close(self) -> None:
+        pass
+
+
+class DetectionBuffer:
+    def __init__(self, db: Database, flush_rows: Optional[int] = None, flush_interval_ms: Optional[float] = None,
+                 max_retries: Optional[int] = None, max_buffer: Optional[int] = None) -> None:
+        self.db = db
+        self.flush_rows = max(1, flush_rows or int(os.getenv("DB_FLUSH_ROWS", "50")))
+        interval = flush_interval_ms if flush_interval_ms is not None else float(os.getenv("DB_FLUSH_INTERVAL_MS", "1000"))
+        self.flush_interval = interval / 1000
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("DB_MAX_RETRIES", "3"))
+        self.max_buffer = max_buffer or int(os.getenv("DB_BUFFER_MAX", "10000"))
+        self._rows: Deque[Detection] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self.inserted = 0
+        self.failed_batches = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: Detection) -> None:
+        """Encola una detección (no bloquea); el hilo de flush la inserta en lote."""
+        if not self.db.available:
+            return
+        with self._lock:
+            if len(self._rows) >= self.max_buffer:
+                self._rows.popleft()
+                self.dropped += 1
+            self._rows.append(row)
+            size = len(self._rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-flush", daemon=True)
+                self._thread.start()
+        if size >= self.flush_rows:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Inserta todo lo encolado; devuelve las filas insertadas."""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._rows)
+                self._rows.clear()
+            if not rows:
+                return 0
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with span("db_insert"):
+                        self.db.insert_detections(rows)
+                    self.inserted += len(rows)
+                    print(f"✔ {len(rows)} registros insertados en PostgreSQL.")
+                    return len(rows)
+                except Exception as e:
+                    print(f"⚠ Error al insertar en PostgreSQL (intento {attempt + 1}): {e}")
+                    if attempt < self.max_retries and not self._stop:
+                        time.sleep(min(0.1 * 2 ** attempt, 5.0))
+            # Sin éxito: las filas vuelven al frente del buffer para el próximo flush
+            self.failed_batches += 1
+            with self._lock:
+                room = self.max_buffer - len(self._rows)
+                keep = rows[-room:] if room > 0 else []
+                self.dropped += len(rows) - len(keep)
+                self._rows.extendleft(reversed(keep))
+            return 0
+
+    def close(self) -> None:
+        """Detiene el hilo y hace un último flush (al apagar la API)."""
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._rows), "inserted": self.inserted,
+                "failed_batches": self.failed_batches, "dropped": self.dropped}
+
+    def _run(self) -> None:
+        while not self._stop:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop:
+                break
+            self.flush()
@@ -0,0 +1,138 @@
+"""
+Protocolo binario de ingesta (`POST /upload_frames`): varias tramas PCM por request.
+
+Cada trama es una cabecera little-endian de 24 bytes seguida del PCM int16:
+
+    offset  tipo     campo
+    0       2s       magic b"AF"
+    2       uint8    versión (1)
+    3       uint8    flags (reservado, 0)
+    4       uint32   seq: número de trama dentro de la grabación, empieza en 0
+    8       uint64   timestamp_ms del dispositivo (millis())
+    16      float32  humedad (%)
+    20      uint32   bytes de PCM que siguen
+
+El cuerpo puede llevar cualquier cantidad de tramas y llegar con `Transfer-Encoding:
+chunked`: `FrameDecoder` las separa a medida que llegan los bytes, aunque una trama quede
+partida entre dos trozos del stream.
+
+`FrameAssembler` reordena por `seq`: las tramas fuera de orden esperan (hasta
+`FRAME_MAX_PENDING`) a que llegue el hueco; las repetidas (reenvíos tras un timeout) se
+descartan. Si el hueco no se llena, las tramas pendientes se entregan igual, en orden, al
+superar el límite o al finalizar la grabación, y el hueco se cuenta en `gaps`.
+"""
+import os
+import struct
+from typing import Dict, List, NamedTuple, Optional
+
+FRAME_MAGIC = b"AF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBIQfI")
+FRAME_MAX_BYTES = int(os.getenv("FRAME_MAX_BYTES", str(64 * 1024)))
+FRAME_MAX_PENDING = int(os.getenv("FRAME_MAX_PENDING", "256"))
+
+
+class Frame(NamedTuple):
+    seq: int
+    timestamp_ms: int
+    humidity: float
+    payload: bytes
+
+
+def encode_frame(seq: int, timestamp_ms: int, humidity: float, payload: bytes) -> bytes:
+    """Serializa una trama (usado por el simulador de dispositivos y por el firmware como referencia)."""
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, seq, timestamp_ms, humidity, len(payload)) + payload
+
+
+class FrameDecoder:
+    """Separa tramas de un stream de bytes que puede llegar en trozos arbitrarios.
+
+    Ante una cabecera inválida deja de decodificar y guarda el motivo en `error`; las tramas
+    anteriores ya se entregaron.
+    """
+
+    def __init__(self, max_frame_bytes: int = FRAME_MAX_BYTES) -> None:
+        self.max_frame_bytes = max_frame_bytes
+        self._buffer = bytearray()
+        self.offset = 0  # bytes del stream ya consumidos
+        self.error: Optional[str] = None
+
+    def feed(self, data: bytes) -> List[Frame]:
+        if self.error:
+            return []
+        self._buffer += data
+        frames: List[Frame] = []
+        pos = 0
+        while len(self._buffer) - pos >= FRAME_HEADER.size:
+            magic, version, _flags, seq, ts, humidity, length = FRAME_HEADER.unpack_from(self._buffer, pos)
+            if magic != FRAME_MAGIC or version != FRAME_VERSION:
+                self.error = f"cabecera inválida en el byte {self.offset + pos}"
+                break
+            if length > self.max_frame_bytes or length % 2:
+                self.error = f"longitud de trama inválida ({length}) en el byte {self.offset + pos}"
+                break
+            end = pos + FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append(Frame(seq, ts, humidity, bytes(self._buffer[pos + FRAME_HEADER.size:end])))
+            pos = end
+        del self._buffer[:pos]
+        self.offset += pos
+        return frames
+
+    @property
+    def incomplete(self) -> bool:
+        """True si quedaron bytes de una trama sin terminar."""
+        return bool(self._buffer)
+
+
+class FrameAssembler:
+    """Reordena tramas por `seq` y descarta duplicados."""
+
+    def __init__(self, max_pending: int = FRAME_MAX_PENDING) -> None:
+        self.max_pending = max_pending
+        self.next_seq = 0
+        self._pending: Dict[int, Frame] = {}
+        self.accepted = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.gaps = 0
+
+    def add(self, frame: Frame) -> List[Frame]:
+        """Registra una trama y devuelve las que ya pueden anexarse, en orden."""
+        if frame.seq < self.next_seq or frame.seq in self._pending:
+            self.duplicates += 1
+            return []
+        self.accepted += 1
+        if frame.seq != self.next_seq:
+            self.out_of_order += 1
+        self._pending[frame.seq] = frame
+        ready = self._drain()
+        if len(self._pending) > self.max_pending:
+            # El hueco no se va a llenar: se salta hasta la trama pendiente más vieja
+            ready += self.flush(limit=len(self._pending) - self.max_pending)
+        return ready
+
+    def flush(self, limit: int = 0) -> List[Frame]:
+        """Entrega las tramas pendientes saltando huecos (todas, o al menos `limit`)."""
+        ready: List[Frame] = []
+        while self._pending and (not limit or len(ready) < limit):
+            self.next_seq = min(self._pending)
+            self.gaps += 1
+            ready += self._drain()
+        return ready
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {"next_seq": self.next_seq, "pending": self.pending, "accepted": self.accepted,
+                "duplicates": self.duplicates, "out_of_order": self.out_of_order, "gaps": self.gaps}
+
+    def _drain(self) -> List[Frame]:
+        ready = []
+        while self.next_seq in self._pending:
+            ready.append(self._pending.pop(self.next_seq))
+            self.next_seq += 1
+        return ready
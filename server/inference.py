@@ -0,0 +1,296 @@
+"""
+Pool de inferencia para `/finalize_wav`.
+
+En modo `process` (default) cada proceso del pool carga `AudioPredictor` una sola vez al
+arrancar y recibe el PCM como buffer serializado; así una sola instancia de la API usa todos
+los núcleos sin que el GIL serialice librosa y el RandomForest. En modo `thread` se usa un
+único predictor compartido dentro del proceso de la API.
+
+Cada análisis tiene dos fases: extracción de características (un trabajo por grabación) y
+clasificación, que se agrupa en micro-lotes (ver batching.MicroBatcher). Si las
+características ya se extrajeron mientras llegaban los chunks (ver streaming), solo se
+cierra el extractor incremental. Antes de extraer se consulta la caché de vectores por hash
+del PCM (ver model.feature_cache): un clip reenviado no se vuelve a analizar. Con
+`VAD_ENABLED=1` (default) un clip sin actividad sobre el audio filtrado se responde como
+silencio (`silent_prediction`) sin extraer ni clasificar (ver model.feature_extraction).
+
+La cola está acotada: si ya hay `INFERENCE_MAX_PENDING` análisis en curso o esperando,
+`reserve()` devuelve False y la API responde 503 en lugar de acumular latencia.
+
+Variables de entorno (opcional):
+- INFERENCE_MODE: `process` (default) o `thread`
+- INFERENCE_WORKERS: tamaño del pool (default: número de CPUs)
+- INFERENCE_MAX_PENDING: análisis admitidos a la vez (default: 4 por worker)
+- INFERENCE_MP_CONTEXT: método de arranque de procesos (default: `spawn`)
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from model.feature_cache import FeatureCache, cache_key
+
+from .audio import pcm16_from_bytes
+from .batching import MicroBatcher
+from .filters import bandpass_pcm16, decimate_pcm16, decimation_factor, filter_params
+from .lazy import lazy_import
+from .metrics import ERRORS, observe_timings, span
+from .streaming import StreamingFeatureExtractor
+
+fe = lazy_import("model.feature_extraction")
+
+# Predictor del proceso actual (uno por worker en modo process)
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def _load_predictor(model_dir: Optional[str] = None):
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            try:
+                from model.predict_runtime import AudioPredictor
+                _predictor = AudioPredictor(model_dir)
+                print(f"Predictor de audio cargado (pid {os.getpid()})")
+            except Exception as e:
+                _predictor = False
+                print(f"No se pudo cargar el predictor: {e}")
+    return _predictor or None
+
+
+def _init_worker(model_dir: Optional[str]) -> None:
+    predictor = _load_predictor(model_dir)
+    if predictor is not None:
+        # Primera predicción en el arranque: compila numba (yin) y calienta cachés de librosa
+        try:
+            rng = np.random.default_rng(0)
+            predictor.predict((rng.standard_normal(16000) * 1000).astype(np.int16), sr=32000)
+        except Exception:
+            pass
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def filter_pcm(raw_data: bytes, sr: int) -> Optional[np.ndarray]:
+    """Filtro band-pass sobre PCM int16; None si no se pudo filtrar."""
+    # PCM en memoria: sin WAV intermedios
+    audio = pcm16_from_bytes(raw_data)
+
+    # --- Aplicar filtro band-pass ---
+    try:
+        clean_audio = bandpass_pcm16(audio, sr)
+        print("✔ Audio filtrado correctamente (300–3400 Hz).")
+        return clean_audio
+    except Exception as e:
+        print(f"⚠ No se pudo filtrar audio: {e}")
+        return None
+
+
+def silent_prediction() -> dict:
+    """Respuesta para un clip sin actividad: no hay instrumento que clasificar."""
+    return {"instrument": "Unknown", "note": "Unknown", "silent": True}
+
+
+def pcm_cache_key(raw_data: bytes, sr: int) -> str:
+    """Clave de caché del PCM crudo: incluye el filtro y los parámetros de extracción."""
+    params = dict(fe.extraction_params(), **filter_params())
+    if fe.vad_enabled():
+        # Un clip cacheado antes de activar el VAD no debe saltarse la detección de silencio
+        params["vad"] = fe.vad_params()
+    return cache_key(pcm16_from_bytes(raw_data), sr, params)
+
+
+def extract_pcm(raw_data: bytes, sr: int) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Dict[str, float], bool]:
+    """Filtro band-pass + detección de silencio + vector de características sobre PCM int16.
+
+    Devuelve el audio filtrado (None si no se pudo filtrar), las características (None si
+    no hay predictor o el clip es silencio), los ms de cada etapa y si el clip es silencio.
+    Corre en el pool: las etapas no se registran aquí sino en el proceso de la API (ver
+    metrics.observe_timings).
+    """
+    timings: Dict[str, float] = {}
+    audio = pcm16_from_bytes(raw_data)
+    with span("filter", timings, observe=False):
+        clean_audio = filter_pcm(raw_data, sr)
+    y, y_sr = (clean_audio if clean_audio is not None else audio), sr
+
+    if fe.vad_enabled():
+        with span("vad", timings, observe=False):
+            silent = fe.active_region(y, sr) is None
+        if silent:
+            return clean_audio, None, timings, True
+
+    predictor = _load_predictor()
+    if predictor is None:
+        return clean_audio, None, timings, False
+    if decimation_factor(sr, predictor.sample_rate) is not None:
+        # FILTER_DECIMATE: el band-pass ya limitó la banda, la extracción recibe 16 kHz sin remuestrear
+        with span("decimate", timings, observe=False):
+            y, y_sr = decimate_pcm16(y, sr, predictor.sample_rate), predictor.sample_rate
+    features = predictor.features_from_array(y, y_sr, timings=timings)
+    return clean_audio, features, timings, False
+
+
+def classify_features(X: np.ndarray) -> List[dict]:
+    """Un `predict` vectorizado por modelo para un lote de vectores."""
+    predictor = _load_predictor()
+    if predictor is None:
+        return [{"instrument": "Unknown", "note": "Unknown"} for _ in range(len(X))]
+    return predictor.predict_features_batch(X)
+
+
+class InferencePool:
+    def __init__(self, mode: Optional[str] = None, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, model_dir: Optional[str] = None) -> None:
+        self.mode = (mode or os.getenv("INFERENCE_MODE", "process")).strip().lower()
+        if self.mode not in ("process", "thread"):
+            raise ValueError(f"INFERENCE_MODE desconocido: {self.mode} (opciones: process, thread)")
+        self.workers = max(1, workers or int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1))))
+        self.max_pending = max_pending or int(os.getenv("INFERENCE_MAX_PENDING", str(4 * self.workers)))
+        self.model_dir = model_dir
+        self._executor: Optional[Executor] = None
+        self.batcher = MicroBatcher(self._classify)
+        self.feature_cache = FeatureCache()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        """Crea el pool y fuerza la carga del predictor en cada worker."""
+        with self._start_lock:
+            if self._executor is None:
+                self._start()
+
+    def _start(self) -> None:
+        if self.mode == "process":
+            ctx = multiprocessing.get_context(os.getenv("INFERENCE_MP_CONTEXT", "spawn"))
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                                 initializer=_init_worker, initargs=(self.model_dir,))
+            for future in [self._executor.submit(_ping) for _ in range(self.workers)]:
+                future.result()
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inferencia")
+            _init_worker(self.model_dir)
+        print(f"Pool de inferencia listo: {self.workers} workers ({self.mode})")
+
+    def shutdown(self) -> None:
+        with self._start_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def reserve(self) -> bool:
+        """Reserva un lugar en la cola; False si el pool está saturado."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+
+    async def analyze(self, raw_data: bytes, sr: int, extractor: Optional[StreamingFeatureExtractor] = None,
+                      timings: Optional[Dict[str, float]] = None) -> Tuple[Optional[np.ndarray], dict]:
+        """Caché → extractor incremental (si lo hay) → extracción en el pool; luego micro-lote.
+
+        Libera la reserva hecha con `reserve()`. Con `timings` se suman ahí los ms por etapa.
+        """
+        try:
+            key = None
+            if self.feature_cache.enabled:
+                with span("cache_lookup", timings):
+                    key = await asyncio.to_thread(pcm_cache_key, raw_data, sr)
+                    features = self.feature_cache.get(key)
+                if features is not None:
+                    with span("filter", timings):
+                        clean_audio = await asyncio.to_thread(filter_pcm, raw_data, sr)
+                    if clean_audio is None:
+                        ERRORS.inc(stage="filter")
+                    return clean_audio, await self._predict(features, timings)
+
+            clean_audio = features = None
+            if extractor is not None and len(raw_data) // 2 >= 50:
+                try:
+                    with span("extract_finish", timings):
+                        features = await asyncio.wrap_future(extractor.finish_async())
+                    clean_audio = extractor.filtered.values
+                    if extractor.silent:
+                        return clean_audio, silent_prediction()
+                except Exception as e:
+                    ERRORS.inc(stage="streaming")
+                    print(f"⚠ Extracción incremental falló, se analiza la grabación completa: {e}")
+            if features is None:
+                try:
+                    start = time.perf_counter()
+                    clean_audio, features, stages, silent = await self._submit(extract_pcm, bytes(raw_data), sr)
+                except Exception as e:
+                    ERRORS.inc(stage="extract")
+                    return None, {"instrument": "Unknown", "note": "Unknown", "error": str(e)}
+                # Lo que no midió el worker es espera en la cola del pool (y serialización)
+                stages["inference_queue"] = max(0.0, 1000 * (time.perf_counter() - start) - sum(stages.values()))
+                observe_timings(stages)
+                if timings is not None:
+                    for stage, ms in stages.items():
+                        timings[stage] = timings.get(stage, 0.0) + ms
+                if clean_audio is None:
+                    ERRORS.inc(stage="filter")
+                if silent:
+                    return clean_audio, silent_prediction()
+            if features is None:
+                return clean_audio, {"instrument": "Unknown", "note": "Unknown"}
+
+            if key is not None:
+                self.feature_cache.put(key, features)
+            return clean_audio, await self._predict(features, timings)
+        finally:
+            self.release()
+
+    async def _predict(self, features: np.ndarray, timings: Optional[Dict[str, float]] = None) -> dict:
+        try:
+            with span("classify", timings):
+                return await self.batcher.predict(features)
+        except Exception as e:
+            ERRORS.inc(stage="classify")
+            return {"instrument": "Unknown", "note": "Unknown", "error": str(e)}
+
+    async def _classify(self, X: np.ndarray) -> List[dict]:
+        return await self._submit(classify_features, X)
+
+    async def _submit(self, fn, *args):
+        executor = self._executor
+        while executor is None:
+            # Primer uso antes de terminar el warm-up (o tras un pool roto): esperar fuera del event loop
+            await asyncio.to_thread(self.start)
+            executor = self._executor
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. OOM): se recrea el pool en la siguiente petición
+            print("⚠ Pool de inferencia roto, se reiniciará")
+            await asyncio.to_thread(self._discard_executor, executor)
+            raise
+
+    def _discard_executor(self, executor: Executor) -> None:
+        """Apaga un pool roto (hilo de gestión y workers sobrevivientes) si sigue siendo el actual.
+
+        Con `_start_lock`: otra petición que vio el mismo pool roto no debe descartar el nuevo.
+        """
+        with self._start_lock:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self._executor is executor:
+                self._executor = None
@@ -0,0 +1,123 @@
+"""
+Inicialización perezosa para que la API acepte conexiones en cuanto se importa `main.py`.
+
+- `lazy_import(nombre)`: el módulo (scipy.signal, librosa, soxr, ...) se ejecuta recién
+  cuando se accede a uno de sus atributos.
+- `Lazy(nombre, factory)`: recurso creado una sola vez, en el primer `get()` o en un
+  warm-up en segundo plano (`start_background()`). Guarda su estado para `/healthz`.
+  Si la creación falla (p. ej. Azure caído durante el warm-up), `get()` devuelve None sin
+  reintentar hasta que pasa la espera: `LAZY_RETRY_SECONDS` (default 30), duplicada en cada
+  fallo seguido hasta `LAZY_RETRY_MAX_SECONDS` (default 600).
+"""
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_resources: List["Lazy"] = []
+
+LAZY_RETRY_SECONDS = float(os.getenv("LAZY_RETRY_SECONDS", "30"))
+LAZY_RETRY_MAX_SECONDS = float(os.getenv("LAZY_RETRY_MAX_SECONDS", "600"))
+
+
+class _LazyModule:
+    """Proxy de un módulo que se importa en el primer acceso a un atributo.
+
+    `importlib.import_module` ya serializa importaciones concurrentes del mismo módulo,
+    así que el proxy puede usarse desde el event loop y desde hilos de warm-up a la vez.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}{' (cargado)' if self._module is not None else ''}>"
+
+
+def lazy_import(name: str):
+    """Módulo diferido: la importación real ocurre al primer acceso a un atributo."""
+    return sys.modules.get(name) or _LazyModule(name)
+
+
+def module_available(name: str) -> bool:
+    """True si el módulo está instalado (sin importarlo)."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class Lazy(Generic[T]):
+    def __init__(self, name: str, factory: Callable[[], T], required: bool = True,
+                 retry_seconds: Optional[float] = None) -> None:
+        self.name = name
+        self.required = required
+        self.retry_seconds = LAZY_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.failures = 0  # fallos seguidos
+        self._retry_at = 0.0
+        _resources.append(self)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self) -> Optional[T]:
+        """Crea el recurso si hace falta (una sola vez); None si la creación falló.
+
+        Tras un fallo se vuelve a intentar en el primer `get()` posterior a la espera.
+        """
+        if self.state == "ready":
+            return self._value
+        if self.state == "error" and time.monotonic() < self._retry_at:
+            return None
+        with self._lock:
+            if self.state == "error" and time.monotonic() >= self._retry_at:
+                self.state = "pending"
+            if self.state in ("pending", "starting"):
+                self.state = "starting"
+                start = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                    self.state = "ready"
+                    self.error = None
+                    self.failures = 0
+                except Exception as e:
+                    self.state = "error"
+                    self.error = str(e)
+                    self.failures += 1
+                    wait = min(self.retry_seconds * 2 ** (self.failures - 1), LAZY_RETRY_MAX_SECONDS)
+                    self._retry_at = time.monotonic() + wait
+                    print(f"⚠ No se pudo inicializar {self.name} (se reintentará en {wait:.0f} s): {e}")
+                self.seconds = round(time.perf_counter() - start, 3)
+            return self._value
+
+    def start_background(self) -> None:
+        """Warm-up en un hilo daemon: no retrasa el arranque del servidor."""
+        if self.state == "pending":
+            self.state = "starting"
+            threading.Thread(target=self.get, name=f"warmup-{self.name}", daemon=True).start()
+
+
+def readiness() -> Dict[str, object]:
+    """Estado de todos los recursos perezosos; listo cuando los requeridos están creados."""
+    components = {r.name: {"state": r.state, "seconds": r.seconds, **({"error": r.error} if r.error else {})}
+                  for r in _resources}
+    ready = all(r.ready for r in _resources if r.required)
+    return {"ready": ready, "components": components}
@@ -0,0 +1,262 @@
+"""
+Métricas de la API en formato de texto de Prometheus (`GET /metrics`), sin dependencias.
+
+- `audio_api_stage_seconds{stage=...}`: histograma por etapa del pipeline. Etapas:
+  `filter`, `vad`, `resample`, `stft`, `mfcc`, `chroma`, `spectral`, `f0` (extracción en el pool de
+  inferencia), `inference_queue` (espera en el pool), `cache_lookup`, `extract_finish`
+  (cierre de la extracción incremental), `stream_chunk` (chunk procesado mientras llega la
+  grabación), `classify` (incluye la espera del micro-lote), `finalize` (request completo),
+  y en segundo plano `wav_write`, `archive_encode`, `blob_upload`, `db_insert`.
+- `audio_api_http_request_seconds{endpoint}` y `audio_api_http_requests_total{endpoint,status}`.
+- Contadores de ingesta (`audio_api_ingest_chunks_total`, `audio_api_ingest_bytes_total`),
+  detecciones, clips en silencio (`audio_api_silent_clips_total`) y errores por etapa (`audio_api_errors_total{stage}`).
+- Valores que ya llevan otros componentes (caché de características, cola de blobs, buffer
+  de PostgreSQL, sesiones) se leen al momento del scrape con `callback()`.
+
+Las etapas que corren en los procesos del pool se miden allí con `span(..., observe=False)`
+y vuelven en el resultado como diccionario de ms; el proceso de la API las registra con
+`observe_timings()`. Ese mismo diccionario es el desglose opcional de
+`/finalize_wav?timings=1`.
+
+`METRICS_ENABLED=0` desactiva el registro (los spans siguen llenando el desglose pedido).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PREFIX = "audio_api_"
+
+# Segundos: de un chunk (~1 ms) a un finalize lento con el pool saturado
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: conteo por bucket (no acumulado), suma y total
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, seconds: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = next((i for i, b in enumerate(self.buckets) if seconds <= b), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += seconds
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((k, list(c), t[0]) for k, (c, t) in self._values.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Callback(_Metric):
+    """Valor leído al momento del scrape: un número o `{valor_de_etiqueta: número}` (una etiqueta)."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Union[float, Dict[str, float], None]],
+                 kind: str = "gauge", labelname: Optional[str] = None) -> None:
+        super().__init__(name, help, (labelname,) if labelname else ())
+        self.kind = kind
+        self._fn = fn
+
+    def samples(self) -> List[str]:
+        try:
+            value = self._fn()
+        except Exception as e:
+            print(f"⚠ Métrica {self.name} no disponible: {e}")
+            return []
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_labels(self.labelnames, (k,))} {_number(v)}" for k, v in sorted(value.items())]
+        return [f"{self.name} {_number(value)}"]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Registrar dos veces el mismo nombre (p. ej. al recargar un módulo) devuelve el existente
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+
+def callback(name: str, help: str, fn: Callable[[], Union[float, Dict[str, float], None]],
+             kind: str = "gauge", labelname: Optional[str] = None) -> Callback:
+    return REGISTRY.register(Callback(name, help, fn, kind, labelname))  # type: ignore[return-value]
+
+
+STAGE_SECONDS = histogram("stage_seconds", "Duración de cada etapa del pipeline de audio", ("stage",))
+REQUEST_SECONDS = histogram("http_request_seconds", "Duración de los requests HTTP", ("endpoint",))
+REQUESTS = counter("http_requests_total", "Requests HTTP por endpoint y status", ("endpoint", "status"))
+CHUNKS = counter("ingest_chunks_total", "Chunks o tramas de audio recibidos", ("endpoint",))
+BYTES = counter("ingest_bytes_total", "Bytes de audio recibidos", ("endpoint",))
+DETECTIONS = counter("detections_total", "Grabaciones clasificadas")
+SILENT_CLIPS = counter("silent_clips_total", "Grabaciones sin actividad (no se clasifican)")
+ERRORS = counter("errors_total", "Errores por etapa", ("stage",))
+
+
+# -----------------------------
+#   SPANS
+# -----------------------------
+@contextmanager
+def span(stage: str, timings: Optional[Dict[str, float]] = None, observe: bool = True) -> Iterator[None]:
+    """Mide un bloque: lo registra en el histograma de etapas y suma los ms a `timings`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + 1000 * elapsed
+        if observe:
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+
+
+def observe_timings(timings: Dict[str, float]) -> None:
+    """Registra etapas medidas en otro proceso (ms, como las devuelve `span`)."""
+    for stage, ms in timings.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# -----------------------------
+#   MIDDLEWARE HTTP
+# -----------------------------
+class MetricsMiddleware:
+    """Middleware ASGI: latencia y status por ruta (la plantilla de la ruta, no la URL)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = {"code": 500}
+        recorded = False
+
+        def record() -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "other"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=str(status["code"]))
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            # Hasta el último byte de la respuesta (las tareas en segundo plano no cuentan)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
@@ -0,0 +1,108 @@
+"""
+Registro de lecturas de sensores por sesión.
+
+Las lecturas se guardan en columnas compactas (`array.array`) en lugar de una lista de dicts,
+y se persisten en un archivo JSON-lines de solo-anexado: cada chunk escribe una línea (O(1)),
+en vez de reescribir todo el JSON como antes (O(n²) por grabación). Las escrituras se delegan
+a un único hilo escritor compartido, así `append` nunca bloquea el event loop y el orden de
+las líneas se conserva.
+
+Variable de entorno `SENSOR_LOG_MODE`:
+- `append` (default): una línea por chunk en `mediciones*.jsonl`
+- `finalize`: todo el registro se escribe de una vez al finalizar
+- `off`: sin persistencia (solo memoria)
+"""
+import json
+import os
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+SENSOR_LOG_MODES = ("append", "finalize", "off")
+
+# Un solo hilo para todo el I/O de registros: serializa las operaciones de cada archivo
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor-log")
+
+
+def submit_io(fn, *args) -> Future:
+    """Ejecuta `fn` en el hilo escritor (I/O de archivos fuera del event loop)."""
+    return _writer.submit(fn, *args)
+
+
+class SensorLog:
+    def __init__(self, path: str, mode: Optional[str] = None) -> None:
+        self.path = path
+        self.mode = (mode or os.getenv("SENSOR_LOG_MODE", "append")).strip().lower()
+        if self.mode not in SENSOR_LOG_MODES:
+            raise ValueError(f"SENSOR_LOG_MODE desconocido: {self.mode} (opciones: {', '.join(SENSOR_LOG_MODES)})")
+        self.timestamps = array("q")
+        self.humidities = array("d")
+        self.chunk_sizes = array("q")
+        self._fh = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, timestamp: int, humidity: float, chunk_size: int) -> None:
+        self.timestamps.append(int(timestamp))
+        self.humidities.append(float(humidity))
+        self.chunk_sizes.append(int(chunk_size))
+        if self.mode == "append":
+            _writer.submit(self._write_lines, [self._line(len(self) - 1, datetime.now().isoformat())], "a")
+
+    def flush(self) -> None:
+        """Cierra el archivo (modo append) o lo escribe completo (modo finalize)."""
+        if self.mode == "finalize" and len(self):
+            now = datetime.now().isoformat()
+            _writer.submit(self._write_lines, [self._line(i, now) for i in range(len(self))], "w")
+        self.close()
+
+    def close(self, remove_file: bool = False) -> None:
+        _writer.submit(self._close, remove_file)
+
+    def stats(self) -> Dict[str, float]:
+        """Estadísticas de la grabación con reducciones vectorizadas."""
+        if not len(self):
+            return {}
+        humidities = np.frombuffer(self.humidities, dtype=np.float64)
+        timestamps = np.frombuffer(self.timestamps, dtype=np.int64)
+        return {
+            "total_readings": len(self),
+            "humidity_avg": float(humidities.mean()),
+            "humidity_min": float(humidities.min()),
+            "humidity_max": float(humidities.max()),
+            "recording_duration_ms": int(timestamps[-1] - timestamps[0]),
+        }
+
+    def _line(self, i: int, when: str) -> str:
+        return json.dumps({
+            "timestamp": self.timestamps[i],
+            "humidity": self.humidities[i],
+            "chunk_size": self.chunk_sizes[i],
+            "datetime": when,
+        }) + "\n"
+
+    # --- Ejecutado en el hilo escritor ---
+
+    def _write_lines(self, lines, file_mode: str) -> None:
+        try:
+            if self._fh is None or file_mode == "w":
+                self._close()
+                self._fh = open(self.path, file_mode)
+            self._fh.writelines(lines)
+            self._fh.flush()
+        except OSError as e:
+            print(f"⚠ No se pudo escribir {self.path}: {e}")
+
+    def _close(self, remove_file: bool = False) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if remove_file:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
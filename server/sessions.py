@@ -0,0 +1,175 @@
+"""
+Sesiones de grabación por dispositivo.
+
+Cada ESP32 se identifica con el header `X-Device-Id` (o `device_id` en query/path) y obtiene
+su propio buffer PCM en memoria, registro de sensores (ver sensor_log), extractor incremental de
+características (ver streaming) y archivos de salida. Las sesiones que dejan de
+recibir chunks se expulsan tras `SESSION_IDLE_TIMEOUT` segundos. El registro se usa desde el
+event loop, así que expulsar una sesión no hace I/O ahí: borrar sus archivos se delega al
+hilo escritor de sensor_log (en orden con las escrituras del registro de sensores).
+
+Variables de entorno (opcional):
+- RECORDINGS_DIR (default: directorio actual)
+- SESSION_IDLE_TIMEOUT (default: 60 segundos)
+- MAX_SESSIONS (default: 256)
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .framing import FrameAssembler
+from .sensor_log import SensorLog, submit_io
+from .streaming import StreamingFeatureExtractor
+
+DEFAULT_DEVICE_ID = "default"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def normalize_device_id(raw: Optional[str]) -> str:
+    """Convierte el id recibido en un nombre seguro para usar en rutas de archivo."""
+    if not raw:
+        return DEFAULT_DEVICE_ID
+    cleaned = _UNSAFE_CHARS.sub("_", raw.strip())[:64].strip(".")
+    return cleaned or DEFAULT_DEVICE_ID
+
+
+class RecordingSession:
+    """Estado de una grabación en curso de un dispositivo."""
+
+    def __init__(self, device_id: str, base_dir: str, stream_sr: Optional[int] = None) -> None:
+        self.device_id = device_id
+        # El dispositivo por defecto conserva los nombres históricos de archivo
+        prefix = "grabacion" if device_id == DEFAULT_DEVICE_ID else f"grabacion_{device_id}"
+        suffix = "" if device_id == DEFAULT_DEVICE_ID else f"_{device_id}"
+        self.wav_file = os.path.join(base_dir, f"{prefix}.wav")
+        self.clean_wav_file = os.path.join(base_dir, f"{prefix}_limpia.wav")
+        self.sensor_data_file = os.path.join(base_dir, f"mediciones{suffix}.jsonl")
+
+        self.audio = bytearray()
+        self.sensor_log = SensorLog(self.sensor_data_file)
+        self.extractor: Optional[StreamingFeatureExtractor] = None
+        # Reordenamiento de tramas de /upload_frames (se crea con la primera trama)
+        self.assembler: Optional[FrameAssembler] = None
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+
+        # Una sesión nueva nunca hereda audio de una grabación anterior
+        self.discard()
+        if stream_sr:
+            self.extractor = StreamingFeatureExtractor(input_sr=stream_sr)
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+    def idle_seconds(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.last_seen
+
+    def append(self, data: bytes, timestamp_ms: int, humidity: float) -> None:
+        """Anexa un chunk PCM y su lectura de sensores (llamar con `lock` tomado)."""
+        self.sensor_log.append(int(timestamp_ms), float(humidity), len(data))
+        self.bytes_received += len(data)
+        if len(data) > 0:
+            self.audio += data
+            if self.extractor is not None:
+                self.extractor.feed(data)
+
+    def take_audio(self) -> bytearray:
+        """Entrega el PCM acumulado y deja la sesión con un buffer vacío."""
+        audio, self.audio = self.audio, bytearray()
+        return audio
+
+    def discard(self, include_outputs: bool = False) -> None:
+        """Libera el audio y borra los archivos de la sesión (y los WAV archivados si se pide).
+
+        No bloquea: el borrado se encola en el hilo escritor de sensor_log.
+        """
+        self.audio = bytearray()
+        self.extractor = None
+        self.assembler = None
+        self.sensor_log.close(remove_file=True)
+        if include_outputs:
+            submit_io(self._remove_outputs)
+
+    def _remove_outputs(self) -> None:
+        for path in (self.wav_file, self.clean_wav_file):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class SessionRegistry:
+    """Registro thread-safe de sesiones activas con expulsión por inactividad."""
+
+    def __init__(self, base_dir: Optional[str] = None, idle_timeout: Optional[float] = None,
+                 max_sessions: Optional[int] = None, stream_sr: Optional[int] = None) -> None:
+        self.base_dir = base_dir or os.getenv("RECORDINGS_DIR", os.getcwd())
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv("SESSION_IDLE_TIMEOUT", "60"))
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("MAX_SESSIONS", "256"))
+        # Con `stream_sr` cada sesión extrae características mientras llegan los chunks
+        self.stream_sr = stream_sr
+        self._sessions: Dict[str, RecordingSession] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, device_id: str) -> Optional[RecordingSession]:
+        with self._lock:
+            return self._sessions.get(device_id)
+
+    def get_or_create(self, device_id: str) -> RecordingSession:
+        """Devuelve la sesión del dispositivo, creándola si es el primer chunk."""
+        self._maybe_sweep()
+        evicted = None
+        with self._lock:
+            session = self._sessions.get(device_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    evicted = self._pop_oldest_locked()
+                session = RecordingSession(device_id, self.base_dir, self.stream_sr)
+                self._sessions[device_id] = session
+            session.touch()
+        if evicted is not None:
+            # Fuera del lock del registro y con el de la sesión: un /upload_chunk puede estar anexando
+            with evicted.lock:
+                evicted.discard(include_outputs=True)
+            print(f"Límite de sesiones alcanzado; se expulsa {evicted.device_id}")
+        return session
+
+    def pop(self, device_id: str) -> Optional[RecordingSession]:
+        """Saca la sesión del registro (p. ej. al finalizar); los chunks siguientes abren otra."""
+        with self._lock:
+            return self._sessions.pop(device_id, None)
+
+    def evict_idle(self, now: Optional[float] = None) -> List[str]:
+        """Expulsa las sesiones sin actividad y devuelve sus ids."""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s.idle_seconds(now) > self.idle_timeout]
+            evicted = [self._sessions.pop(sid) for sid in expired]
+            self._last_sweep = now
+        for session in evicted:
+            with session.lock:
+                session.discard(include_outputs=True)
+        if expired:
+            print(f"Sesiones expiradas por inactividad: {', '.join(expired)}")
+        return expired
+
+    def _maybe_sweep(self) -> None:
+        # Barrido perezoso: como mucho unas pocas veces por periodo de inactividad
+        if time.monotonic() - self._last_sweep >= self.idle_timeout / 4:
+            self.evict_idle()
+
+    def _pop_oldest_locked(self) -> RecordingSession:
+        """Saca del registro la sesión con más tiempo sin actividad (llamar con `_lock` tomado)."""
+        oldest = min(self._sessions.values(), key=lambda s: s.last_seen)
+        return self._sessions.pop(oldest.device_id)
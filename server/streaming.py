@@ -0,0 +1,349 @@
+"""
+Extracción de características incremental mientras llegan los chunks.
+
+Cada chunk PCM int16 pasa por el band-pass (`filters.BandpassStream`, estado `zi` entre
+chunks), el remuestreo 32→16 kHz (soxr en streaming, o la decimación de `FILTER_DECIMATE`)
+y, en cuanto hay muestras suficientes, se calculan
+sus frames STFT, mel, centroid/rolloff/bandwidth, rms, zcr y f0. Las estadísticas que no
+dependen del audio completo se mantienen como sumas y sumas de cuadrados; los frames mel y
+de potencia se guardan para las partes que sí son globales (umbral `top_db` de MFCC y
+estimación de afinación de chroma). Al finalizar solo queda cerrar los últimos frames y
+combinar acumuladores.
+
+El resultado coincide (a precisión flotante) con `AudioPredictor.features_from_array`
+aplicado al audio completo filtrado con `bandpass_pcm16`.
+Con `FILTER_MODE=zerophase` (filtro no causal) o `VAD_TRIM=1` (el tramo activo solo se
+conoce con la grabación completa) la extracción incremental se desactiva. La detección de
+silencio (`VAD_ENABLED`) se hace al cerrar, sobre el mismo audio filtrado que el análisis
+completo: ambos caminos deciden igual.
+
+Variables de entorno (opcional):
+- STREAMING_FEATURES: `1` (default) extrae mientras llegan los chunks; `0` usa el análisis
+  completo en `/finalize_wav`
+- STREAMING_WORKERS: hilos que procesan chunks en segundo plano (default: 2)
+- STREAMING_MAX_PENDING: trabajos de streaming en cola o en curso, entre todas las sesiones
+  (default: 4 por hilo). Con el límite alcanzado no se programan más: los bytes quedan en
+  el extractor y se procesan con un chunk posterior o al finalizar.
+
+Los hilos de streaming corren en el proceso de la API, fuera del pool de inferencia (el
+estado de cada sesión vive aquí), así que su STFT/f0 compite por la CPU y el GIL con el
+event loop. `STREAMING_MAX_PENDING` acota esa cola; lo que no entra se hace en
+`finish()`, que corre con la reserva de `/finalize_wav` y por lo tanto bajo el `503` del
+pool. Con muchos dispositivos y pocos núcleos, `STREAMING_FEATURES=0` lleva toda la
+extracción a los procesos del pool.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from .filters import FILTER_MODE, BandpassStream, DecimateStream, decimation_factor
+from .lazy import lazy_import
+from .metrics import ERRORS, span
+
+# Dependencias pesadas: se cargan al crear el primer extractor (ver lazy)
+soxr = lazy_import("soxr")
+librosa = lazy_import("librosa")
+fe = lazy_import("model.feature_extraction")
+
+# sosfiltfilt y el recorte al tramo activo necesitan la grabación completa
+STREAMING_FEATURES = (os.getenv("STREAMING_FEATURES", "1") == "1" and FILTER_MODE != "zerophase"
+                      and os.getenv("VAD_TRIM", "0") != "1")
+
+# Frames a acumular antes de procesar un bloque (amortiza el coste por llamada de FFT/yin)
+MIN_BLOCK_FRAMES = 8
+
+# Procesamiento en segundo plano de los chunks (fuera del event loop)
+STREAMING_WORKERS = max(1, int(os.getenv("STREAMING_WORKERS", "2")))
+STREAMING_MAX_PENDING = max(1, int(os.getenv("STREAMING_MAX_PENDING", str(4 * STREAMING_WORKERS))))
+_executor = ThreadPoolExecutor(max_workers=STREAMING_WORKERS, thread_name_prefix="streaming")
+_jobs_lock = threading.Lock()
+_jobs = 0  # trabajos de `schedule()` en cola o en curso
+
+
+def pending_jobs() -> int:
+    return _jobs
+
+
+def warm_up(input_sr: int) -> None:
+    """Extracción completa sobre ruido: compila numba (yin) en este proceso antes del primer chunk."""
+    try:
+        rng = np.random.default_rng(0)
+        extractor = StreamingFeatureExtractor(input_sr=input_sr)
+        extractor.feed((rng.standard_normal(input_sr // 2) * 1000).astype(np.int16).tobytes())
+        extractor.finish()
+    except Exception as e:
+        print(f"⚠ No se pudo precalentar la extracción incremental: {e}")
+
+
+class _GrowingArray:
+    """Array 1D/2D que crece por el último eje con capacidad duplicada."""
+
+    def __init__(self, rows: Optional[int] = None, dtype=np.float32) -> None:
+        shape = (0,) if rows is None else (rows, 0)
+        self._data = np.zeros(shape[:-1] + (1024,), dtype=dtype)
+        self.size = 0
+
+    def extend(self, values: np.ndarray) -> None:
+        n = values.shape[-1]
+        if self.size + n > self._data.shape[-1]:
+            capacity = max(2 * self._data.shape[-1], self.size + n)
+            grown = np.zeros(self._data.shape[:-1] + (capacity,), dtype=self._data.dtype)
+            grown[..., :self.size] = self._data[..., :self.size]
+            self._data = grown
+        self._data[..., self.size:self.size + n] = values
+        self.size += n
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[..., :self.size]
+
+
+class StreamingFeatureExtractor:
+    """Extractor por sesión. Crearlo es barato (se hace en el event loop, con el primer chunk):
+    filtros, ventana, base mel y remuestreador se preparan en el primer `process()`, ya en el
+    pool de streaming, así que el primer chunk no espera el import de librosa ni el diseño de
+    filtros aunque el warm-up no haya terminado."""
+
+    def __init__(self, input_sr: int = 32000, sample_rate: int = 16000, n_mfcc: int = 13,
+                 n_fft: int = 2048, hop_length: int = 512, pitch: Optional[str] = None) -> None:
+        self.input_sr = input_sr
+        self.sample_rate = sample_rate
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._pitch_arg = pitch
+        self._ready = False
+
+        # Entrada pendiente (bytes aún sin procesar) y PCM filtrado para archivar
+        self._pending = bytearray()
+        self._input_lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._scheduled = False
+        self.failed = False
+        self.silent = False
+        self.filtered = _GrowingArray(dtype=np.int16)
+        self.input_samples = 0
+
+    def _setup(self) -> None:
+        """Estado que necesita librosa/scipy/soxr (llamar con `_process_lock` tomado)."""
+        if self._ready:
+            return
+        n_fft, sample_rate = self.n_fft, self.sample_rate
+        self.pitch = fe.pitch_backend(self._pitch_arg)
+
+        # Band-pass con estado entre chunks
+        self._bandpass = BandpassStream(self.input_sr)
+
+        # 32→16 kHz: decimación sobre el audio ya filtrado (FILTER_DECIMATE) o soxr en streaming
+        factor = decimation_factor(self.input_sr, sample_rate)
+        self._decimator = DecimateStream(factor) if factor is not None else None
+        self._resampler = None
+        if self._decimator is None:
+            self._resampler = soxr.ResampleStream(self.input_sr, sample_rate, 1, dtype="float32", quality="HQ")
+
+        # Señal a 16 kHz y su indicador acumulado de cruces por cero
+        self._y = _GrowingArray(dtype=np.float32)
+        self._crossings = _GrowingArray(dtype=np.int64)
+        self._last_sign: Optional[bool] = None
+
+        self._window = librosa.filters.get_window("hann", n_fft, fftbins=True)[:, np.newaxis]
+        self._mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft)
+        self._freq = librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+
+        # Frames guardados (globales al finalizar) y acumuladores (sumas y sumas de cuadrados)
+        self._next_frame = 0
+        self._mel = _GrowingArray(rows=self._mel_basis.shape[0])
+        self._power = _GrowingArray(rows=n_fft // 2 + 1)
+        self._rms = _GrowingArray(dtype=np.float32)
+        self._f0 = _GrowingArray(dtype=np.float64)
+        self._sums = np.zeros(5)
+        self._sumsq = np.zeros(5)
+        self._ready = True
+
+    # --- Entrada ---
+
+    def feed(self, data: bytes) -> None:
+        """Encola bytes PCM (barato; apto para el event loop)."""
+        with self._input_lock:
+            self._pending += data
+
+    def schedule(self) -> bool:
+        """Programa `process()` en el pool de streaming (un solo trabajo pendiente a la vez).
+
+        False si el pool ya tiene `STREAMING_MAX_PENDING` trabajos: los bytes siguen
+        encolados y los procesa el próximo `schedule()` o `finish()`.
+        """
+        global _jobs
+        with self._input_lock:
+            if self._scheduled:
+                return True
+            with _jobs_lock:
+                if _jobs >= STREAMING_MAX_PENDING:
+                    return False
+                _jobs += 1
+            self._scheduled = True
+        _executor.submit(self._process_logged)
+        return True
+
+    def finish_async(self) -> "Future[np.ndarray]":
+        """`finish()` en el pool de streaming; usar con `asyncio.wrap_future`."""
+        return _executor.submit(self.finish)
+
+    def process(self) -> None:
+        """Procesa todo lo encolado, en orden. Pensado para ejecutarse en un hilo."""
+        with self._process_lock:
+            self._setup()
+            with self._input_lock:
+                self._scheduled = False
+                usable = len(self._pending) - (len(self._pending) % 2)
+                data = bytes(self._pending[:usable])
+                del self._pending[:usable]
+            if data:
+                self._push_pcm(np.frombuffer(data, dtype=np.int16))
+                self._process_frames(final=False)
+
+    def finish(self) -> Optional[np.ndarray]:
+        """Cierra la señal (remuestreo y últimos frames) y devuelve el vector de características.
+
+        Si el clip es silencio (`VAD_ENABLED`) marca `silent` y devuelve None sin calcularlo.
+        """
+        self.process()
+        with self._process_lock:
+            if self.failed:
+                raise RuntimeError("extracción incremental incompleta")
+            if fe.vad_enabled() and fe.active_region(self.filtered.values, self.input_sr) is None:
+                self.silent = True
+                return None
+            if self._resampler is not None:
+                tail = self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+                self._push_resampled(tail)
+            self._process_frames(final=True)
+            return self._features()
+
+    def _process_logged(self) -> None:
+        global _jobs
+        try:
+            with span("stream_chunk"):
+                self.process()
+        except Exception as e:
+            # El estado queda incompleto: finalize recurrirá al análisis completo
+            self.failed = True
+            ERRORS.inc(stage="streaming")
+            print(f"⚠ Error en extracción incremental: {e}")
+        finally:
+            with _jobs_lock:
+                _jobs -= 1
+
+    # --- Etapas ---
+
+    def _push_pcm(self, pcm: np.ndarray) -> None:
+        self.input_samples += pcm.size
+        filtered = self._bandpass.process(pcm)
+        self.filtered.extend(filtered)
+        if self._decimator is not None:
+            y = self._decimator.process(filtered).astype(np.float32) / np.float32(32768)
+            self._push_resampled(y)
+        else:
+            y = filtered.astype(np.float32) / np.float32(32768)
+            self._push_resampled(self._resampler.resample_chunk(y, last=False))
+
+    def _push_resampled(self, y: np.ndarray) -> None:
+        if y.size == 0:
+            return
+        signs = np.signbit(np.where(np.abs(y) <= 1e-10, 0, y))
+        previous = signs[0] if self._last_sign is None else self._last_sign
+        changes = np.concatenate(([signs[0] != previous], signs[1:] != signs[:-1]))
+        start = self._crossings.values[-1] if self._crossings.size else 0
+        self._crossings.extend(start + np.cumsum(changes))
+        self._last_sign = bool(signs[-1])
+        self._y.extend(y)
+
+    def _process_frames(self, final: bool) -> None:
+        n = self._y.size
+        pad = self.n_fft // 2
+        if final:
+            end_frame = 1 + n // self.hop_length if n else 0
+        else:
+            # Frames cuya ventana [t*hop - pad, t*hop + pad) ya está completa
+            end_frame = (n - pad) // self.hop_length + 1 if n >= pad else 0
+            if end_frame - self._next_frame < MIN_BLOCK_FRAMES:
+                return
+        if end_frame <= self._next_frame:
+            return
+
+        t0, t1 = self._next_frame, end_frame
+        seg_start = t0 * self.hop_length - pad
+        seg_end = (t1 - 1) * self.hop_length + pad
+        segment = np.zeros(seg_end - seg_start, dtype=np.float32)
+        lo, hi = max(seg_start, 0), min(seg_end, n)
+        segment[lo - seg_start:hi - seg_start] = self._y.values[lo:hi]
+        frames = librosa.util.frame(segment, frame_length=self.n_fft, hop_length=self.hop_length)
+
+        # STFT (mismas operaciones que librosa.stft) y espectros derivados
+        S = np.abs(np.fft.rfft(self._window * frames, axis=-2).astype(np.complex64))
+        power = S ** 2
+        self._power.extend(power)
+        self._mel.extend(np.einsum("ft,mf->mt", power, self._mel_basis, optimize=True))
+
+        sr = self.sample_rate
+        centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=self.n_fft, freq=self._freq)
+        rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr, n_fft=self.n_fft, freq=self._freq)
+        bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr, n_fft=self.n_fft, freq=self._freq,
+                                                       centroid=centroid)
+        rms = np.sqrt(np.mean(librosa.util.abs2(frames, dtype=np.float32), axis=-2))
+        self._rms.extend(rms)
+
+        # ZCR con relleno 'edge': solo cuentan los pares (j-1, j) dentro de la señal
+        starts = np.arange(t0, t1) * self.hop_length - pad
+        crossings = self._crossings.values
+        first = np.clip(starts, 0, n - 1)
+        last = np.clip(starts + self.n_fft - 1, 0, n - 1)
+        zcr = (crossings[last] - crossings[first]) / self.n_fft
+
+        for i, values in enumerate((centroid[0], rolloff[0], bandwidth[0], zcr, rms)):
+            values = values.astype(np.float64)
+            self._sums[i] += values.sum()
+            self._sumsq[i] += np.square(values).sum()
+
+        # f0 por frame (los frames son independientes: mismo resultado que sobre el audio completo)
+        backend = "autocorr" if self.pitch == "autocorr" else "yin"
+        self._f0.extend(fe.estimate_f0(segment, sr, backend=backend, frame_length=self.n_fft,
+                                    hop_length=self.hop_length, center=False))
+        self._next_frame = t1
+
+    def _features(self) -> np.ndarray:
+        n_frames = self._next_frame
+        if n_frames == 0:
+            return np.zeros(fe.feature_dim(self.n_mfcc), dtype=np.float32)
+
+        feats: List[float] = []
+
+        # MFCC: el umbral top_db depende del máximo global → al final, sobre los frames mel guardados
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(self._mel.values), n_mfcc=self.n_mfcc)
+        feats.extend(np.mean(mfcc, axis=1))
+        feats.extend(np.std(mfcc, axis=1))
+
+        # Chroma: la afinación se estima con todo el espectrograma
+        chroma = librosa.feature.chroma_stft(S=self._power.values, sr=self.sample_rate, n_fft=self.n_fft)
+        feats.extend(np.mean(chroma, axis=1))
+        feats.extend(np.std(chroma, axis=1))
+
+        # Centroid, rolloff, bandwidth, zcr, rms desde los acumuladores
+        means = self._sums / n_frames
+        stds = np.sqrt(np.maximum(self._sumsq / n_frames - means ** 2, 0.0))
+        for mean, std in zip(means, stds):
+            feats.extend([float(mean), float(std)])
+
+        f0 = self._f0.values
+        if self.pitch == "yin_gated":
+            f0 = np.where(fe.energy_gate(self._rms.values), f0, 0.0)
+        f0_valid = f0[f0 > 0]
+        if f0_valid.size > 0:
+            feats.extend([float(np.mean(f0_valid)), float(np.std(f0_valid))])
+        else:
+            feats.extend([0.0, 0.0])
+
+        return np.asarray(feats, dtype=np.float32)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Los tests importan `model` y `server` desde la raíz del repo (igual que main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def _default_extraction_env(monkeypatch):
+    """Extracción con los valores por defecto (los `PITCH_*`/`VAD_*` del entorno cambian el vector)."""
+    for name in ("PITCH_BACKEND", "PITCH_GATE_DB", "VAD_ENABLED", "VAD_TRIM", "VAD_MIN_DBFS", "VAD_REL_DB",
+                 "VAD_MIN_ACTIVE_MS", "VAD_PAD_MS", "FEATURE_CACHE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def tone(seconds: float, freq: float = 440.0, sr: int = 16000, seed: int = 0) -> np.ndarray:
+    """Nota armónica con decaimiento y algo de ruido, float32 en [-1, 1)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    y = sum((0.4 / k) * np.sin(2 * np.pi * k * freq * t) for k in range(1, 5)) * np.exp(-t)
+    return (y + 0.003 * rng.standard_normal(t.size)).astype(np.float32)
+
+
+def pcm_clip(seconds: float = 2.0, freq: float = 392.0, sr: int = 32000, seed: int = 0) -> np.ndarray:
+    """Clip como lo graba el ESP32: PCM int16 a 32 kHz con silencio antes y después de la nota."""
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    note = tone(seconds / 2, freq, sr=sr, seed=seed)
+    start = y.size // 4
+    y[start:start + note.size] = note
+    y += 0.002 * np.random.default_rng(seed + 100).standard_normal(y.size).astype(np.float32)
+    return np.clip(np.rint(y * 20000), -32768, 32767).astype(np.int16)
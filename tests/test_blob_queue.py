@@ -0,0 +1,114 @@
+"""Cola de subida de blobs: sin contenedor no hay backoff; los errores de subida sí se reintentan."""
+import time
+
+from server.blob_queue import BlobUploader, LocalBlobContainer
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_unavailable_container_spills_without_backoff(tmp_path):
+    uploader = BlobUploader(lambda: None, workers=1, max_retries=4, backoff=10.0,
+                            spill_dir=str(tmp_path / "spill"), spill_retry_seconds=3600)
+    uploader.start()
+    try:
+        start = time.monotonic()
+        for i in range(3):
+            assert uploader.submit(f"audio_{i}.flac", b"x" * 10, "audio/flac")
+        assert _wait(lambda: uploader.spilled == 3)
+        # Con backoff=10 s cualquier reintento se notaría
+        assert time.monotonic() - start < 2.0
+        assert uploader.retries == 0 and uploader.unavailable == 3 and uploader.uploaded == 0
+    finally:
+        uploader.close(timeout=1.0)
+
+
+def test_upload_errors_are_retried(tmp_path):
+    container = LocalBlobContainer(str(tmp_path / "blobs"))
+    calls = []
+
+    class Flaky:
+        def upload_blob(self, name, data, overwrite=False, **kwargs):
+            calls.append(name)
+            if len(calls) < 3:
+                raise ConnectionError("timeout")
+            container.upload_blob(name, data, overwrite=overwrite)
+
+    uploader = BlobUploader(lambda: Flaky(), workers=1, max_retries=4, backoff=0.01, spill_dir=None)
+    uploader.start()
+    try:
+        uploader.submit("dev/audio.flac", b"data", "audio/flac")
+        assert _wait(lambda: uploader.uploaded == 1)
+        assert uploader.retries == 2 and (tmp_path / "blobs" / "dev" / "audio.flac").read_bytes() == b"data"
+    finally:
+        uploader.close(timeout=1.0)
+
+
+def test_on_stored_reports_uploaded_spilled_and_dropped(tmp_path):
+    container = LocalBlobContainer(str(tmp_path / "blobs"))
+    results = []
+    uploader = BlobUploader(lambda: container, workers=1, backoff=0.01, spill_dir=None)
+    try:
+        uploader.submit("ok.flac", b"data", on_stored=results.append)
+        assert _wait(lambda: results == [True])
+    finally:
+        uploader.close(timeout=1.0)
+
+    # Sin contenedor: durable solo si quedó en el spill
+    spilled, dropped = [], []
+    with_spill = BlobUploader(lambda: None, workers=1, spill_dir=str(tmp_path / "spill"), spill_retry_seconds=3600)
+    without_spill = BlobUploader(lambda: None, workers=1, spill_dir=None)
+    try:
+        with_spill.submit("a.flac", b"data", on_stored=spilled.append)
+        without_spill.submit("b.flac", b"data", on_stored=dropped.append)
+        assert _wait(lambda: spilled == [True] and dropped == [False])
+        assert without_spill.dropped == 1
+    finally:
+        with_spill.close(timeout=1.0)
+        without_spill.close(timeout=1.0)
+
+
+def test_on_stored_after_retries_run_out(tmp_path):
+    class Broken:
+        def upload_blob(self, name, data, overwrite=False, **kwargs):
+            raise ConnectionError("timeout")
+
+    results = []
+    uploader = BlobUploader(lambda: Broken(), workers=1, max_retries=1, backoff=0.01, spill_dir=None)
+    try:
+        assert uploader.submit("audio.flac", b"data", on_stored=results.append)
+        assert _wait(lambda: results == [False])
+        assert uploader.failed == 1
+    finally:
+        uploader.close(timeout=1.0)
+
+
+def test_spill_drains_under_sustained_traffic(tmp_path):
+    container = LocalBlobContainer(str(tmp_path / "blobs"))
+
+    class Slow:
+        def upload_blob(self, name, data, overwrite=False, **kwargs):
+            time.sleep(0.02)
+            container.upload_blob(name, data, overwrite=overwrite)
+
+    uploader = BlobUploader(lambda: Slow(), max_queue=8, workers=1, spill_dir=str(tmp_path / "spill"),
+                            spill_retry_seconds=0.0)
+    for i in range(5):
+        assert uploader._spill(f"spilled_{i}.flac", b"old", "audio/flac") is not None
+    uploader.start()
+    try:
+        # Un envío cada 30 ms: la cola nunca queda 0,5 s vacía
+        deadline = time.monotonic() + 1.5
+        i = 0
+        while time.monotonic() < deadline and uploader.spilled_pending():
+            uploader.submit(f"live_{i}.flac", b"new", "audio/flac")
+            i += 1
+            time.sleep(0.03)
+        assert uploader.spilled_pending() == 0
+        assert _wait(lambda: all((tmp_path / "blobs" / f"spilled_{k}.flac").exists() for k in range(5)))
+    finally:
+        uploader.close(timeout=1.0)
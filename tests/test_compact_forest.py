@@ -0,0 +1,47 @@
+"""El bosque compacto (memory-map) reproduce exactamente `predict_proba`/`predict` de sklearn."""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+from sklearn.tree import DecisionTreeClassifier
+
+from model.compact_forest import CompactForest, export_forest
+from model.feature_extraction import feature_dim
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    n_features = feature_dim()
+    X = rng.standard_normal((300, n_features)).astype(np.float32)
+    names = np.array(["bateria", "guitarra", "piano", "violin"])
+    y = names[(X[:, 0] > 0).astype(int) + 2 * (X[:, 3] + X[:, 7] > 0.5).astype(int)]
+    encoder = LabelEncoder().fit(y)
+    # Filas nuevas (float64, como salen del extractor antes del cast) y las de entrenamiento
+    X_test = np.vstack([rng.standard_normal((200, n_features)), X[:50]])
+    return X, encoder.transform(y), encoder, X_test
+
+
+@pytest.mark.parametrize("make_model", [
+    lambda: RandomForestClassifier(n_estimators=25, max_depth=None, random_state=0),
+    lambda: RandomForestClassifier(n_estimators=10, max_depth=4, min_samples_leaf=3, random_state=1),
+    lambda: DecisionTreeClassifier(random_state=0),
+])
+def test_mmap_forest_matches_sklearn(tmp_path, data, make_model):
+    X, y, encoder, X_test = data
+    model = make_model().fit(X, y)
+    out = export_forest(model, str(tmp_path / "rf_compact"), labels=encoder.classes_)
+
+    compact = CompactForest(out, mmap=True)
+    assert isinstance(compact.value, np.memmap)
+    assert np.array_equal(compact.predict_proba(X_test), model.predict_proba(X_test))
+    assert np.array_equal(compact.predict(X_test), model.predict(X_test))
+    assert np.array_equal(compact.labels.inverse_transform(compact.predict(X_test)),
+                          encoder.inverse_transform(model.predict(X_test)))
+
+
+def test_rejects_wrong_feature_count(tmp_path, data):
+    X, y, _, _ = data
+    out = export_forest(RandomForestClassifier(n_estimators=3, random_state=0).fit(X, y), str(tmp_path / "rf"))
+    with pytest.raises(ValueError):
+        CompactForest(out).predict_proba(X[:, :10])
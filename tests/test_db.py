@@ -0,0 +1,180 @@
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from server.db import _BUCKET_SQL, Database, Detection, DetectionBuffer, humidity_bucket
+
+HUMIDITIES = [0.0, 0.3, 0.7, 1.0, 2.9, 3.0, 40.0, 44.99, 45.0, 57.3, 99.95, 100.0, -0.1]
+
+
+def _sql_bucket(humidity: float, width: float) -> float:
+    """`_BUCKET_SQL` evaluado en Python con la misma aritmética de doble precisión que PostgreSQL."""
+    return math.floor(humidity / width) * width
+
+
+@pytest.fixture
+def pg_dsn():
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        pytest.skip("DATABASE_URL no configurada")
+    return dsn
+
+
+@pytest.mark.parametrize("width", [5.0, 0.1, 0.3, 2.5])
+def test_humidity_bucket_matches_sql_expression(width):
+    for h in HUMIDITIES:
+        assert humidity_bucket(h, width) == _sql_bucket(h, width)
+    assert humidity_bucket(None, width) is None
+    assert humidity_bucket(float("nan"), width) is None
+
+
+def test_humidity_bucket_fractional_width_does_not_use_floor_division():
+    # 1.0 // 0.1 == 9.0, pero floor(1.0 / 0.1) == 10 en PostgreSQL
+    assert humidity_bucket(1.0, 0.1) == 1.0
+
+
+@pytest.mark.parametrize("width", [5.0, 0.1, 0.3])
+def test_humidity_bucket_agrees_with_postgres(pg_dsn, width):
+    psycopg2 = pytest.importorskip("psycopg2")
+    values = HUMIDITIES + list(np.random.default_rng(0).uniform(0, 100, 200))
+    with psycopg2.connect(pg_dsn, sslmode=os.getenv("PGSSLMODE", "require")) as conn, conn.cursor() as cur:
+        for h in values:
+            cur.execute(f"SELECT {_BUCKET_SQL} FROM (VALUES (%(h)s::double precision)) AS t(humidity)",
+                        {"h": float(h), "width": width})
+            assert cur.fetchone()[0] == humidity_bucket(float(h), width), h
+    conn.close()
+
+
+class FakeDatabase:
+    available = True
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.batches = []
+
+    def insert_detections(self, rows):
+        if self.fail:
+            raise RuntimeError("sin conexión")
+        self.batches.append(list(rows))
+
+
+def _rows(n, start=0):
+    base = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+    return [Detection("piano", "A4", 40.0 + i, base + timedelta(seconds=i), "dev-1")
+            for i in range(start, start + n)]
+
+
+def test_buffer_flushes_when_batch_size_is_reached():
+    db = FakeDatabase()
+    buffer = DetectionBuffer(db, flush_rows=3, flush_interval_ms=60_000, max_retries=0)
+    rows = _rows(3)
+    for row in rows[:2]:
+        buffer.add(row)
+    time.sleep(0.2)
+    assert db.batches == []
+    buffer.add(rows[2])
+    deadline = time.monotonic() + 5
+    while not db.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert db.batches == [rows]
+    assert buffer.stats()["inserted"] == 3 and len(buffer) == 0
+    buffer.close()
+
+
+def test_failed_flush_requeues_rows_in_order():
+    db = FakeDatabase(fail=True)
+    buffer = DetectionBuffer(db, flush_rows=100, flush_interval_ms=60_000, max_retries=1)
+    rows = _rows(3)
+    for row in rows[:2]:
+        buffer.add(row)
+    assert buffer.flush() == 0
+    assert len(buffer) == 2
+    assert buffer.stats()["failed_batches"] == 1 and buffer.stats()["dropped"] == 0
+
+    # Las filas reencoladas van antes que las que llegaron después
+    buffer.add(rows[2])
+    db.fail = False
+    assert buffer.flush() == 3
+    assert db.batches == [rows]
+    buffer.close()
+
+
+def test_overflow_drops_oldest_rows():
+    db = FakeDatabase()
+    buffer = DetectionBuffer(db, flush_rows=100, flush_interval_ms=60_000, max_buffer=3)
+    rows = _rows(5)
+    for row in rows:
+        buffer.add(row)
+    assert len(buffer) == 3 and buffer.stats()["dropped"] == 2
+    assert buffer.flush() == 3
+    assert db.batches == [rows[2:]]
+    buffer.close()
+
+
+def test_requeue_keeps_newest_rows_when_buffer_is_full():
+    db = FakeDatabase(fail=True)
+    buffer = DetectionBuffer(db, flush_rows=100, flush_interval_ms=60_000, max_retries=0, max_buffer=3)
+    rows = _rows(3)
+    for row in rows:
+        buffer.add(row)
+    original = db.insert_detections
+
+    def fail_and_add_more(batch):
+        # Mientras el lote falla llegan dos detecciones nuevas: solo queda lugar para una vieja
+        for row in _rows(2, start=3):
+            buffer.add(row)
+        db.insert_detections = original
+        original(batch)
+
+    db.insert_detections = fail_and_add_more
+    assert buffer.flush() == 0
+    assert len(buffer) == 3 and buffer.stats()["dropped"] == 2
+    db.fail = False
+    buffer.flush()
+    assert db.batches == [rows[2:] + _rows(2, start=3)]
+    buffer.close()
+
+
+def test_database_roundtrip(pg_dsn):
+    """Contra un PostgreSQL real: lote con `execute_values`, contadores por hora y consultas."""
+    pytest.importorskip("psycopg2")
+    device = f"test-{uuid.uuid4().hex[:8]}"
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+    rows = [
+        Detection("piano", "A4", 41.0, hour + timedelta(minutes=1), device, 0.9, "audio/a.flac"),
+        Detection("piano", "A4", 44.5, hour + timedelta(minutes=20), device, 0.4, None),
+        Detection("violin", "E5", None, hour + timedelta(minutes=40), device),
+    ]
+    db = Database(pg_dsn)
+    buffer = DetectionBuffer(db, flush_rows=100, flush_interval_ms=60_000, max_retries=0)
+    try:
+        for row in rows:
+            buffer.add(row)
+        assert buffer.flush() == 3
+
+        items, cursor = db.list_detections(device_id=device, limit=2)
+        assert [i["instrument"] for i in items] == ["violin", "piano"] and cursor is not None
+        rest, cursor = db.list_detections(device_id=device, limit=2, cursor=cursor)
+        assert [i["audio_ref"] for i in rest] == ["audio/a.flac"] and cursor is None
+        low, _ = db.list_detections(device_id=device, max_confidence=0.5)
+        assert len(low) == 2
+
+        # La hora completa sale de detection_counts; una ventana parcial, de detections
+        full = db.detection_summary(hour, hour + timedelta(hours=1), device_id=device)
+        partial = db.detection_summary(hour, hour + timedelta(minutes=30), device_id=device)
+        assert full["total"] == 3
+        assert full["instruments"] == {"piano": 2, "violin": 1}
+        assert full["humidities"] == {40.0: 2, None: 1}
+        assert partial["total"] == 2 and partial["humidities"] == {40.0: 2}
+    finally:
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM public.detections WHERE device_id = %s", (device,))
+            cur.execute("DELETE FROM public.detection_counts WHERE device_id = %s", (device,))
+            conn.commit()
+        buffer.close()
+        db.close()
@@ -0,0 +1,39 @@
+"""`extract_features_batch` (señales de igual longitud apiladas) da las mismas filas que el camino de a una."""
+import librosa
+import numpy as np
+import pytest
+
+from model.feature_extraction import extract_features_batch, extract_features_vector, feature_dim
+from server.audio import write_wav
+
+from conftest import tone
+
+SR = 16000
+
+
+@pytest.fixture
+def wav_clips(tmp_path):
+    """WAVs de longitudes mezcladas: varios comparten longitud (se apilan), otros quedan solos."""
+    rng = np.random.default_rng(0)
+    specs = [(1.0, 220.0), (1.0, 440.0), (0.5, 330.0), (1.0, 880.0), (0.05, 262.0), (0.5, 196.0), (1.3, 523.0)]
+    paths = []
+    for i, (seconds, freq) in enumerate(specs):
+        y = tone(seconds, freq, sr=SR, seed=i) + 0.05 * rng.standard_normal(int(seconds * SR))
+        path = str(tmp_path / f"clip{i}.wav")
+        write_wav(path, np.clip(np.rint(y * 20000), -32768, 32767).astype(np.int16), SR)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("max_batch", [32, 2])
+def test_batch_rows_match_single_extraction(wav_clips, max_batch):
+    arrays = [librosa.load(path, sr=SR, mono=True)[0] for path in wav_clips]
+    X = extract_features_batch(arrays, SR, max_batch=max_batch)
+    assert X.shape == (len(wav_clips), feature_dim())
+    for row, path in zip(X, wav_clips):
+        assert np.array_equal(row, extract_features_vector(path, sample_rate=SR))
+
+
+def test_empty_clip_gives_zero_row():
+    X = extract_features_batch([np.zeros(0, dtype=np.float32), tone(0.5, sr=SR)], SR)
+    assert not X[0].any() and X[1].any()
@@ -0,0 +1,115 @@
+"""Caché de características: LRU acotado, nivel en disco con escritura atómica y contadores."""
+import os
+
+import numpy as np
+import pytest
+
+from model import feature_cache
+from model.feature_cache import FeatureCache, cache_key
+
+
+def _vec(i: int) -> np.ndarray:
+    return np.full(8, i, dtype=np.float32)
+
+
+def _npy_files(root):
+    return sorted(p.name for p in root.rglob("*") if p.is_file())
+
+
+def test_lru_is_bounded_and_evicts_least_recently_used():
+    cache = FeatureCache(max_items=3, disk_dir="")
+    for i in range(3):
+        cache.put(f"k{i}", _vec(i))
+    assert cache.get("k0") is not None  # k0 pasa a ser el más reciente
+    cache.put("k3", _vec(3))
+    assert len(cache) == 3
+    assert cache.get("k1") is None
+    assert [cache.get(k)[0] for k in ("k0", "k2", "k3")] == [0, 2, 3]
+
+
+def test_get_returns_a_copy():
+    cache = FeatureCache(max_items=2, disk_dir="")
+    cache.put("k", _vec(1))
+    cache.get("k")[:] = 99
+    assert np.array_equal(cache.get("k"), _vec(1))
+
+
+def test_disk_roundtrip_after_memory_eviction(tmp_path):
+    cache = FeatureCache(max_items=1, disk_dir=str(tmp_path))
+    cache.put("a" * 64, _vec(1))
+    cache.put("b" * 64, _vec(2))  # saca a `a` de memoria
+    assert len(cache) == 1
+
+    x = cache.get("a" * 64)
+    assert np.array_equal(x, _vec(1)) and x.dtype == np.float32
+    assert (cache.hits, cache.disk_hits, cache.misses) == (0, 1, 0)
+    # Leído de disco vuelve a memoria: el siguiente acceso es un acierto en memoria
+    cache.get("a" * 64)
+    assert (cache.hits, cache.disk_hits) == (1, 1)
+
+    # Otro proceso (o un reinicio) con el mismo directorio lo encuentra en disco
+    other = FeatureCache(max_items=4, disk_dir=str(tmp_path))
+    assert np.array_equal(other.get("b" * 64), _vec(2)) and other.disk_hits == 1
+
+
+def test_disk_only_cache(tmp_path):
+    cache = FeatureCache(max_items=0, disk_dir=str(tmp_path))
+    assert cache.enabled
+    cache.put("c" * 64, _vec(3))
+    assert len(cache) == 0
+    assert np.array_equal(cache.get("c" * 64), _vec(3)) and cache.disk_hits == 1
+    assert not FeatureCache(max_items=0, disk_dir="").enabled
+
+
+def test_atomic_write_leaves_no_partial_file(tmp_path, monkeypatch):
+    cache = FeatureCache(max_items=0, disk_dir=str(tmp_path))
+    key = "d" * 64
+
+    def broken_save(f, x):
+        f.write(b"\x93NUMPY partial")
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(feature_cache.np, "save", broken_save)
+    cache.put(key, _vec(4))
+    monkeypatch.undo()
+    # Ni el .npy a medias en la ruta final ni el temporal
+    assert _npy_files(tmp_path) == []
+    assert cache.get(key) is None and cache.misses == 1
+
+    cache.put(key, _vec(4))
+    assert _npy_files(tmp_path) == [f"{key}.npy"]
+    assert np.array_equal(FeatureCache(max_items=0, disk_dir=str(tmp_path)).get(key), _vec(4))
+
+
+def test_corrupt_disk_entry_is_a_miss(tmp_path):
+    cache = FeatureCache(max_items=0, disk_dir=str(tmp_path))
+    key = "e" * 64
+    os.makedirs(os.path.dirname(cache._path(key)))
+    with open(cache._path(key), "wb") as f:
+        f.write(b"no es un npy")
+    assert cache.get(key) is None and cache.misses == 1
+
+
+def test_counters_and_hit_rate(tmp_path):
+    cache = FeatureCache(max_items=1, disk_dir=str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return _vec(len(calls))
+
+    audio = np.arange(100, dtype=np.int16)
+    key = cache_key(audio, 32000, {"n_fft": 2048})
+    assert cache_key(audio.copy(), 32000, {"n_fft": 2048}) == key
+    assert cache_key(audio, 16000, {"n_fft": 2048}) != key
+    assert cache_key(audio, 32000, {"n_fft": 1024}) != key
+
+    first = cache.get_or_compute(key, compute)  # fallo: extrae y guarda
+    assert np.array_equal(cache.get_or_compute(key, compute), first)  # memoria
+    cache.put("f" * 64, _vec(9))  # saca `key` de memoria
+    assert np.array_equal(cache.get_or_compute(key, compute), first)  # disco
+    assert cache.get("0" * 64) is None  # fallo
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 2)
+    assert stats["hit_rate"] == pytest.approx(0.5)
@@ -0,0 +1,68 @@
+"""El vector de una sola STFT es idéntico al de las llamadas separadas de librosa originales."""
+import librosa
+import numpy as np
+import pytest
+
+from model.feature_extraction import extract_features_vector, extract_features_vector_from_array
+from server.audio import write_wav
+
+from conftest import tone
+
+SR = 16000
+N_FFT = 2048
+HOP = 512
+
+
+def reference_vector(y: np.ndarray, sr: int = SR, n_mfcc: int = 13) -> np.ndarray:
+    """Implementación original: cada característica con su propia llamada sobre `y=`."""
+    feats = []
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc, n_fft=N_FFT, hop_length=HOP)
+    feats.extend(np.mean(mfcc, axis=1))
+    feats.extend(np.std(mfcc, axis=1))
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_fft=N_FFT, hop_length=HOP)
+    feats.extend(np.mean(chroma, axis=1))
+    feats.extend(np.std(chroma, axis=1))
+    for values in (librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=N_FFT, hop_length=HOP),
+                   librosa.feature.spectral_rolloff(y=y, sr=sr, n_fft=N_FFT, hop_length=HOP),
+                   librosa.feature.spectral_bandwidth(y=y, sr=sr, n_fft=N_FFT, hop_length=HOP),
+                   librosa.feature.zero_crossing_rate(y=y, hop_length=HOP),
+                   librosa.feature.rms(y=y, hop_length=HOP)):
+        feats.extend([float(np.mean(values)), float(np.std(values))])
+    f0 = librosa.yin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr)
+    f0_valid = f0[f0 > 0]
+    if f0_valid.size > 0:
+        feats.extend([float(np.mean(f0_valid)), float(np.std(f0_valid))])
+    else:
+        feats.extend([0.0, 0.0])
+    return np.asarray(feats, dtype=np.float32)
+
+
+def _clips():
+    rng = np.random.default_rng(1)
+    noise = (0.1 * rng.standard_normal(2 * SR)).astype(np.float32)
+    return {
+        "tone": tone(2.0, 330.0),
+        "noise": noise,
+        "mix": (tone(2.0, 523.0, seed=2) + 0.5 * noise).astype(np.float32),
+        "silence": np.zeros(SR, dtype=np.float32),
+        "short": tone(1500 / SR, 440.0, seed=3),  # menos muestras que n_fft
+    }
+
+
+CLIPS = _clips()
+
+
+@pytest.mark.parametrize("name", sorted(CLIPS))
+def test_array_matches_reference(name):
+    y = CLIPS[name]
+    assert np.array_equal(extract_features_vector_from_array(y, SR), reference_vector(y))
+
+
+@pytest.mark.parametrize("name", ["tone", "short"])
+def test_wav_matches_reference(name, tmp_path):
+    # Camino del entrenamiento: WAV en disco → librosa.load → vector
+    pcm = np.clip(np.rint(CLIPS[name] * 32768), -32768, 32767).astype(np.int16)
+    path = str(tmp_path / f"{name}.wav")
+    write_wav(path, pcm, SR)
+    y, _ = librosa.load(path, sr=SR, mono=True)
+    assert np.array_equal(extract_features_vector(path, sample_rate=SR), reference_vector(y))
@@ -0,0 +1,82 @@
+"""Band-pass y decimación: por chunks da exactamente lo mismo que sobre la grabación completa."""
+import numpy as np
+import pytest
+
+from server import filters
+from server.filters import BandpassStream, DecimateStream, bandpass_pcm16, decimate_pcm16, to_pcm16
+
+from conftest import pcm_clip
+
+
+def _chunks(x: np.ndarray, seed: int, max_size: int = 3000):
+    """Cortes arbitrarios, incluidos chunks vacíos y de una muestra."""
+    rng = np.random.default_rng(seed)
+    pos = 0
+    while pos < x.size:
+        size = int(rng.choice([0, 1, 2, 511, 512, 513, int(rng.integers(3, max_size))]))
+        yield x[pos:pos + size]
+        pos += size
+
+
+def _noise(seconds: float, sr: int, seed: int = 0) -> np.ndarray:
+    return np.clip(np.rint(8000 * np.random.default_rng(seed).standard_normal(int(seconds * sr))),
+                   -32768, 32767).astype(np.int16)
+
+
+@pytest.mark.parametrize("sr", [16000, 32000, 44100])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_bandpass_stream_matches_one_shot(sr, seed):
+    audio = np.concatenate([pcm_clip(1.5, sr=sr, seed=seed), _noise(0.5, sr, seed)])
+    expected = bandpass_pcm16(audio, sr, zero_phase=False)
+    stream = BandpassStream(sr)
+    chunked = np.concatenate([stream.process(c) for c in _chunks(audio, seed)])
+    assert chunked.dtype == np.int16
+    assert np.array_equal(chunked, expected)
+
+
+def test_zero_phase_differs_and_short_audio_is_rejected():
+    audio = pcm_clip(1.0, sr=32000)
+    assert not np.array_equal(bandpass_pcm16(audio, 32000, zero_phase=True),
+                              bandpass_pcm16(audio, 32000, zero_phase=False))
+    with pytest.raises(ValueError):
+        bandpass_pcm16(audio[:49], 32000)
+
+
+def test_to_pcm16_saturates_instead_of_wrapping():
+    x = np.array([40000.0, -40000.0, 32767.4, 32767.6, -32768.4, -32768.6, 1.5, 2.5, -0.4])
+    assert to_pcm16(x).tolist() == [32767, -32768, 32767, 32767, -32768, -32768, 2, 2, 0]
+
+
+def test_filter_overshoot_is_clipped():
+    # Una onda cuadrada a fondo de escala: el band-pass sobrepasa el rango de int16
+    sr = 32000
+    t = np.arange(sr) / sr
+    square = np.where(np.sin(2 * np.pi * 500 * t) >= 0, 32767, -32768).astype(np.int16)
+    raw = filters.sps.sosfilt(filters.bandpass_sos(sr), square.astype(np.float64))
+    assert np.abs(raw).max() > 32768
+    out = bandpass_pcm16(square, sr, zero_phase=False)
+    assert np.array_equal(out, np.clip(np.rint(raw), -32768, 32767).astype(np.int16))
+    # Donde el filtro se pasa de rango la salida queda en el extremo con el mismo signo
+    over = np.abs(raw) > 32767.5
+    assert np.array_equal(np.sign(out[over]), np.sign(raw[over]))
+
+
+@pytest.mark.parametrize("sr,factor", [(32000, 2), (48000, 3)])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_decimate_stream_matches_one_shot(monkeypatch, sr, factor, seed):
+    monkeypatch.setattr(filters, "FILTER_DECIMATE", True)
+    assert filters.decimation_factor(sr, 16000) == factor
+    audio = _noise(1.0, sr, seed)
+    expected = decimate_pcm16(audio, sr, 16000)
+    assert np.array_equal(expected, audio[::factor])
+    stream = DecimateStream(factor)
+    chunked = np.concatenate([stream.process(c) for c in _chunks(audio, seed, max_size=50)])
+    assert np.array_equal(chunked, expected)
+
+
+def test_decimation_disabled_or_non_integer(monkeypatch):
+    assert filters.decimation_factor(32000, 16000) is None  # FILTER_DECIMATE=0 por defecto
+    monkeypatch.setattr(filters, "FILTER_DECIMATE", True)
+    assert filters.decimation_factor(44100, 16000) is None
+    out = decimate_pcm16(_noise(1.0, 44100), 44100, 16000)
+    assert out.dtype == np.int16 and out.size == 16000
@@ -0,0 +1,111 @@
+"""Protocolo de tramas de `/upload_frames`: decodificación por trozos, reorden, duplicados y huecos."""
+import struct
+
+import numpy as np
+
+from server.framing import FRAME_HEADER, Frame, FrameAssembler, FrameDecoder, encode_frame
+
+
+def _frame(seq: int, samples: int = 4) -> Frame:
+    pcm = np.arange(seq * samples, (seq + 1) * samples, dtype=np.int16).tobytes()
+    return Frame(seq, 1000 + 32 * seq, 42.5, pcm)
+
+
+def _encode(frame: Frame) -> bytes:
+    return encode_frame(frame.seq, frame.timestamp_ms, frame.humidity, frame.payload)
+
+
+def test_encode_decode_roundtrip():
+    frames = [_frame(i) for i in range(3)] + [Frame(3, 2 ** 40, 0.0, b"")]
+    decoder = FrameDecoder()
+    assert decoder.feed(b"".join(_encode(f) for f in frames)) == frames
+    assert not decoder.incomplete and decoder.error is None
+    assert decoder.offset == sum(FRAME_HEADER.size + len(f.payload) for f in frames)
+
+
+def test_header_split_across_feeds():
+    frames = [_frame(i) for i in range(2)]
+    stream = b"".join(_encode(f) for f in frames)
+    decoder = FrameDecoder()
+    # Cortes dentro de la cabecera (byte 10) y dentro del PCM de la segunda trama
+    cuts = [0, 10, FRAME_HEADER.size + 3, len(stream) - 2, len(stream)]
+    decoded = []
+    for a, b in zip(cuts, cuts[1:]):
+        decoded += decoder.feed(stream[a:b])
+        assert decoder.error is None
+    assert decoded == frames and not decoder.incomplete
+
+
+def test_every_byte_boundary():
+    frames = [_frame(i, samples=3) for i in range(3)]
+    stream = b"".join(_encode(f) for f in frames)
+    decoder = FrameDecoder()
+    decoded = [f for i in range(len(stream)) for f in decoder.feed(stream[i:i + 1])]
+    assert decoded == frames
+
+
+def test_incomplete_trailing_frame():
+    decoder = FrameDecoder()
+    stream = _encode(_frame(0)) + _encode(_frame(1))[:-1]
+    assert decoder.feed(stream) == [_frame(0)]
+    assert decoder.incomplete and decoder.error is None
+
+
+def test_invalid_magic_and_version_are_errors():
+    good = _encode(_frame(0))
+    for bad in (b"XY" + good[2:], good[:2] + bytes([2]) + good[3:]):
+        decoder = FrameDecoder()
+        # La trama válida previa se entrega; la inválida detiene el decodificador
+        assert decoder.feed(good + bad) == [_frame(0)]
+        assert decoder.error is not None and str(len(good)) in decoder.error
+        assert decoder.feed(good) == []
+
+
+def test_invalid_length_is_an_error():
+    for length in (7, 1024):  # impar, o más grande que el máximo
+        decoder = FrameDecoder(max_frame_bytes=512)
+        header = struct.pack("<2sBBIQfI", b"AF", 1, 0, 0, 0, 0.0, length)
+        assert decoder.feed(header) == []
+        assert decoder.error is not None and "longitud" in decoder.error
+
+
+def test_duplicate_is_dropped():
+    assembler = FrameAssembler()
+    assert assembler.add(_frame(0)) == [_frame(0)]
+    assert assembler.add(_frame(0)) == []
+    assert assembler.add(_frame(2)) == []
+    assert assembler.add(_frame(2)) == []
+    assert assembler.stats()["duplicates"] == 2 and assembler.accepted == 2
+
+
+def test_out_of_order_frames_are_reassembled():
+    assembler = FrameAssembler()
+    ready = []
+    for seq in (1, 3, 0, 2, 4):
+        ready += assembler.add(_frame(seq))
+    assert [f.seq for f in ready] == [0, 1, 2, 3, 4]
+    stats = assembler.stats()
+    assert stats["out_of_order"] == 2 and stats["gaps"] == 0 and stats["pending"] == 0
+
+
+def test_flush_with_limit_skips_gaps():
+    assembler = FrameAssembler()
+    for seq in (2, 3, 6, 9):
+        assert assembler.add(_frame(seq)) == []
+    # Al menos una trama: se salta el hueco 0-1 y salen 2 y 3 juntas
+    assert [f.seq for f in assembler.flush(limit=1)] == [2, 3]
+    assert assembler.gaps == 1 and assembler.next_seq == 4 and assembler.pending == 2
+    assert [f.seq for f in assembler.flush()] == [6, 9]
+    assert assembler.gaps == 3 and assembler.pending == 0
+
+
+def test_max_pending_flushes_oldest():
+    assembler = FrameAssembler(max_pending=2)
+    assert assembler.add(_frame(1)) == []
+    assert assembler.add(_frame(2)) == []
+    # La tercera supera el límite: el hueco en 0 ya no se espera
+    assert [f.seq for f in assembler.add(_frame(4))] == [1, 2]
+    assert assembler.gaps == 1 and assembler.pending == 1
+    # Una trama que llega tarde para el hueco ya saltado es un duplicado
+    assert assembler.add(_frame(0)) == []
+    assert assembler.duplicates == 1
@@ -0,0 +1,32 @@
+"""Un worker que muere rompe el pool: se apaga el pool roto y la siguiente petición crea otro."""
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+from server.inference import InferencePool, _ping
+
+
+def _crash() -> None:
+    os._exit(1)
+
+
+def test_broken_process_pool_is_shut_down_and_recreated(tmp_path):
+    pool = InferencePool(mode="process", workers=2, model_dir=str(tmp_path))
+    pool.start()
+    try:
+        broken = pool._executor
+
+        async def crash_twice():
+            # Dos peticiones ven el mismo pool roto: solo se descarta una vez y sin carreras
+            return await asyncio.gather(pool._submit(_crash), pool._submit(_crash), return_exceptions=True)
+
+        results = asyncio.run(crash_twice())
+        assert all(isinstance(r, BrokenProcessPool) for r in results)
+        assert pool._executor is None
+        assert broken._shutdown_thread
+        assert all(not p.is_alive() for p in list((broken._processes or {}).values()))
+
+        assert asyncio.run(pool._submit(_ping)) != os.getpid()
+        assert pool._executor is not None and pool._executor is not broken
+    finally:
+        pool.shutdown()
@@ -0,0 +1,57 @@
+"""Recursos perezosos: un fallo al crearlos se reintenta después de la espera."""
+import time
+
+import pytest
+
+from server import lazy
+from server.lazy import Lazy
+
+
+@pytest.fixture
+def resources():
+    created = []
+    yield created
+    for r in created:
+        lazy._resources.remove(r)
+
+
+def _flaky(failures: int):
+    calls = []
+
+    def factory():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise RuntimeError("sin conexión")
+        return "recurso"
+
+    return factory, calls
+
+
+def test_error_is_retried_after_cooldown(resources):
+    factory, calls = _flaky(1)
+    r = Lazy("flaky", factory, retry_seconds=0.05)
+    resources.append(r)
+
+    assert r.get() is None and r.state == "error" and r.error == "sin conexión"
+    # Durante la espera no se vuelve a llamar a la factory
+    assert r.get() is None and len(calls) == 1
+    assert lazy.readiness()["components"]["flaky"]["state"] == "error"
+
+    time.sleep(0.06)
+    assert r.get() == "recurso" and r.ready and r.error is None and r.failures == 0
+    assert len(calls) == 2
+
+
+def test_cooldown_doubles_on_consecutive_failures(resources):
+    factory, calls = _flaky(2)
+    r = Lazy("flaky", factory, retry_seconds=0.05)
+    resources.append(r)
+
+    assert r.get() is None
+    time.sleep(0.06)
+    assert r.get() is None and r.failures == 2
+    # Segunda espera: 0,1 s
+    time.sleep(0.06)
+    assert r.get() is None and len(calls) == 2
+    time.sleep(0.06)
+    assert r.get() == "recurso" and len(calls) == 3
@@ -0,0 +1,119 @@
+"""`predict_proba` único por modelo: etiqueta = `predict`, empates como argmax, rechazo y confianza."""
+import os
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+
+from model.compact_forest import CompactForest, export_forest
+from model.predict_runtime import AudioPredictor
+
+from conftest import pcm_clip
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model_artifacts")
+
+
+@pytest.fixture(scope="module")
+def features():
+    """Vectores de clips sintéticos y filas aleatorias (fuera de distribución, pero válidas)."""
+    predictor = AudioPredictor(MODEL_DIR)
+    clips = [predictor.features_from_array(pcm_clip(2.0, freq, seed=i), 32000)
+             for i, freq in enumerate((196.0, 262.0, 392.0, 523.0, 880.0))]
+    rng = np.random.default_rng(0)
+    X = np.vstack(clips)
+    return np.vstack([X, X.mean(axis=0) + X.std(axis=0) * rng.standard_normal((40, X.shape[1]))])
+
+
+@pytest.fixture(scope="module")
+def note_model(tmp_path_factory, features):
+    """Modelo de notas compacto pequeño (el repo no trae `note_rf`)."""
+    rng = np.random.default_rng(1)
+    X = features[:, None, :] + 0.1 * rng.standard_normal((features.shape[0], 4, features.shape[1]))
+    X = X.reshape(-1, features.shape[1])
+    names = np.array(["A4", "C4", "E5", "G3"])
+    y = names[rng.integers(0, 4, X.shape[0])]
+    encoder = LabelEncoder().fit(y)
+    rf = RandomForestClassifier(n_estimators=15, max_depth=6, random_state=0).fit(X, encoder.transform(y))
+    path = export_forest(rf, str(tmp_path_factory.mktemp("note") / "note_rf_compact"), encoder.classes_)
+    model = CompactForest(path)
+    return model, model.labels
+
+
+def _with_note_model(predictor, note_model):
+    predictor.note_model, predictor.note_encoder = note_model
+    return predictor
+
+
+def test_top1_matches_predict(features, note_model):
+    predictor = _with_note_model(AudioPredictor(MODEL_DIR, reject_threshold=0.0), note_model)
+    assert isinstance(predictor.inst_model, CompactForest)
+    results = predictor.predict_features_batch(features)
+
+    expected = predictor.inst_encoder.inverse_transform(predictor.inst_model.predict(features))
+    assert [r["instrument"] for r in results] == list(expected)
+    notes = predictor.note_encoder.inverse_transform(predictor.note_model.predict(features))
+    assert [r["note"] for r in results] == list(notes)
+    assert all(r["note_source"] == "model" for r in results)
+
+    # Igual que el `predict` del pickle de sklearn
+    with open(os.path.join(MODEL_DIR, "instrument_rf.pkl"), "rb") as f:
+        sklearn_model = pickle.load(f)
+    with open(os.path.join(MODEL_DIR, "instrument_encoder.pkl"), "rb") as f:
+        sklearn_encoder = pickle.load(f)
+    assert list(expected) == list(sklearn_encoder.inverse_transform(sklearn_model.predict(features)))
+
+    # De mayor a menor, sin repetir, y el primero es la etiqueta con su confianza
+    for r in results:
+        top = r["top_instruments"]
+        assert len(top) == min(predictor.top_k, len(predictor.inst_model.classes_))
+        assert [t["probability"] for t in top] == sorted((t["probability"] for t in top), reverse=True)
+        assert len({t["label"] for t in top}) == len(top)
+        assert top[0] == {"label": r["instrument"], "probability": r["instrument_confidence"]}
+
+
+def test_ties_resolve_like_argmax():
+    class Tied:
+        classes_ = np.array([0, 1, 2, 3])
+
+        def predict_proba(self, X):
+            return np.array([[0.1, 0.4, 0.4, 0.1], [0.25, 0.25, 0.25, 0.25], [0.0, 0.3, 0.3, 0.4]])
+
+    model = Tied()
+    predictor = AudioPredictor(MODEL_DIR, top_k=4)
+    encoder = LabelEncoder().fit(["bateria", "guitarra", "piano", "violin"])
+    top = predictor._top_k(model, encoder, np.zeros((3, 1)))
+    argmax = encoder.inverse_transform(model.classes_[np.argmax(model.predict_proba(None), axis=1)])
+    assert [row[0][0] for row in top] == list(argmax) == ["guitarra", "bateria", "violin"]
+    assert [label for label, _ in top[0]] == ["guitarra", "piano", "bateria", "violin"]
+
+
+def test_reject_threshold_gives_unknown(features, note_model):
+    accept = _with_note_model(AudioPredictor(MODEL_DIR, reject_threshold=0.0), note_model)
+    reject = _with_note_model(AudioPredictor(MODEL_DIR, reject_threshold=1.01), note_model)
+    for kept, rejected in zip(accept.predict_features_batch(features), reject.predict_features_batch(features)):
+        assert rejected["instrument"] == "Unknown" and rejected["note"] == "Unknown"
+        # La confianza y los candidatos se devuelven igual
+        for key in ("instrument_confidence", "note_confidence", "top_instruments", "top_notes", "confidence"):
+            assert rejected[key] == kept[key]
+
+    # Umbral en el medio: solo se rechazan las filas por debajo
+    confidences = np.unique([r["instrument_confidence"] for r in accept.predict_features_batch(features)])
+    k = len(confidences) // 2
+    threshold = float(confidences[k - 1] + confidences[k]) / 2
+    partial = AudioPredictor(MODEL_DIR, reject_threshold=threshold)
+    for r in partial.predict_features_batch(features):
+        assert (r["instrument"] == "Unknown") == (r["instrument_confidence"] < threshold)
+
+
+def test_confidence_is_min_of_models(features, note_model):
+    results = _with_note_model(AudioPredictor(MODEL_DIR), note_model).predict_features_batch(features)
+    for r in results:
+        assert r["confidence"] == min(r["instrument_confidence"], r["note_confidence"])
+    assert any(r["instrument_confidence"] != r["note_confidence"] for r in results)
+
+    # Sin modelo de notas la nota sale de f0 y no tiene probabilidad
+    for r in AudioPredictor(MODEL_DIR).predict_features_batch(features):
+        assert r["note_source"] == "f0" and "note_confidence" not in r
+        assert r["confidence"] == r["instrument_confidence"]
@@ -0,0 +1,55 @@
+"""Expulsión de sesiones: nunca se libera una sesión mientras un chunk se está anexando."""
+import threading
+import time
+
+from server.sessions import SessionRegistry
+
+
+def test_max_sessions_eviction_waits_for_session_lock(tmp_path):
+    registry = SessionRegistry(base_dir=str(tmp_path), max_sessions=2, idle_timeout=3600)
+    oldest = registry.get_or_create("a")
+    time.sleep(0.01)
+    registry.get_or_create("b")
+
+    appending = threading.Event()
+    appended_at = []
+
+    def upload_chunk():
+        with oldest.lock:
+            appending.set()
+            time.sleep(0.2)
+            oldest.append(b"\x01\x00" * 16, 1, 40.0)
+            appended_at.append(time.monotonic())
+
+    thread = threading.Thread(target=upload_chunk)
+    thread.start()
+    appending.wait()
+    registry.get_or_create("c")
+    evicted_at = time.monotonic()
+    thread.join()
+
+    assert evicted_at >= appended_at[0]
+    assert len(oldest.audio) == 0
+    assert registry.get("a") is None and registry.get("c") is not None
+
+
+def test_eviction_does_no_file_io_on_caller(tmp_path, monkeypatch):
+    from server import sessions as sessions_module
+    from server.sensor_log import submit_io
+
+    registry = SessionRegistry(base_dir=str(tmp_path), max_sessions=1, idle_timeout=0.01)
+    session = registry.get_or_create("a")
+    for path in (session.wav_file, session.clean_wav_file):
+        open(path, "wb").close()
+
+    removed_from = []
+    real_remove = sessions_module.os.remove
+    monkeypatch.setattr(sessions_module.os, "remove",
+                        lambda path: (removed_from.append(threading.current_thread().name), real_remove(path)))
+    time.sleep(0.02)
+    registry.get_or_create("b")  # barrido por inactividad: expulsa "a" desde el hilo que llama
+    submit_io(lambda: None).result()  # esperar al hilo escritor
+
+    assert removed_from and threading.current_thread().name not in removed_from
+    assert all(name.startswith("sensor-log") for name in removed_from)
+    assert not any((tmp_path / name).exists() for name in ("grabacion_a.wav", "grabacion_a_limpia.wav"))
@@ -0,0 +1,91 @@
+"""La extracción incremental por chunks coincide con el análisis de la grabación completa."""
+import time
+
+import numpy as np
+import pytest
+
+from model.predict_runtime import AudioPredictor
+from server import inference, streaming
+from server.streaming import StreamingFeatureExtractor
+
+from conftest import pcm_clip
+
+SR = 32000
+
+
+@pytest.fixture
+def predictor(tmp_path, monkeypatch):
+    # Sin modelos: solo se usa la extracción (`features_from_array`), sin caché
+    p = AudioPredictor(model_dir=str(tmp_path))
+    monkeypatch.setattr(inference, "_predictor", p)
+    return p
+
+
+@pytest.mark.parametrize("backend", ["yin", "autocorr", "yin_gated"])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_random_chunks_match_full_clip(predictor, monkeypatch, backend, seed):
+    monkeypatch.setenv("PITCH_BACKEND", backend)
+    raw = pcm_clip(seed=seed).tobytes()
+    rng = np.random.default_rng(seed)
+
+    extractor = StreamingFeatureExtractor(input_sr=SR)
+    pos = 0
+    while pos < len(raw):
+        # Tamaños en bytes (también impares: media muestra queda pendiente hasta el próximo chunk)
+        n = int(rng.integers(1, 6000))
+        extractor.feed(raw[pos:pos + n])
+        extractor.process()
+        pos += n
+    features = extractor.finish()
+
+    clean_audio, expected, _, silent = inference.extract_pcm(raw, SR)
+    assert not silent and not extractor.silent
+    assert np.array_equal(extractor.filtered.values, clean_audio)
+    assert np.allclose(features, expected)
+
+
+def test_silent_clip_is_detected_in_both_paths(predictor):
+    raw = (np.random.default_rng(0).standard_normal(SR) * 2).astype(np.int16).tobytes()
+    extractor = StreamingFeatureExtractor(input_sr=SR)
+    extractor.feed(raw)
+    assert extractor.finish() is None and extractor.silent
+    assert inference.extract_pcm(raw, SR)[3]
+
+
+def test_setup_is_deferred_to_first_process():
+    # La sesión crea el extractor en el event loop: construirlo y `feed()` no preparan librosa/filtros
+    extractor = StreamingFeatureExtractor(input_sr=SR)
+    extractor.feed(pcm_clip(0.2).tobytes())
+    assert not extractor._ready
+    extractor.process()
+    assert extractor._ready and extractor.filtered.size > 0
+
+
+def test_schedule_is_bounded_and_finish_catches_up(predictor, monkeypatch):
+    raw = pcm_clip(seed=2).tobytes()
+    half = len(raw) // 2
+    _, expected, _, _ = inference.extract_pcm(raw, SR)
+
+    # Pool de streaming saturado: `schedule()` no encola y los bytes quedan en el extractor
+    monkeypatch.setattr(streaming, "_jobs", streaming.STREAMING_MAX_PENDING)
+    extractor = StreamingFeatureExtractor(input_sr=SR)
+    extractor.feed(raw[:half])
+    assert extractor.schedule() is False
+    assert not extractor._ready and streaming.pending_jobs() == streaming.STREAMING_MAX_PENDING
+
+    # Con lugar se programa un trabajo; al terminar el contador vuelve a cero
+    monkeypatch.setattr(streaming, "_jobs", 0)
+    assert extractor.schedule() is True
+    extractor.finish_async().result(timeout=30)
+    deadline = time.monotonic() + 5
+    while streaming.pending_jobs() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert streaming.pending_jobs() == 0
+
+    extractor = StreamingFeatureExtractor(input_sr=SR)
+    monkeypatch.setattr(streaming, "_jobs", streaming.STREAMING_MAX_PENDING)
+    for start in range(0, len(raw), 4096):
+        extractor.feed(raw[start:start + 4096])
+        assert extractor.schedule() is False
+    monkeypatch.setattr(streaming, "_jobs", 0)
+    assert np.allclose(extractor.finish(), expected)
@@ -0,0 +1,80 @@
+"""Detección de actividad: qué clips son silencio y a qué tramo se recorta un clip con sonido."""
+import numpy as np
+import pytest
+
+from model.feature_extraction import active_region, trim_to_activity
+from server import inference
+
+SR = 16000
+FRAME = 2048  # encuadre de las características a 16 kHz
+
+
+def _sine(seconds: float, rms_dbfs: float, freq: float = 440.0, sr: int = SR) -> np.ndarray:
+    """Seno de RMS `rms_dbfs` (amplitud = RMS * √2)."""
+    t = np.arange(int(seconds * sr)) / sr
+    return (np.sqrt(2) * 10 ** (rms_dbfs / 20) * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def test_silence_is_rejected():
+    assert active_region(np.zeros(3 * SR, dtype=np.float32)) is None
+    assert active_region(np.zeros(3 * SR, dtype=np.int16)) is None
+    # Ruido de fondo por debajo de VAD_MIN_DBFS (-60)
+    noise = 10 ** (-75 / 20) * np.random.default_rng(0).standard_normal(3 * SR)
+    assert active_region(noise.astype(np.float32)) is None
+    assert active_region(np.zeros(0, dtype=np.float32)) is None
+
+
+def test_tone_padded_with_silence_is_trimmed_to_the_tone():
+    y = np.zeros(3 * SR, dtype=np.float32)
+    start, end = SR, 2 * SR
+    y[start:end] = _sine(1.0, -20)
+    region = active_region(y)
+    assert region is not None
+    lo, hi = region
+    # Cubre el tono y solo lo ampliado por el encuadre: el primer frame activo puede estar
+    # centrado hasta FRAME/2 antes del tono y el tramo arranca FRAME/2 + VAD_PAD_MS (100 ms) antes
+    margin = FRAME + int(0.1 * SR)
+    assert start - margin <= lo <= start and end <= hi <= end + margin
+    trimmed = trim_to_activity(y)
+    assert np.array_equal(trimmed, y[lo:hi])
+    assert trimmed.size < y.size / 2
+
+
+def test_int16_and_float_agree():
+    y = np.zeros(3 * SR, dtype=np.float32)
+    y[SR:2 * SR] = _sine(1.0, -30)
+    pcm = np.round(y * 32768).astype(np.int16)
+    assert active_region(pcm) == active_region(y)
+
+
+@pytest.mark.parametrize("min_dbfs", [-60.0, -40.0])
+def test_threshold_around_vad_min_dbfs(monkeypatch, min_dbfs):
+    monkeypatch.setenv("VAD_MIN_DBFS", str(min_dbfs))
+    assert active_region(_sine(1.0, min_dbfs - 1)) is None
+    y = _sine(1.0, min_dbfs + 1)
+    assert active_region(y) == (0, y.size)
+
+
+def test_clip_shorter_than_one_frame(monkeypatch):
+    y = _sine(0.01, -10)  # 160 muestras: menos que un frame y que VAD_MIN_ACTIVE_MS
+    assert y.size < FRAME
+    assert active_region(y) is None
+    assert trim_to_activity(y) is y
+    # Sin duración mínima, el único frame activo cubre todo el clip
+    monkeypatch.setenv("VAD_MIN_ACTIVE_MS", "0")
+    assert active_region(y) == (0, y.size)
+
+
+def test_silent_clip_skips_extraction(monkeypatch):
+    def fail():
+        raise AssertionError("un clip en silencio no debe cargar el predictor")
+
+    monkeypatch.setattr(inference, "_load_predictor", fail)
+    raw = np.zeros(2 * 32000, dtype=np.int16).tobytes()
+    clean, features, timings, silent = inference.extract_pcm(raw, 32000)
+    assert silent and features is None and "vad" in timings
+    assert clean is not None and not clean.any()
+
+    monkeypatch.setenv("VAD_ENABLED", "0")
+    monkeypatch.setattr(inference, "_load_predictor", lambda: None)
+    assert inference.extract_pcm(raw, 32000)[3] is False